@@ -0,0 +1,47 @@
+import streamlit as st
+from utils.querystats import QUERY_STATS, QUERY_STATS_ENABLED, SLOW_QUERY_MS, SLOW_QUERY_LOG
+
+# クエリ統計に表示する件数
+TOP_QUERIES = 20
+
+def admin_panel():
+    """管理者用のパネル（サイドバーに表示）"""
+    with st.expander("クエリ統計（管理者）"):
+        show_query_stats()
+
+def show_query_stats():
+    """合計実行時間の長いクエリの一覧"""
+    if not QUERY_STATS_ENABLED:
+        st.info("クエリの計測は無効です（QUERY_STATS=0）")
+        return
+
+    st.caption(f"スロークエリ: {SLOW_QUERY_MS:g}ms 以上を {SLOW_QUERY_LOG} に記録")
+
+    rows = QUERY_STATS.top(TOP_QUERIES)
+    if not rows:
+        st.info("まだクエリは記録されていません")
+    else:
+        st.dataframe(
+            [
+                {
+                    "合計(ms)": round(row["total_ms"], 1),
+                    "回数": row["count"],
+                    "平均(ms)": round(row["avg_ms"], 3),
+                    "最大(ms)": round(row["max_ms"], 1),
+                    "行数": row["rows"],
+                    "呼び出し元": format_callers(row["callers"]),
+                    "SQL": row["shape"],
+                }
+                for row in rows
+            ],
+            hide_index=True,
+        )
+
+    if st.button("集計をリセット", key="reset_query_stats"):
+        QUERY_STATS.reset()
+        st.rerun()
+
+def format_callers(callers):
+    """呼び出し元を回数の多い順に表示用の文字列にする"""
+    ordered = sorted(callers.items(), key=lambda item: item[1], reverse=True)
+    return ", ".join(f"{caller or '(不明)'}×{count}" for caller, count in ordered)
@@ -0,0 +1,443 @@
+import argparse
+import base64
+import json
+import logging
+import re
+import sys
+from dataclasses import asdict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from utils.db import read_transaction, startup
+from tasks.task_manager import (
+    TASK_STATUSES, TASK_PRIORITIES, DUE_FILTERS, DEFAULT_PAGE_SIZE, SEARCH_LIMIT, BATCH_UPDATE_FIELDS,
+    TASK_NOT_FOUND_MESSAGE,
+    add_task, get_task, update_task, delete_task, update_tasks, delete_tasks,
+    get_tasks_page, search_tasks, get_task_categories, get_category_suggestions, get_task_stats,
+    get_task_versions, load_task_page,
+)
+from tasks.transfer import import_records, parse_due_date
+from auth.auth import authenticate_user, register_user
+from auth.tokens import create_api_token, verify_api_token, revoke_api_token
+from tasks.archive import start_archiver
+
+# Streamlit アプリと同じDBを使う JSON API（legacy/src/app から実行する）
+#   python -m api.server [--host 127.0.0.1] [--port 8502]
+#
+# 認証: POST /api/login でトークンを発行し、以降は Authorization: Bearer <トークン> を付ける。
+#   POST   /api/register              {"username", "password"}
+#   POST   /api/login                 {"username", "password", "name"?} -> {"token", "user"}
+#   POST   /api/logout                使用中のトークンを無効にする
+#   GET    /api/tasks                 ?status&priority&category&due&archived&cursor&limit -> {"tasks", "next_cursor"}
+#   GET    /api/tasks/search          ?q&status&priority&category&due&archived&limit -> {"tasks"}
+#   GET    /api/tasks/<id>            アーカイブ済みのタスクも返す
+#   POST   /api/tasks                 {"title", ...}
+#   PATCH  /api/tasks/<id>            {"title"?, "status"?, ...}
+#   DELETE /api/tasks/<id>
+#   POST   /api/tasks/batch           {"tasks": [{...}, ...]}（一括登録）
+#   POST   /api/tasks/batch-update    {"ids": [...], "fields": {...}}
+#   POST   /api/tasks/batch-delete    {"ids": [...]}
+#   GET    /api/categories            ?archived
+#   GET    /api/categories/suggestions 入力補完用のカテゴリ（よく使われている順）
+#   GET    /api/stats                 ?archived
+#   GET    /api/page                  一覧・カテゴリ・統計を同じ時点でまとめて取得
+#   GET    /api/versions              -> {"tasks", "stats", "categories"}（変更の確認用の世代番号）
+#
+# archived=1 を付けると完了済みでアーカイブへ移されたタスクも含める。
+# /api/versions は主キーの1回の検索で返るため、変更の確認に使い、値が変わった部分
+# （tasks: 一覧、stats: 統計、categories: カテゴリ一覧）だけを取得し直すとよい。
+#
+# HTTP/1.1 の keep-alive に対応し、接続ごとにスレッドで処理する。
+
+MAX_PAGE_SIZE = 100     # 一覧の1ページの最大件数
+MAX_BATCH_SIZE = 1000   # 一括操作の最大件数
+MAX_BODY_SIZE = 1024 * 1024  # リクエストボディの最大バイト数
+MAX_TASK_ID = 2 ** 63 - 1    # タスクIDの最大値（SQLite の整数の範囲）
+KEEPALIVE_TIMEOUT = 30  # 無通信の keep-alive 接続を閉じるまでの秒数
+
+class ApiError(Exception):
+    """HTTPのエラー応答に変換する例外"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def encode_cursor(cursor):
+    """次ページカーソルをURLに使える文字列にする"""
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode("utf-8")).decode("ascii")
+
+def decode_cursor(text):
+    """encode_cursor() の逆変換（get_tasks_page() のカーソルの形になっているかも確かめる）"""
+    if not text:
+        return None
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(text.encode("ascii")))
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "カーソルが不正です")
+    if not _valid_cursor(cursor):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "カーソルが不正です")
+    return tuple(cursor)
+
+def _valid_cursor(cursor):
+    """[期限なしなら1, 期限日, 作成日時, タスクID] の形か"""
+    if not isinstance(cursor, list) or len(cursor) != 4:
+        return False
+    nulls_last, due_date, created_at, task_id = cursor
+    # bool は int の派生クラスのため type() で比べる
+    if type(nulls_last) is not int or nulls_last not in (0, 1):
+        return False
+    if not (due_date is None if nulls_last else isinstance(due_date, str)):
+        return False
+    return isinstance(created_at, str) and _valid_task_id(task_id)
+
+def _task_dict(task):
+    """タスク（TaskSummary または sqlite3.Row）を辞書にする"""
+    return task.as_dict() if hasattr(task, "as_dict") else dict(task)
+
+def _result(success, message, status=HTTPStatus.BAD_REQUEST):
+    """(成功, メッセージ) を応答に変換（対象のタスクがなかった場合は 404）"""
+    if not success:
+        if message == TASK_NOT_FOUND_MESSAGE:
+            status = HTTPStatus.NOT_FOUND
+        raise ApiError(status, message)
+    return {"ok": True, "message": message}
+
+def _limit(query, default, maximum):
+    try:
+        limit = int(query.get("limit", default))
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "limit は整数で指定してください")
+    return max(1, min(limit, maximum))
+
+def _filters(query):
+    """一覧の絞り込み条件を検証して取得"""
+    status = query.get("status") or None
+    priority = query.get("priority") or None
+    if status is not None and status not in TASK_STATUSES:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"ステータスが不正です: {status}")
+    if priority is not None and priority not in TASK_PRIORITIES:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"優先度が不正です: {priority}")
+    due = query.get("due") or None
+    if due is not None and due not in DUE_FILTERS:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"期限の絞り込みが不正です: {due}")
+    return status, priority, query.get("category") or None, due
+
+def _valid_task_id(value):
+    """タスクIDとして使える整数か（bool は int の派生クラスのため type() で比べる）"""
+    return type(value) is int and 1 <= value <= MAX_TASK_ID
+
+def _task_id(args):
+    """URLのタスクIDを取得（範囲外のIDはそのタスクがないものとして 404）"""
+    task_id = int(args[0])
+    if not _valid_task_id(task_id):
+        raise ApiError(HTTPStatus.NOT_FOUND, TASK_NOT_FOUND_MESSAGE)
+    return task_id
+
+def _include_archived(query):
+    """アーカイブ済みのタスクも含めるか（?archived=1）"""
+    return query.get("archived") in ("1", "true")
+
+def _task_fields(body, allowed=BATCH_UPDATE_FIELDS):
+    """タスクの列の値を検証して取得"""
+    if not isinstance(body, dict):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "JSONオブジェクトを指定してください")
+    unknown = set(body) - set(allowed)
+    if unknown:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"不明なフィールドです: {', '.join(sorted(unknown))}")
+    for field, value in body.items():
+        if value is not None and not isinstance(value, str):
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"{field} は文字列で指定してください")
+    body = dict(body)
+    if body.get("due_date") is not None:
+        # 期限日から期限の絞り込み・件数に使う due_day が決まるため、日付でない値は登録しない
+        # （インポートと同じく空文字は期限なしとして扱う）
+        due_date = body["due_date"].strip()
+        try:
+            body["due_date"] = parse_due_date(due_date) if due_date else None
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"期限日の形式が正しくありません: {due_date}")
+    if body.get("status") is not None and body["status"] not in TASK_STATUSES:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"ステータスが不正です: {body['status']}")
+    if body.get("priority") is not None and body["priority"] not in TASK_PRIORITIES:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"優先度が不正です: {body['priority']}")
+    return body
+
+def _ids(body):
+    ids = body.get("ids") if isinstance(body, dict) else None
+    if not isinstance(ids, list) or not all(_valid_task_id(i) for i in ids):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "ids はタスクIDの配列で指定してください")
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"一度に指定できるのは{MAX_BATCH_SIZE}件までです")
+    return ids
+
+def _credentials(body):
+    if not isinstance(body, dict) or not body.get("username") or not body.get("password"):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "ユーザー名とパスワードを指定してください")
+    return str(body["username"]), str(body["password"])
+
+# ----- エンドポイント -----
+# 各関数は (リクエスト, ユーザーID, URLの引数, クエリ文字列, ボディ) を受け取り、JSONにする値を返す
+
+def api_register(request, user_id, args, query, body):
+    username, password = _credentials(body)
+    success, message = register_user(username, password)
+    return _result(success, message)
+
+def api_login(request, user_id, args, query, body):
+    username, password = _credentials(body)
+    user, message = authenticate_user(username, password, request.client_address[0])
+    if user is None:
+        raise ApiError(HTTPStatus.UNAUTHORIZED, message)
+    token = create_api_token(user["id"], body.get("name"))
+    return {"token": token, "user": user}
+
+def api_logout(request, user_id, args, query, body):
+    revoke_api_token(request.token)
+    return {"ok": True, "message": "ログアウトしました"}
+
+def api_list_tasks(request, user_id, args, query, body):
+    status, priority, category, due = _filters(query)
+    tasks, next_cursor = get_tasks_page(
+        user_id, status, priority, category, due,
+        cursor=decode_cursor(query.get("cursor")),
+        limit=_limit(query, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE),
+        include_archived=_include_archived(query),
+    )
+    return {"tasks": [_task_dict(t) for t in tasks], "next_cursor": encode_cursor(next_cursor)}
+
+def api_search_tasks(request, user_id, args, query, body):
+    status, priority, category, due = _filters(query)
+    tasks = search_tasks(
+        user_id, query.get("q", ""), status, priority, category, due,
+        limit=_limit(query, SEARCH_LIMIT, SEARCH_LIMIT),
+        include_archived=_include_archived(query),
+    )
+    return {"tasks": [_task_dict(t) for t in tasks]}
+
+def api_get_task(request, user_id, args, query, body):
+    task = get_task(_task_id(args), user_id, include_archived=True)
+    if task is None:
+        raise ApiError(HTTPStatus.NOT_FOUND, TASK_NOT_FOUND_MESSAGE)
+    return _task_dict(task)
+
+def api_add_task(request, user_id, args, query, body):
+    fields = _task_fields(body)
+    if not fields.get("title"):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "タイトルは必須です")
+    return _result(*add_task(user_id, **fields))
+
+def api_update_task(request, user_id, args, query, body):
+    return _result(*update_task(_task_id(args), user_id, **_task_fields(body)))
+
+def api_delete_task(request, user_id, args, query, body):
+    return _result(*delete_task(_task_id(args), user_id))
+
+def api_add_tasks(request, user_id, args, query, body):
+    tasks = body.get("tasks") if isinstance(body, dict) else None
+    if not isinstance(tasks, list):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "tasks はタスクの配列で指定してください")
+    if len(tasks) > MAX_BATCH_SIZE:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"一度に登録できるのは{MAX_BATCH_SIZE}件までです")
+    # 番号は0始まりの配列の位置
+    result = import_records(user_id, enumerate(tasks))
+    return {
+        "imported": result.imported,
+        "errors": [{"index": index, "message": message} for index, message in result.errors],
+    }
+
+def api_update_tasks(request, user_id, args, query, body):
+    ids = _ids(body)
+    fields = _task_fields(body.get("fields") or {})
+    return _result(*update_tasks(user_id, ids, **fields))
+
+def api_delete_tasks(request, user_id, args, query, body):
+    return _result(*delete_tasks(user_id, _ids(body)))
+
+def api_categories(request, user_id, args, query, body):
+    categories = get_task_categories(user_id, include_archived=_include_archived(query))
+    return {"categories": list(categories)}
+
+def api_category_suggestions(request, user_id, args, query, body):
+    return {"categories": list(get_category_suggestions(user_id))}
+
+def api_stats(request, user_id, args, query, body):
+    return get_task_stats(user_id, include_archived=_include_archived(query))
+
+def api_page(request, user_id, args, query, body):
+    status, priority, category, due = _filters(query)
+    include_archived = _include_archived(query)
+    # 一覧と統計を同じスナップショットから読む
+    with read_transaction(user_id):
+        data = load_task_page(
+            user_id, status, priority, category, due, query=query.get("q") or None,
+            cursor=decode_cursor(query.get("cursor")),
+            limit=_limit(query, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE),
+            include_archived=include_archived,
+        )
+        stats = get_task_stats(user_id, include_archived=include_archived)
+    return {
+        "categories": list(data.categories),
+        "tasks": [_task_dict(t) for t in data.tasks],
+        "next_cursor": encode_cursor(data.next_cursor),
+        "stats": stats,
+        "versions": asdict(data.versions),
+    }
+
+def api_versions(request, user_id, args, query, body):
+    return asdict(get_task_versions(user_id))
+
+# (メソッド, パスの正規表現, 関数, 認証が必要か)
+ROUTES = [
+    ("POST", r"/api/register", api_register, False),
+    ("POST", r"/api/login", api_login, False),
+    ("POST", r"/api/logout", api_logout, True),
+    ("GET", r"/api/tasks", api_list_tasks, True),
+    ("GET", r"/api/tasks/search", api_search_tasks, True),
+    ("POST", r"/api/tasks", api_add_task, True),
+    ("POST", r"/api/tasks/batch", api_add_tasks, True),
+    ("POST", r"/api/tasks/batch-update", api_update_tasks, True),
+    ("POST", r"/api/tasks/batch-delete", api_delete_tasks, True),
+    ("GET", r"/api/tasks/(\d+)", api_get_task, True),
+    ("PATCH", r"/api/tasks/(\d+)", api_update_task, True),
+    ("DELETE", r"/api/tasks/(\d+)", api_delete_task, True),
+    ("GET", r"/api/categories", api_categories, True),
+    ("GET", r"/api/categories/suggestions", api_category_suggestions, True),
+    ("GET", r"/api/stats", api_stats, True),
+    ("GET", r"/api/page", api_page, True),
+    ("GET", r"/api/versions", api_versions, True),
+]
+_COMPILED_ROUTES = [(method, re.compile(pattern + r"/?"), func, auth) for method, pattern, func, auth in ROUTES]
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """JSON API のリクエストハンドラー"""
+    protocol_version = "HTTP/1.1"  # keep-alive を有効にする
+    timeout = KEEPALIVE_TIMEOUT
+    # ヘッダーと本文を1回の送信にまとめ、Nagle アルゴリズムによる遅延を避ける
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    server_version = "TaskManagerAPI/1.0"
+    token = None
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        try:
+            # ボディは先に読み切る（エラー応答後も同じ接続を使い続けるため）
+            body = self.read_body(method)
+            url = urlsplit(self.path)
+            func, args, needs_auth = self.route(method, url.path)
+            user_id = self.authenticate() if needs_auth else None
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            self.send_json(HTTPStatus.OK, func(self, user_id, args, query, body))
+        except ApiError as e:
+            self.send_json(e.status, {"error": e.message})
+        except Exception:
+            logging.getLogger(__name__).exception("APIの処理中にエラーが発生しました")
+            # 例外の内容はログにだけ出し、応答には含めない
+            self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "サーバーエラーが発生しました"})
+
+    def read_body(self, method):
+        header = self.headers.get("Content-Length")
+        if header is None:
+            # チャンク形式などの長さの分からないボディは読めない
+            if method in ("POST", "PATCH") or "Transfer-Encoding" in self.headers:
+                self.close_connection = True
+                raise ApiError(HTTPStatus.LENGTH_REQUIRED, "Content-Length を指定してください")
+            return {}
+        header = header.strip()
+        if not (header.isascii() and header.isdigit()):
+            # ボディの終わりが分からないため、この接続は使い続けない
+            self.close_connection = True
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Content-Length が不正です")
+        length = int(header)
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "リクエストが大きすぎます")
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "JSONの形式が正しくありません")
+
+    def route(self, method, path):
+        path_found = False
+        for route_method, pattern, func, needs_auth in _COMPILED_ROUTES:
+            match = pattern.fullmatch(path)
+            if match:
+                if route_method == method:
+                    return func, match.groups(), needs_auth
+                path_found = True
+        if path_found:
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "このメソッドは使用できません")
+        raise ApiError(HTTPStatus.NOT_FOUND, "エンドポイントが見つかりません")
+
+    def authenticate(self):
+        header = self.headers.get("Authorization", "")
+        scheme, _, token = header.partition(" ")
+        user_id = verify_api_token(token.strip()) if scheme.lower() == "bearer" else None
+        if user_id is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "認証が必要です")
+        self.token = token.strip()
+        return user_id
+
+    def send_json(self, status, value):
+        payload = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # アクセスログは標準エラーではなく logging に出す
+        logging.getLogger(__name__).debug("%s - " + format, self.client_address[0], *args)
+
+def make_server(host="127.0.0.1", port=8502):
+    """APIサーバーを作成する（serve_forever() で待ち受けを始める）
+
+    port に 0 を指定すると空いているポートを使う（server.server_address で確認できる）。
+    """
+    startup()
+    server = ThreadingHTTPServer((host, port), ApiRequestHandler)
+    server.daemon_threads = True
+    return server
+
+def main(argv=None):
+    """APIサーバーのエントリーポイント"""
+    parser = argparse.ArgumentParser(description="タスク管理アプリの JSON API サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    args = parser.parse_args(argv)
+
+    # Streamlit の外で動かすときの警告を抑止
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    server = make_server(args.host, args.port)
+    start_archiver()
+    host, port = server.server_address[:2]
+    print(f"http://{host}:{port}/api で待ち受けています", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
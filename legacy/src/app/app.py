@@ -1,33 +1,43 @@
 import streamlit as st
-from utils.db import init_db, init_session_state
+from utils.db import startup, init_session_state
 from utils.theme import switch_theme
 from auth.pages import auth_page
 from tasks.pages import tasks_page
+from tasks.archive import start_archiver
+from auth.auth import is_admin
+from admin.pages import admin_panel
+from utils.profiling import profile_rerun, profile_section, show_profile_summary
 
-# セッション状態の初期化（テーマモード）
-if "theme_mode" not in st.session_state:
-    st.session_state.theme_mode = "light"
-
-# アプリのタイトルとアイコン
-st.set_page_config(
-    page_title="タスク管理アプリ",
-    page_icon="✅",
-    layout="wide"
-)
-
-# テーマの初期設定
-switch_theme(st.session_state.theme_mode)
-
-# セッション状態の初期化
-init_session_state()
-
-# データベースの初期化
-init_db()
+def setup():
+    """ページ設定とプロセス・セッションの初期化（リランごとに最初に呼ぶ）"""
+    # セッション状態の初期化（テーマモード）
+    if "theme_mode" not in st.session_state:
+        st.session_state.theme_mode = "light"
+    
+    # アプリのタイトルとアイコン
+    st.set_page_config(
+        page_title="タスク管理アプリ",
+        page_icon="✅",
+        layout="wide"
+    )
+    
+    # セッション状態の初期化
+    init_session_state()
+    
+    # データベースの初期化（プロセスごとに一度だけ実行される）
+    startup()
+    
+    # 完了済みタスクのアーカイブをバックグラウンドで開始（プロセスごとに1つ）
+    start_archiver()
 
 # メインアプリケーション
 def main():
     """アプリケーションのメインエントリーポイント"""
     
+    # テーマの初期設定
+    with profile_section("テーマ"):
+        switch_theme(st.session_state.theme_mode)
+    
     # サイドバーに基本情報を表示
     with st.sidebar:
         st.title("タスク管理アプリ")
@@ -57,7 +67,19 @@ def main():
         tasks_page()
     else:
         # 未認証ユーザーには認証ページを表示
-        auth_page()
+        with profile_section("認証ページ"):
+            auth_page()
+    
+    # 管理者にはサイドバーの最後にクエリ統計を表示（このリランのクエリも含める）
+    if is_admin():
+        with st.sidebar, profile_section("管理者パネル"):
+            admin_panel()
 
+# パスワードハッシュのワーカープロセスはこのスクリプトを __mp_main__ として読み込むため、
+# 初期化と描画は Streamlit から __main__ として実行されたときだけ行う
 if __name__ == "__main__":
-    main()
+    setup()
+    # ?profile=1 または PROFILE_RERUNS=1 のときはリランを計測する
+    with profile_rerun() as profile:
+        main()
+        show_profile_summary(profile)
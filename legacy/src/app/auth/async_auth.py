@@ -0,0 +1,10 @@
+from utils.async_db import async_version
+from auth import auth
+
+# auth の async 版（使い方は tasks.async_tasks と同じ）
+#
+# Streamlit のセッション状態は使えないため、ログインには authenticate_user を使う。
+#   user, message = await authenticate_user(username, password)
+
+authenticate_user = async_version(auth.authenticate_user)
+register_user = async_version(auth.register_user)
@@ -1,73 +1,135 @@
-from passlib.hash import pbkdf2_sha256
+import os
 import streamlit as st
-from utils.db import get_connection
+from utils.db import db_connection, get_storage
+from auth.hashing import get_hashing_service, HASHING_ERRORS
+from auth.throttle import get_login_throttle
+
+# ハッシュ処理が混雑しているときのメッセージ
+BUSY_MESSAGE = "ただいま混雑しています。しばらくしてから再度お試しください"
+
+# ログイン試行が多すぎるときのメッセージ
+THROTTLED_MESSAGE = "ログインの試行回数が多すぎます。しばらくしてから再度お試しください"
+
+# 管理者のユーザー名（カンマ区切り）
+ADMIN_USERS = frozenset(
+    name.strip() for name in os.environ.get("ADMIN_USERS", "").split(",") if name.strip()
+)
 
 def hash_password(password):
-    """パスワードをハッシュ化"""
-    return pbkdf2_sha256.hash(password)
+    """パスワードをハッシュ化（ハッシュサービスのワーカーで計算）"""
+    return get_hashing_service().hash(password)
 
 def verify_password(password, hash):
-    """パスワードの検証"""
-    return pbkdf2_sha256.verify(password, hash)
+    """パスワードの検証（ハッシュサービスのワーカーで計算）"""
+    return get_hashing_service().verify(password, hash)
 
-def register_user(username, password, test_mode=False):
+def register_user(username, password):
     """新規ユーザー登録
     
     Args:
         username: ユーザー名
         password: パスワード
-        test_mode: テストモード（Trueの場合、DB接続を閉じない）
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
     try:
         # ユーザー名の重複チェック
-        cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-        if cursor.fetchone():
-            if not test_mode:
-                conn.close()
-            return False, "このユーザー名は既に使用されています"
+        with db_connection() as conn:
+            cursor = conn.execute("SELECT id FROM users WHERE username = ?", (username,))
+            if cursor.fetchone():
+                return False, "このユーザー名は既に使用されています"
         
-        # パスワードのハッシュ化と登録
+        # パスワードのハッシュ化と登録（ハッシュ計算中は接続を借りたままにしない）
         hashed_password = hash_password(password)
-        cursor.execute(
-            "INSERT INTO users (username, password) VALUES (?, ?)",
-            (username, hashed_password)
-        )
-        conn.commit()
-        if not test_mode:
-            conn.close()
+        with db_connection() as conn:
+            user_id = conn.execute(
+                "INSERT INTO users (username, password) VALUES (?, ?)",
+                (username, hashed_password)
+            ).lastrowid
+            # タスクを置くデータベース（シャード）を決める
+            get_storage().assign_user(conn, user_id)
+            conn.commit()
         return True, "ユーザー登録が完了しました"
+    except HASHING_ERRORS:
+        return False, BUSY_MESSAGE
     except Exception as e:
-        if not test_mode:
-            conn.close()
         return False, f"登録エラー: {str(e)}"
 
-def login_user(username, password):
-    """ユーザーログイン"""
-    conn = get_connection()
-    cursor = conn.cursor()
+def authenticate_user(username, password, client_id=None):
+    """ユーザー名とパスワードを検証する（セッション状態は変更しない）
+    
+    ユーザー名・接続元ごとの試行回数の上限を超えた場合は、ハッシュ計算の前に拒否する。
+    ハッシュの設定（ラウンド数）が古い場合は、検証成功時に現在の設定でハッシュし直して保存する。
+    
+    Args:
+        username: ユーザー名
+        password: パスワード
+        client_id: 接続元の識別子（IPアドレスなど、不明なら None）
+    
+    Returns:
+        (ユーザー情報の辞書 {"id", "username"} または None, メッセージ)
+    """
+    throttle = get_login_throttle()
+    if not throttle.acquire(username, client_id):
+        return None, THROTTLED_MESSAGE
     
     # ユーザー名の確認
-    cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = cursor.fetchone()
+    with db_connection() as conn:
+        user = conn.execute(
+            "SELECT id, username, password FROM users WHERE username = ?", (username,)
+        ).fetchone()
     
     if not user:
-        conn.close()
-        return False, "ユーザー名が見つかりません"
+        return None, "ユーザー名が見つかりません"
     
     # パスワードの検証
-    if verify_password(password, user['password']):
-        # セッション状態を更新
-        st.session_state.user_id = user['id']
-        st.session_state.username = user['username']
-        st.session_state.authenticated = True
-        conn.close()
-        return True, "ログインに成功しました"
-    else:
-        conn.close()
-        return False, "パスワードが正しくありません"
+    try:
+        verified = verify_password(password, user['password'])
+    except HASHING_ERRORS:
+        # 混雑・タイムアウト・ワーカーの異常終了（プールは作り直し済み）
+        return None, BUSY_MESSAGE
+    
+    if not verified:
+        return None, "パスワードが正しくありません"
+    
+    throttle.reset_user(username)
+    if get_hashing_service().needs_update(user['password']):
+        rehash_password(user['id'], user['password'], password)
+    return {"id": user['id'], "username": user['username']}, "ログインに成功しました"
+
+def login_user(username, password, client_id=None):
+    """ユーザーログイン
+    
+    検証は authenticate_user() で行い、成功したらセッション状態を更新する。
+    
+    Args:
+        username: ユーザー名
+        password: パスワード
+        client_id: 接続元の識別子（IPアドレスなど、不明なら None）
+    """
+    user, message = authenticate_user(username, password, client_id)
+    if user is None:
+        return False, message
+    
+    # セッション状態を更新
+    st.session_state.user_id = user['id']
+    st.session_state.username = user['username']
+    st.session_state.authenticated = True
+    return True, message
+
+def rehash_password(user_id, old_hash, password):
+    """保存済みのハッシュを現在の設定でハッシュし直す
+    
+    失敗してもログインには影響させない。並行して別のログインが更新していた場合は上書きしない。
+    """
+    try:
+        new_hash = hash_password(password)
+        with db_connection() as conn:
+            conn.execute(
+                "UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                (new_hash, user_id, old_hash)
+            )
+            conn.commit()
+    except Exception:
+        pass
 
 def logout_user():
     """ユーザーログアウト"""
@@ -76,6 +138,24 @@ def logout_user():
     st.session_state.authenticated = False
     return True, "ログアウトしました"
 
+def get_client_id():
+    """現在のセッションの接続元（IPアドレス、ローカル接続などで不明なら None）"""
+    try:
+        return st.context.ip_address
+    except Exception:
+        return None
+
+def get_auth_metrics():
+    """ログイン試行の許可・拒否件数とパスワードハッシュ処理の統計"""
+    return {
+        "login": get_login_throttle().stats(),
+        "hashing": get_hashing_service().stats(),
+    }
+
 def is_authenticated():
     """認証状態の確認"""
     return st.session_state.authenticated
+
+def is_admin():
+    """ログイン中のユーザーが管理者か（環境変数 ADMIN_USERS で指定）"""
+    return is_authenticated() and st.session_state.username in ADMIN_USERS
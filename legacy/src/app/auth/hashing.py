@@ -0,0 +1,160 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from passlib.hash import pbkdf2_sha256
+import streamlit as st
+
+# パスワードハッシュの設定
+PASSWORD_HASH_ROUNDS = int(os.environ.get("PASSWORD_HASH_ROUNDS", str(pbkdf2_sha256.default_rounds)))
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", str(HASH_WORKERS * 8)))  # 受け付ける同時処理数
+HASH_TIMEOUT = float(os.environ.get("HASH_TIMEOUT", "30"))  # 秒
+
+# ワーカーの起動方式
+# Streamlit や API サーバーはスレッドを使うため fork は使わない（他のスレッドが持っていた
+# ロックごと複製され、ワーカーが止まることがある）。forkserver が使える環境では
+# このモジュールを読み込み済みのサーバープロセスからワーカーを作る。
+# どちらの方式でもワーカーは実行中のスクリプト（__main__）を __mp_main__ として読み込むため、
+# ハッシュ計算を使うスクリプトは処理を if __name__ == "__main__": の中で行うこと（app.py 参照）。
+WORKER_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+class HashingOverloaded(Exception):
+    """ハッシュ処理の受け付け上限を超えた"""
+
+# ハッシュ計算ができなかったときの例外（呼び出し元では混雑として扱う）
+#   HashingOverloaded : 受け付け上限を超えた
+#   TimeoutError      : HASH_TIMEOUT 秒以内に結果が返らなかった
+#   BrokenProcessPool : ワーカープロセスが異常終了した（プールは作り直される）
+HASHING_ERRORS = (HashingOverloaded, TimeoutError, BrokenProcessPool)
+
+def _hash_in_worker(password, rounds, submitted_at):
+    """ワーカープロセス内でパスワードをハッシュ化
+
+    Returns:
+        (ハッシュ, 待ち時間, CPU時間)
+    """
+    queue_time = time.time() - submitted_at
+    cpu_started = time.process_time()
+    result = pbkdf2_sha256.using(rounds=rounds).hash(password)
+    return result, queue_time, time.process_time() - cpu_started
+
+def _verify_in_worker(password, hash, submitted_at):
+    """ワーカープロセス内でパスワードを検証
+
+    Returns:
+        (検証結果, 待ち時間, CPU時間)
+    """
+    queue_time = time.time() - submitted_at
+    cpu_started = time.process_time()
+    result = pbkdf2_sha256.verify(password, hash)
+    return result, queue_time, time.process_time() - cpu_started
+
+class HashingService:
+    """pbkdf2 のハッシュ計算をプロセスプールで行うサービス
+
+    CPUを使うハッシュ計算をスクリプトスレッドから切り離し、同時に受け付ける件数を
+    max_pending までに制限する。上限を超えた要求は待たせずに HashingOverloaded で拒否する。
+    受け付けた要求の枠は、呼び出し元がタイムアウトで戻った後もワーカーでの処理が
+    終わるまで返さない。
+    """
+
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING,
+                 rounds=PASSWORD_HASH_ROUNDS, timeout=HASH_TIMEOUT):
+        self.rounds = rounds
+        self.timeout = timeout
+        self.workers = workers
+        self.hasher = pbkdf2_sha256.using(rounds=rounds)
+        self._executor = self._create_executor()
+        self._admission = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self.cpu_time_total = 0.0
+
+    def _create_executor(self):
+        context = multiprocessing.get_context(WORKER_START_METHOD)
+        if WORKER_START_METHOD == "forkserver":
+            context.set_forkserver_preload([__name__])
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    def _replace_broken_executor(self, executor):
+        """異常終了したプールを新しいプールに置き換える（他のスレッドが置き換え済みなら何もしない）"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = self._create_executor()
+        executor.shutdown(wait=False)
+
+    def _run(self, func, *args):
+        """ワーカーで func を実行して結果を待つ
+
+        Raises:
+            HASHING_ERRORS のいずれか
+        """
+        if not self._admission.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingOverloaded("パスワード処理が混雑しています")
+        executor = self._executor
+        try:
+            future = executor.submit(func, *args, time.time())
+        except BaseException as e:
+            self._admission.release()
+            if isinstance(e, BrokenProcessPool):
+                self._replace_broken_executor(executor)
+            raise
+        # 枠はワーカーでの処理が終わったとき（または取り消したとき）に返す
+        future.add_done_callback(lambda _: self._admission.release())
+        try:
+            result, queue_time, cpu_time = future.result(timeout=self.timeout)
+        except TimeoutError:
+            # まだワーカーに渡っていなければ取り消す（計算中のものは終わるまで枠を使う）
+            future.cancel()
+            raise
+        except BrokenProcessPool:
+            self._replace_broken_executor(executor)
+            raise
+
+        with self._lock:
+            self.completed += 1
+            self.queue_time_total += queue_time
+            self.queue_time_max = max(self.queue_time_max, queue_time)
+            self.cpu_time_total += cpu_time
+        return result
+
+    def hash(self, password):
+        """パスワードをハッシュ化"""
+        return self._run(_hash_in_worker, password, self.rounds)
+
+    def verify(self, password, hash):
+        """パスワードの検証"""
+        return self._run(_verify_in_worker, password, hash)
+
+    def needs_update(self, hash):
+        """保存されているハッシュが現在の設定より古いか（計算は行わない）"""
+        return self.hasher.needs_update(hash)
+
+    def stats(self):
+        """処理件数・拒否件数・待ち時間・ハッシュ計算のCPU時間の統計"""
+        with self._lock:
+            return {
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "queue_time_avg": self.queue_time_total / self.completed if self.completed else 0.0,
+                "queue_time_max": self.queue_time_max,
+                "cpu_time_total": self.cpu_time_total,
+            }
+
+    def shutdown(self):
+        """ワーカープロセスを停止"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+@st.cache_resource
+def get_hashing_service():
+    """プロセス内で共有するハッシュサービスを取得"""
+    return HashingService()
@@ -1,5 +1,5 @@
 import streamlit as st
-from auth.auth import register_user, login_user, logout_user, is_authenticated
+from auth.auth import register_user, login_user, logout_user, is_authenticated, get_client_id
 
 def auth_page():
     """認証ページ（ログイン/登録）"""
@@ -35,7 +35,7 @@ def login_form():
             if not username or not password:
                 st.error("ユーザー名とパスワードを入力してください")
             else:
-                success, message = login_user(username, password)
+                success, message = login_user(username, password, get_client_id())
                 if success:
                     st.success(message)
                     st.rerun()
@@ -63,7 +63,7 @@ def register_form():
                 if success:
                     st.success(message)
                     # 登録成功したら自動的にログイン
-                    login_user(username, password)
+                    login_user(username, password, get_client_id())
                     st.rerun()
                 else:
                     st.error(message)
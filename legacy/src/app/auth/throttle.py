@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+import streamlit as st
+from utils.db import run_write
+
+# ユーザー名ごとのバケット: 連続 LOGIN_USER_BURST 回まで、以降は LOGIN_USER_INTERVAL 秒に1回
+LOGIN_USER_BURST = int(os.environ.get("LOGIN_USER_BURST", "5"))
+LOGIN_USER_INTERVAL = float(os.environ.get("LOGIN_USER_INTERVAL", "60"))
+
+# 接続元ごとのバケット: 連続 LOGIN_CLIENT_BURST 回まで、以降は LOGIN_CLIENT_INTERVAL 秒に1回
+LOGIN_CLIENT_BURST = int(os.environ.get("LOGIN_CLIENT_BURST", "20"))
+LOGIN_CLIENT_INTERVAL = float(os.environ.get("LOGIN_CLIENT_INTERVAL", "6"))
+
+# 回復済みバケットを削除する間隔（秒）
+PRUNE_INTERVAL = 600
+
+class LoginThrottle:
+    """ログイン試行のトークンバケット
+
+    バケットの状態は login_throttle テーブルに保存するため、同じDBを使う
+    複数のサーバープロセスで制限が共有される。試行ごとに該当するすべてのバケットから
+    トークンを1つずつ取り、どれか1つでも足りなければ試行を拒否する（トークンは消費しない）。
+    書き込みは run_write() で他の書き込みとまとめて行い、ログインが集中しても
+    書き込みスレッドとロックを奪い合わないようにする。
+
+    Args:
+        clock: 現在時刻（UNIX時間の秒）を返す関数（テストで時刻を進めるためのもの）
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+        self._last_pruned = self.clock()
+
+    @staticmethod
+    def _buckets(username, client_id):
+        """試行に該当するバケットと (容量, 補充間隔) の一覧"""
+        buckets = [(f"user:{username}", LOGIN_USER_BURST, LOGIN_USER_INTERVAL)]
+        if client_id:
+            buckets.append((f"client:{client_id}", LOGIN_CLIENT_BURST, LOGIN_CLIENT_INTERVAL))
+        return buckets
+
+    def acquire(self, username, client_id=None):
+        """ログイン試行を1回分許可できるか判定してトークンを消費する
+
+        Args:
+            username: 試行されたユーザー名
+            client_id: 接続元の識別子（IPアドレスなど、不明なら None）
+
+        Returns:
+            許可する場合 True
+        """
+        now = self.clock()
+        buckets = self._buckets(username, client_id)
+
+        def take(conn):
+            # 書き込みスレッドを使わない場合も、読んでから書くまでの間に他のプロセスが
+            # 割り込まないよう書き込みロックを先に取る
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            refilled = []
+            for bucket, capacity, interval in buckets:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM login_throttle WHERE bucket = ?", (bucket,)
+                ).fetchone()
+                tokens = capacity
+                if row:
+                    tokens = min(capacity, row["tokens"] + (now - row["updated_at"]) / interval)
+                refilled.append((bucket, tokens))
+
+            if not all(tokens >= 1 for _, tokens in refilled):
+                return False
+            conn.executemany(
+                """
+                INSERT INTO login_throttle (bucket, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (bucket) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+                """,
+                [(bucket, tokens - 1, now) for bucket, tokens in refilled]
+            )
+            return True
+
+        allowed = run_write(take)
+
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.throttled += 1
+            prune_due = now - self._last_pruned > PRUNE_INTERVAL
+            if prune_due:
+                self._last_pruned = now
+
+        if prune_due:
+            self.prune()
+        return allowed
+
+    def reset_user(self, username):
+        """ユーザー名のバケットを満タンに戻す（ログイン成功時）"""
+        run_write(lambda conn: conn.execute(
+            "DELETE FROM login_throttle WHERE bucket = ?", (f"user:{username}",)
+        ))
+
+    def prune(self):
+        """満タンまで回復したバケットを削除"""
+        now = self.clock()
+        run_write(lambda conn: conn.execute(
+            """
+            DELETE FROM login_throttle
+            WHERE (bucket LIKE 'user:%' AND updated_at < ?)
+               OR (bucket LIKE 'client:%' AND updated_at < ?)
+            """,
+            (now - LOGIN_USER_BURST * LOGIN_USER_INTERVAL,
+             now - LOGIN_CLIENT_BURST * LOGIN_CLIENT_INTERVAL)
+        ))
+
+    def stats(self):
+        """許可・拒否した試行の件数"""
+        with self._lock:
+            return {"allowed": self.allowed, "throttled": self.throttled}
+
+@st.cache_resource
+def get_login_throttle():
+    """プロセス内で共有するログインスロットリングを取得"""
+    return LoginThrottle()
@@ -0,0 +1,67 @@
+import hashlib
+import secrets
+import time
+from utils.db import db_connection
+
+# APIトークンの長さ（バイト数、base64url で約43文字）
+API_TOKEN_BYTES = 32
+
+# 最終利用日時を更新する間隔（秒）。リクエストごとに書き込まないようにする
+TOKEN_TOUCH_INTERVAL = 60
+
+def _token_hash(token):
+    """保存用のトークンのハッシュ
+
+    トークンは十分にランダムなため、パスワードのような低速ハッシュは使わない
+    （リクエストごとに検証するため）。
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def create_api_token(user_id, name=None):
+    """APIトークンを発行する（平文のトークンはここでしか得られない）
+
+    Args:
+        user_id: ユーザーID
+        name: トークンの用途などのメモ（省略可）
+
+    Returns:
+        トークン文字列
+    """
+    token = secrets.token_urlsafe(API_TOKEN_BYTES)
+    with db_connection() as conn:
+        conn.execute(
+            "INSERT INTO api_tokens (user_id, token_hash, name) VALUES (?, ?, ?)",
+            (user_id, _token_hash(token), name)
+        )
+        conn.commit()
+    return token
+
+def verify_api_token(token):
+    """APIトークンを検証してユーザーIDを返す（無効なら None）"""
+    if not token:
+        return None
+    token_hash = _token_hash(token)
+    with db_connection() as conn:
+        row = conn.execute(
+            "SELECT user_id, CAST(strftime('%s', last_used_at) AS INTEGER) "
+            "FROM api_tokens WHERE token_hash = ?",
+            (token_hash,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] is None or time.time() - row[1] >= TOKEN_TOUCH_INTERVAL:
+            conn.execute(
+                "UPDATE api_tokens SET last_used_at = CURRENT_TIMESTAMP WHERE token_hash = ?",
+                (token_hash,)
+            )
+            conn.commit()
+    return row[0]
+
+def revoke_api_token(token):
+    """APIトークンを無効にする（存在すれば True）"""
+    with db_connection() as conn:
+        count = conn.execute(
+            "DELETE FROM api_tokens WHERE token_hash = ?", (_token_hash(token),)
+        ).rowcount
+        conn.commit()
+    return count > 0
@@ -0,0 +1,76 @@
+import argparse
+import json
+import sys
+
+# ベンチマーク結果の比較（回帰ゲート）
+#   python -m bench.compare BASELINE CURRENT [--threshold 0.25] [--metric p95_ms]
+# いずれかの関数が閾値を超えて遅くなっていれば終了コード1で終わる。
+
+DEFAULT_METRIC = "p95_ms"
+MIN_DELTA_MS = 0.05  # これより小さい差は計測誤差として回帰に数えない
+
+def compare_results(baseline, current, threshold, metric=DEFAULT_METRIC, min_delta_ms=MIN_DELTA_MS):
+    """2つの結果を比較して、規模・関数・モードごとの行のリストを返す
+
+    どちらか一方にしかない計測は比較しない。
+
+    Args:
+        baseline: ベースラインの結果（bench.run の出力）
+        current: 比較する結果
+        threshold: 回帰とみなす悪化率（0.25 なら25%）
+        metric: 比較する統計値
+        min_delta_ms: 回帰とみなす最小の差（ミリ秒）
+    """
+    rows = []
+    for scale, scale_result in current["scales"].items():
+        base_scale = baseline["scales"].get(scale)
+        if not base_scale:
+            continue
+        for name, modes in scale_result["benchmarks"].items():
+            for mode, stats in modes.items():
+                base_stats = base_scale["benchmarks"].get(name, {}).get(mode)
+                if not base_stats:
+                    continue
+                before, after = base_stats[metric], stats[metric]
+                ratio = after / before if before else 1.0
+                rows.append({
+                    "scale": scale,
+                    "name": name,
+                    "mode": mode,
+                    "baseline": before,
+                    "current": after,
+                    "ratio": ratio,
+                    "regressed": ratio > 1 + threshold and after - before > min_delta_ms,
+                })
+    return rows
+
+def print_comparison(rows, file=sys.stdout):
+    """比較結果を表形式で表示"""
+    for row in rows:
+        mark = "REGRESSION" if row["regressed"] else ""
+        print(f"{row['scale']:>8} {row['name']:<40} {row['mode']:<4} "
+              f"{row['baseline']:10.3f} -> {row['current']:10.3f} ms "
+              f"({row['ratio']:5.2f}x) {mark}", file=file)
+    regressions = sum(row["regressed"] for row in rows)
+    print(f"{len(rows)}件を比較し、{regressions}件の回帰がありました", file=file)
+
+def main(argv=None):
+    """比較のエントリーポイント"""
+    parser = argparse.ArgumentParser(description="ベンチマーク結果をベースラインと比較する")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--metric", default=DEFAULT_METRIC,
+                        choices=("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"))
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    rows = compare_results(baseline, current, args.threshold, args.metric)
+    print_comparison(rows)
+    return 1 if any(row["regressed"] for row in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import datetime
+import random
+from passlib.hash import pbkdf2_sha256
+from utils.db import db_connection, each_database, get_storage
+from tasks.task_manager import TASK_STATUSES, TASK_PRIORITIES, intern_category
+
+# ベンチマーク用の合成データ生成
+# 同じ seed・件数からは常に同じデータ（ID・日付を含む）が生成される。
+
+BENCH_PASSWORD = "bench-password"
+BASE_DATE = datetime.date(2024, 1, 1)  # 生成データの「今日」にあたる基準日
+INSERT_CHUNK_SIZE = 10000
+
+# 分布（値, 重み）
+STATUS_WEIGHTS = (("not_started", 40), ("in_progress", 20), ("completed", 40))
+PRIORITY_WEIGHTS = (("low", 25), ("medium", 55), ("high", 20))
+CATEGORIES = (
+    "仕事", "プライベート", "買い物", "勉強", "健康", "家事", "趣味", "旅行",
+    "会議", "経理", "開発", "レビュー", "採用", "イベント", "読書", "運動",
+)
+NO_DUE_DATE_RATE = 0.3       # 期限なしの割合
+NO_CATEGORY_RATE = 0.1       # カテゴリなしの割合
+NO_DESCRIPTION_RATE = 0.4    # 説明なしの割合
+DUE_DAYS_RANGE = (-60, 90)   # 期限日の範囲（基準日からの日数）
+CREATED_DAYS_BACK = 365      # 作成日時の範囲（基準日より前の日数）
+
+TITLE_VERBS = ("確認する", "作成する", "送る", "まとめる", "準備する", "修正する", "予約する", "調べる")
+TITLE_OBJECTS = (
+    "資料", "見積書", "報告書", "メール", "議事録", "請求書", "企画書", "スケジュール",
+    "レポート", "チケット", "プレゼン", "契約書", "アンケート", "マニュアル",
+)
+DESCRIPTION_WORDS = (
+    "期限までに", "担当者と", "先方に", "来週の", "必要に応じて", "念のため",
+    "前回の内容を", "チームで", "確認のうえ", "共有する", "再確認する", "対応する",
+)
+
+assert {s for s, _ in STATUS_WEIGHTS} == set(TASK_STATUSES)
+assert {p for p, _ in PRIORITY_WEIGHTS} == set(TASK_PRIORITIES)
+
+def _weighted(rng, weights):
+    """(値, 重み) の組から1つ選ぶ"""
+    values, w = zip(*weights)
+    return rng.choices(values, weights=w)[0]
+
+def _user_categories(rng):
+    """ユーザーごとに使うカテゴリとその重み（よく使うものほど重い）"""
+    categories = rng.sample(CATEGORIES, rng.randint(3, 8))
+    return tuple((c, 1.0 / (rank + 1)) for rank, c in enumerate(categories))
+
+def generate_task(rng, categories):
+    """タスク1件分の値を生成
+
+    Returns:
+        (title, description, status, priority, category, due_date, created_at)
+    """
+    title = f"{rng.choice(TITLE_OBJECTS)}を{rng.choice(TITLE_VERBS)}"
+    description = None
+    if rng.random() >= NO_DESCRIPTION_RATE:
+        description = "".join(rng.choices(DESCRIPTION_WORDS, k=rng.randint(2, 6)))
+    category = None
+    if rng.random() >= NO_CATEGORY_RATE:
+        category = _weighted(rng, categories)
+    due_date = None
+    if rng.random() >= NO_DUE_DATE_RATE:
+        # 期限は基準日の近くほど多い
+        offset = round(rng.triangular(*DUE_DAYS_RANGE, 0))
+        due_date = (BASE_DATE + datetime.timedelta(days=offset)).isoformat()
+    created = datetime.datetime.combine(BASE_DATE, datetime.time()) - datetime.timedelta(
+        seconds=rng.randrange(CREATED_DAYS_BACK * 86400)
+    )
+    return (
+        title, description, _weighted(rng, STATUS_WEIGHTS), _weighted(rng, PRIORITY_WEIGHTS),
+        category, due_date, created.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+
+def generate(users, tasks_per_user, seed=0, progress=None):
+    """ユーザーとタスクを生成して現在のデータベースに登録
+
+    ユーザー名は bench_user_<番号>、パスワードはすべて BENCH_PASSWORD。
+    検索インデックスや統計カウンターはトリガーで通常どおり更新される。
+    ユーザーの配置先は登録時と同じく決め、タスクはそのユーザーのデータベースに登録する
+    （シャード構成ではユーザーごとのシャード）。
+
+    Args:
+        users: ユーザー数
+        tasks_per_user: ユーザーあたりのタスク数
+        seed: 乱数の種
+        progress: 登録済み件数を受け取るコールバック（省略可）
+
+    Returns:
+        作成したユーザーIDのリスト
+    """
+    rng = random.Random(seed)
+    # ハッシュ計算は1回だけ行い、全ユーザーで共有する
+    password_hash = pbkdf2_sha256.hash(BENCH_PASSWORD)
+    user_ids = []
+    inserted = 0
+
+    storage = get_storage()
+    with db_connection() as conn:
+        for n in range(users):
+            cursor = conn.execute(
+                "INSERT INTO users (username, password) VALUES (?, ?)",
+                (f"bench_user_{n}", password_hash),
+            )
+            user_ids.append(cursor.lastrowid)
+            storage.assign_user(conn, cursor.lastrowid)
+        conn.commit()
+
+    for user_id in user_ids:
+        with db_connection(user_id) as conn:
+            categories = _user_categories(rng)
+            category_ids = {name: intern_category(conn, user_id, name)[0] for name, _ in categories}
+            category_ids[None] = None
+            remaining = tasks_per_user
+            while remaining:
+                count = min(remaining, INSERT_CHUNK_SIZE)
+                conn.executemany(
+                    "INSERT INTO tasks (user_id, title, description, status, priority, category, "
+                    "due_date, created_at, category_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (user_id, *task, category_ids[task[4]])
+                        for task in (generate_task(rng, categories) for _ in range(count))
+                    ),
+                )
+                conn.commit()
+                remaining -= count
+                inserted += count
+                if progress:
+                    progress(inserted)
+
+    for conn in each_database():
+        conn.execute("ANALYZE")
+        conn.commit()
+
+    return user_ids
@@ -0,0 +1,444 @@
+import os
+
+# ベンチマーク中のログイン試行を制限しない（アプリのモジュールを読み込む前に設定する）
+os.environ.setdefault("LOGIN_USER_BURST", "1000000000")
+os.environ.setdefault("LOGIN_CLIENT_BURST", "1000000000")
+
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+import streamlit as st
+from utils.db import db_connection, each_database, close_pools, startup
+from utils.storage import shard_path
+from utils.cache import get_query_cache
+from tasks import task_manager
+from auth import auth
+from bench.datagen import BENCH_PASSWORD, generate
+from bench.compare import compare_results, print_comparison
+
+# スクリプト外で Streamlit の API を呼んだときの警告を抑止
+for _logger in ("streamlit.runtime.scriptrunner_utils.script_run_context",
+                "streamlit.runtime.state.session_state_proxy"):
+    logging.getLogger(_logger).setLevel(logging.ERROR)
+
+# task_manager と auth の公開関数のベンチマーク（legacy/src/app から実行する）
+#   python -m bench.run [--scales 1k,100k,1M] [--output results.json] [--baseline baseline.json]
+#
+# 規模ごとに合成データのDBを生成し（--data-dir に保存して次回以降は再利用）、
+# その複製に対して各関数を cold / warm の2通りで計測する。
+#   cold: 呼び出しごとに読み取りキャッシュとコネクションプールを破棄する
+#         （SQLiteのページキャッシュも空になる。OSのファイルキャッシュは対象外）
+#   warm: 同じ引数で一度呼んでから計測する
+
+DEFAULT_SCALES = "1k,100k,1M"
+DEFAULT_TASKS_PER_USER = 1000
+DEFAULT_ITERATIONS = 200
+HASHING_ITERATIONS = 20  # パスワードハッシュを伴う関数の最大計測回数
+HEAVY_ITERATIONS = 3     # 全件を処理する関数の最大計測回数
+BATCH_SIZE = 20          # 一括更新・削除の件数
+MODES = ("cold", "warm")
+
+# 作成するユーザー名などを一意にするための番号（モード・規模をまたいで重複しない）
+_serials = itertools.count(1)
+
+@dataclass(frozen=True)
+class Benchmark:
+    """計測対象の関数
+
+    prepare(ctx, n) は n 回分の引数のリストを返す（計測時間に含めない）。
+    repeatable が False の関数（削除など）は warm の事前呼び出しを行わない。
+    """
+    name: str
+    func: object
+    prepare: object
+    max_iterations: int = None
+    repeatable: bool = True
+
+class BenchContext:
+    """ベンチマーク中に使うデータ（ユーザー・タスクIDなど）"""
+
+    def __init__(self, user_ids, seed):
+        self.user_ids = user_ids
+        self.rng = random.Random(seed)
+
+    def users(self, n):
+        """ランダムなユーザーIDを n 個"""
+        return [self.rng.choice(self.user_ids) for _ in range(n)]
+
+    def serial(self):
+        """実行中に一意な番号"""
+        return next(_serials)
+
+    def tasks(self, n):
+        """既存タスクの (タスクID, ユーザーID) を n 組（ランダムなユーザーのタスクから選ぶ）"""
+        result = []
+        for user_id in self.users(n):
+            with db_connection(user_id) as conn:
+                low, high = conn.execute(
+                    "SELECT MIN(id), MAX(id) FROM tasks WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                if low is None:
+                    continue
+                row = conn.execute(
+                    "SELECT id FROM tasks WHERE user_id = ? AND id >= ? ORDER BY id LIMIT 1",
+                    (user_id, self.rng.randint(low, high))
+                ).fetchone()
+            result.append((row[0], user_id))
+        return result
+
+    def create_tasks(self, user_id, n):
+        """計測用のタスクを n 件作成してIDを返す"""
+        with db_connection(user_id) as conn:
+            conn.executemany(
+                "INSERT INTO tasks (user_id, title) VALUES (?, ?)",
+                ((user_id, f"bench-added {self.serial()}") for _ in range(n)),
+            )
+            conn.commit()
+            rows = conn.execute(
+                "SELECT id FROM tasks WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, n)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def deep_cursor(self, user_id, pages=10):
+        """先頭から pages ページ進んだ位置のカーソル"""
+        cursor = None
+        for _ in range(pages):
+            _, next_cursor = task_manager.get_tasks_page.uncached(user_id, cursor=cursor)
+            if next_cursor is None:
+                break
+            cursor = next_cursor
+        return cursor
+
+    def password_hashes(self, user_ids):
+        """ユーザーごとの保存済みハッシュ"""
+        with db_connection() as conn:
+            return [
+                conn.execute("SELECT password FROM users WHERE id = ?", (uid,)).fetchone()[0]
+                for uid in user_ids
+            ]
+
+def _per_user(*extra):
+    """ランダムなユーザーIDと固定の引数を渡す prepare"""
+    return lambda ctx, n: [(uid, *extra) for uid in ctx.users(n)]
+
+def _usernames_of(user_ids):
+    """ユーザーIDごとのユーザー名"""
+    with db_connection() as conn:
+        return [
+            conn.execute("SELECT username FROM users WHERE id = ?", (uid,)).fetchone()[0]
+            for uid in user_ids
+        ]
+
+def _usernames(ctx, n):
+    """ランダムなユーザーのユーザー名"""
+    return _usernames_of(ctx.users(n))
+
+def _prepare_session(ctx, n):
+    """ランダムなユーザーでログインしたセッション状態にする（ハッシュ計算は行わない）"""
+    user_id = ctx.users(1)[0]
+    st.session_state.user_id = user_id
+    st.session_state.username = _usernames_of([user_id])[0]
+    st.session_state.authenticated = True
+    return [()] * n
+
+def _deep_page(user_id, cursor):
+    """カーソルの位置から1ページ取得（絞り込みの引数と取り違えないようキーワードで渡す）"""
+    return task_manager.get_tasks_page(user_id, cursor=cursor)
+
+def _prepare_deep_page(ctx, n):
+    return [(uid, ctx.deep_cursor(uid)) for uid in ctx.users(n)]
+
+def _prepare_category(ctx, n):
+    """ユーザーが最もよく使うカテゴリで絞り込む引数"""
+    return [
+        (uid, None, None, task_manager.get_category_suggestions.uncached(uid, 1)[0])
+        for uid in ctx.users(n)
+    ]
+
+def _prepare_add(ctx, n):
+    return [
+        (uid, f"bench-added {ctx.serial()}", "ベンチマーク", "not_started", "medium", "仕事", "2024-02-01")
+        for uid in ctx.users(n)
+    ]
+
+def _prepare_update(ctx, n):
+    return [
+        (task_id, uid, None, None, ctx.rng.choice(task_manager.TASK_STATUSES))
+        for task_id, uid in ctx.tasks(n)
+    ]
+
+def _prepare_update_batch(ctx, n):
+    return [
+        (uid, ctx.create_tasks(uid, BATCH_SIZE)) for uid in ctx.users(n)
+    ]
+
+def _prepare_delete(ctx, n):
+    return [(ctx.create_tasks(uid, 1)[0], uid) for uid in ctx.users(n)]
+
+def _prepare_register(ctx, n):
+    return [(f"bench_new_{ctx.serial()}", BENCH_PASSWORD) for _ in range(n)]
+
+def _prepare_rehash(ctx, n):
+    user_ids = ctx.users(n)
+    return [
+        (uid, old_hash, BENCH_PASSWORD)
+        for uid, old_hash in zip(user_ids, ctx.password_hashes(user_ids))
+    ]
+
+def _update_tasks_batch(user_id, task_ids):
+    return task_manager.update_tasks(user_id, task_ids, priority="high")
+
+BENCHMARKS = (
+    Benchmark("task_manager.get_user_version", task_manager.get_user_version, _per_user()),
+    Benchmark("task_manager.get_task_versions", task_manager.get_task_versions, _per_user()),
+    Benchmark("task_manager.get_tasks", task_manager.get_tasks, _per_user()),
+    Benchmark("task_manager.get_tasks[status]", task_manager.get_tasks, _per_user("not_started")),
+    Benchmark("task_manager.get_tasks[overdue]", task_manager.get_tasks,
+              _per_user(None, None, None, "overdue")),
+    Benchmark("task_manager.get_tasks[category]", task_manager.get_tasks, _prepare_category),
+    Benchmark("task_manager.get_tasks[archived]", task_manager.get_tasks,
+              _per_user(None, None, None, None, True)),
+    Benchmark("task_manager.get_tasks_page", task_manager.get_tasks_page, _per_user()),
+    Benchmark("task_manager.get_tasks_page[overdue]", task_manager.get_tasks_page,
+              _per_user(None, None, None, "overdue")),
+    Benchmark("task_manager.get_tasks_page[deep]", _deep_page, _prepare_deep_page),
+    Benchmark("task_manager.search_tasks[fts]", task_manager.search_tasks, _per_user("見積書")),
+    Benchmark("task_manager.search_tasks[short]", task_manager.search_tasks, _per_user("資料")),
+    Benchmark("task_manager.get_task", task_manager.get_task,
+              lambda ctx, n: ctx.tasks(n)),
+    Benchmark("task_manager.get_task_categories", task_manager.get_task_categories, _per_user()),
+    Benchmark("task_manager.get_category_suggestions", task_manager.get_category_suggestions,
+              _per_user()),
+    Benchmark("task_manager.get_task_stats", task_manager.get_task_stats, _per_user()),
+    Benchmark("task_manager.load_task_page", task_manager.load_task_page, _per_user()),
+    Benchmark("task_manager.add_task", task_manager.add_task, _prepare_add, repeatable=False),
+    Benchmark("task_manager.update_task", task_manager.update_task, _prepare_update,
+              repeatable=False),
+    Benchmark("task_manager.update_tasks", _update_tasks_batch, _prepare_update_batch,
+              repeatable=False),
+    Benchmark("task_manager.delete_task", task_manager.delete_task, _prepare_delete,
+              repeatable=False),
+    Benchmark("task_manager.delete_tasks", task_manager.delete_tasks, _prepare_update_batch,
+              repeatable=False),
+    Benchmark("task_manager.check_task_counters", task_manager.check_task_counters, _per_user(),
+              max_iterations=HEAVY_ITERATIONS),
+    Benchmark("task_manager.rebuild_search_index", task_manager.rebuild_search_index,
+              lambda ctx, n: [()] * n, max_iterations=HEAVY_ITERATIONS, repeatable=False),
+    Benchmark("auth.hash_password", auth.hash_password,
+              lambda ctx, n: [(BENCH_PASSWORD,)] * n, max_iterations=HASHING_ITERATIONS),
+    Benchmark("auth.verify_password", auth.verify_password,
+              lambda ctx, n: [(BENCH_PASSWORD, h) for h in ctx.password_hashes(ctx.users(n))],
+              max_iterations=HASHING_ITERATIONS),
+    Benchmark("auth.authenticate_user", auth.authenticate_user,
+              lambda ctx, n: [(name, BENCH_PASSWORD) for name in _usernames(ctx, n)],
+              max_iterations=HASHING_ITERATIONS),
+    Benchmark("auth.register_user", auth.register_user, _prepare_register,
+              max_iterations=HASHING_ITERATIONS, repeatable=False),
+    Benchmark("auth.login_user", auth.login_user,
+              lambda ctx, n: [(name, BENCH_PASSWORD) for name in _usernames(ctx, n)],
+              max_iterations=HASHING_ITERATIONS),
+    Benchmark("auth.rehash_password", auth.rehash_password, _prepare_rehash,
+              max_iterations=HASHING_ITERATIONS, repeatable=False),
+    Benchmark("auth.logout_user", auth.logout_user, lambda ctx, n: [()] * n),
+    Benchmark("auth.get_client_id", auth.get_client_id, lambda ctx, n: [()] * n),
+    Benchmark("auth.get_auth_metrics", auth.get_auth_metrics, lambda ctx, n: [()] * n),
+    Benchmark("auth.is_authenticated", auth.is_authenticated, _prepare_session),
+    Benchmark("auth.is_admin", auth.is_admin, _prepare_session),
+)
+
+def parse_scale(text):
+    """'1k' や '1M' のような件数表記を整数に変換"""
+    text = text.strip()
+    units = {"k": 1000, "K": 1000, "m": 1000000, "M": 1000000}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def reset_caches():
+    """読み取りキャッシュとコネクションプールを破棄（cold 計測用）"""
+    get_query_cache().clear()
+    close_pools()
+
+def percentile(sorted_values, p):
+    """最近接順位法によるパーセンタイル"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+def summarize(samples):
+    """計測値（秒）のリストから統計を作る"""
+    values = sorted(samples)
+    total = sum(values)
+    return {
+        "count": len(values),
+        "mean_ms": total / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": values[-1] * 1000 if values else 0.0,
+        "ops_per_sec": len(values) / total if total else 0.0,
+    }
+
+def run_benchmark(bench, ctx, mode, iterations):
+    """1つの関数を計測して統計を返す"""
+    n = min(iterations, bench.max_iterations or iterations)
+    calls = bench.prepare(ctx, n)
+    if mode == "warm":
+        if bench.repeatable:
+            for args in calls:
+                bench.func(*args)
+        else:
+            # 接続とスキーマの読み込みだけ済ませておく
+            startup()
+            with db_connection() as conn:
+                conn.execute("SELECT id FROM tasks LIMIT 1").fetchone()
+
+    samples = []
+    for args in calls:
+        if mode == "cold":
+            reset_caches()
+        started = time.perf_counter()
+        bench.func(*args)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+def _database_files(path):
+    """DBのファイル（シャード構成ではすべてのシャード、0番目から順に）"""
+    files = []
+    while shard_path(path, len(files)).exists():
+        files.append(shard_path(path, len(files)))
+    return files
+
+def _remove_database(path):
+    """DBのファイルを -wal などの付随ファイル・シャードごと削除"""
+    for pattern in (path.name + "*", f"{path.stem}.shard*{path.suffix}*"):
+        for file in path.parent.glob(pattern):
+            file.unlink()
+
+def prepare_data(data_dir, users, tasks_per_user, seed):
+    """合成データのDBを用意してパスを返す（同じ条件のDBがあれば再利用）"""
+    data_dir.mkdir(parents=True, exist_ok=True)
+    path = data_dir / f"bench_{users}x{tasks_per_user}_seed{seed}.db"
+    if path.exists():
+        return path, 0.0
+
+    # 途中で中断したDBを再利用しないよう、完成してから名前を変える
+    building = path.with_suffix(".building")
+    _remove_database(building)
+    os.environ["TASKMANAGER_DB"] = str(building)
+    started = time.perf_counter()
+    startup()
+
+    def progress(inserted):
+        print(f"\r  生成中 {inserted}/{users * tasks_per_user}", end="", file=sys.stderr, flush=True)
+
+    generate(users, tasks_per_user, seed, progress=progress)
+    print(file=sys.stderr)
+    elapsed = time.perf_counter() - started
+    for conn in each_database():
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    close_pools()
+    # 0番目のファイルの有無で完成を判定するため、0番目を最後に移す
+    for index, file in reversed(list(enumerate(_database_files(building)))):
+        file.rename(shard_path(path, index))
+    return path, elapsed
+
+def run_scale(scale, args):
+    """1つの規模のベンチマークを実行"""
+    tasks_per_user = min(args.tasks_per_user, scale)
+    users = max(1, scale // tasks_per_user)
+    print(f"== {scale} タスク（{users} ユーザー × {tasks_per_user}）", file=sys.stderr)
+    pristine, generate_seconds = prepare_data(Path(args.data_dir), users, tasks_per_user, args.seed)
+
+    # 書き込みで元データが変わらないよう複製に対して計測する
+    work = pristine.with_suffix(".work.db")
+    for index, file in enumerate(_database_files(pristine)):
+        shutil.copyfile(file, shard_path(work, index))
+    os.environ["TASKMANAGER_DB"] = str(work)
+    startup()
+    with db_connection() as conn:
+        user_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM users WHERE username LIKE 'bench_user_%' ORDER BY id"
+        )]
+
+    results = {}
+    only = set(args.only.split(",")) if args.only else None
+    for bench in BENCHMARKS:
+        if only and bench.name not in only:
+            continue
+        results[bench.name] = {}
+        for mode in MODES:
+            ctx = BenchContext(user_ids, args.seed)
+            stats = run_benchmark(bench, ctx, mode, args.iterations)
+            results[bench.name][mode] = stats
+            print(f"  {bench.name:<40} {mode:<4} p50={stats['p50_ms']:9.3f}ms "
+                  f"p95={stats['p95_ms']:9.3f}ms p99={stats['p99_ms']:9.3f}ms "
+                  f"{stats['ops_per_sec']:10.1f} ops/s", file=sys.stderr)
+
+    close_pools()
+    _remove_database(work)
+    return {
+        "users": users,
+        "tasks_per_user": tasks_per_user,
+        "tasks": users * tasks_per_user,
+        "generate_seconds": generate_seconds,
+        "benchmarks": results,
+    }
+
+def main(argv=None):
+    """ベンチマークのエントリーポイント"""
+    parser = argparse.ArgumentParser(description="task_manager と auth のベンチマーク")
+    parser.add_argument("--scales", default=DEFAULT_SCALES,
+                        help=f"計測するタスク総数（カンマ区切り、既定: {DEFAULT_SCALES}）")
+    parser.add_argument("--tasks-per-user", type=int, default=DEFAULT_TASKS_PER_USER)
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default="data/bench", help="生成したDBの保存先")
+    parser.add_argument("--only", help="計測する関数名（カンマ区切り）")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--baseline", help="比較するベースラインのJSONファイル")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="回帰とみなす p95 の悪化率（既定: 0.25 = 25%%）")
+    args = parser.parse_args(argv)
+
+    result = {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "iterations": args.iterations,
+        },
+        "scales": {},
+    }
+    for scale in (parse_scale(s) for s in args.scales.split(",")):
+        result["scales"][str(scale)] = run_scale(scale, args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"結果を {args.output} に保存しました", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare_results(baseline, result, args.threshold)
+        print_comparison(rows)
+        if any(row["regressed"] for row in rows):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import argparse
+import sys
+from utils.db import startup, get_storage
+from utils.storage import ShardedBackend, move_user, purge_orphans, rebalance_shards
+from tasks.task_manager import rebuild_search_index, check_task_counters
+from tasks.transfer import TRANSFER_FORMATS, import_tasks, export_tasks
+from tasks.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, archive_completed_tasks
+
+# 管理用コマンド（アプリと同じく legacy/src/app から実行する）
+#   python manage.py rebuild-search-index
+#   python manage.py check-stats [--user-id N] [--repair]
+#   python manage.py import-tasks --user-id N [--format csv|jsonl] FILE
+#   python manage.py export-tasks --user-id N [--format csv|jsonl] [--output FILE]
+#   python manage.py archive-tasks [--days N] [--batch-size N] [--user-id N]
+#   python manage.py rebalance-shards [--dry-run]     （STORAGE_BACKEND=sharded、アプリを止めて実行）
+#   python manage.py move-user --user-id N --shard K   （同上）
+
+def positive_int(value):
+    """正の整数の引数"""
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"正の整数で指定してください: {value}")
+    return number
+
+def cmd_rebuild_search_index(args):
+    """全文検索インデックスの再構築"""
+    rebuild_search_index()
+    print("全文検索インデックスを再構築しました")
+
+def cmd_check_stats(args):
+    """統計カウンターの整合性チェック"""
+    drift = check_task_counters(args.user_id, repair=args.repair)
+    if not drift:
+        print("統計カウンターに食い違いはありません")
+        return
+    
+    for user_id, kind, key, expected, actual in drift:
+        print(f"user_id={user_id} {kind}={key!r}: 正={expected} 記録={actual}")
+    if args.repair:
+        print(f"{len(drift)}件の食い違いを修復しました")
+    else:
+        print(f"{len(drift)}件の食い違いがあります（--repair で修復）")
+
+def cmd_import_tasks(args):
+    """ファイルからタスクを一括インポート"""
+    def progress(imported, errors):
+        print(f"\r登録 {imported}件 / エラー {errors}件", end="", file=sys.stderr, flush=True)
+    
+    with open(args.file, "rb") as f:
+        result = import_tasks(args.user_id, f, args.format, progress=progress)
+    print(file=sys.stderr)
+    
+    for line_no, message in result.errors:
+        print(f"{line_no}行目: {message}")
+    print(f"{result.imported}件のタスクを登録しました（エラー {result.error_count}件）")
+
+def cmd_export_tasks(args):
+    """タスクをファイルへエクスポート"""
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            f.writelines(export_tasks(args.user_id, args.format))
+    else:
+        sys.stdout.writelines(export_tasks(args.user_id, args.format))
+
+def cmd_archive_tasks(args):
+    """完了から日数の経ったタスクをアーカイブへ移す"""
+    def progress(moved):
+        print(f"\rアーカイブ {moved}件", end="", file=sys.stderr, flush=True)
+    
+    moved = archive_completed_tasks(
+        args.days, args.batch_size, user_id=args.user_id, progress=progress
+    )
+    print(file=sys.stderr)
+    print(f"{moved}件のタスクをアーカイブしました")
+
+def sharded_storage():
+    """シャード構成のバックエンド（シャード構成でなければ終了する）"""
+    storage = get_storage()
+    if not isinstance(storage, ShardedBackend):
+        sys.exit("シャード構成ではありません（STORAGE_BACKEND=sharded で実行してください）")
+    return storage
+
+def cmd_rebalance_shards(args):
+    """ユーザーを置くべきシャードへ移す"""
+    storage = sharded_storage()
+    
+    def progress(user_id, source, target, moved):
+        if moved is None:
+            print(f"user_id={user_id}: シャード{source} → シャード{target}")
+        else:
+            print(f"user_id={user_id}: シャード{source} → シャード{target}（{moved}件）")
+    
+    moves = rebalance_shards(storage, dry_run=args.dry_run, progress=progress)
+    if args.dry_run:
+        print(f"{len(moves)}人のユーザーを移す必要があります（--dry-run のため移していません）")
+        return
+    
+    purged = purge_orphans(storage)
+    for shard, user_id in purged:
+        print(f"シャード{shard}に残っていた user_id={user_id} のタスクを削除しました")
+    print(f"{len(moves)}人のユーザーを移しました")
+
+def cmd_move_user(args):
+    """ユーザーを指定したシャードへ移す"""
+    moved = move_user(sharded_storage(), args.user_id, args.shard)
+    print(f"user_id={args.user_id} のタスク{moved}件をシャード{args.shard}へ移しました")
+
+def main(argv=None):
+    """管理コマンドのエントリーポイント"""
+    parser = argparse.ArgumentParser(description="タスク管理アプリの管理コマンド")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-search-index", help="全文検索インデックスを再構築する")
+    rebuild.set_defaults(func=cmd_rebuild_search_index)
+
+    check_stats = subparsers.add_parser("check-stats", help="統計カウンターを集計し直して食い違いを報告する")
+    check_stats.add_argument("--user-id", type=int, help="対象ユーザーID（省略時は全ユーザー）")
+    check_stats.add_argument("--repair", action="store_true", help="食い違いのあったカウンターを作り直す")
+    check_stats.set_defaults(func=cmd_check_stats)
+
+    import_parser = subparsers.add_parser("import-tasks", help="CSV / JSONL ファイルからタスクを一括登録する")
+    import_parser.add_argument("file", help="読み込むファイル")
+    import_parser.add_argument("--user-id", type=int, required=True, help="登録先のユーザーID")
+    import_parser.add_argument("--format", choices=TRANSFER_FORMATS, default="csv", help="ファイル形式")
+    import_parser.set_defaults(func=cmd_import_tasks)
+
+    export_parser = subparsers.add_parser("export-tasks", help="タスクを CSV / JSONL で出力する")
+    export_parser.add_argument("--user-id", type=int, required=True, help="対象のユーザーID")
+    export_parser.add_argument("--format", choices=TRANSFER_FORMATS, default="csv", help="ファイル形式")
+    export_parser.add_argument("--output", help="出力先ファイル（省略時は標準出力）")
+    export_parser.set_defaults(func=cmd_export_tasks)
+
+    archive_parser = subparsers.add_parser("archive-tasks", help="完了から日数の経ったタスクをアーカイブへ移す")
+    archive_parser.add_argument("--days", type=positive_int, default=ARCHIVE_AFTER_DAYS, help="完了からこの日数を過ぎたタスクを移す")
+    archive_parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="1回のトランザクションで移す件数")
+    archive_parser.add_argument("--user-id", type=int, help="対象ユーザーID（省略時は全ユーザー）")
+    archive_parser.set_defaults(func=cmd_archive_tasks)
+
+    rebalance = subparsers.add_parser("rebalance-shards", help="ユーザーを置くべきシャードへ移す")
+    rebalance.add_argument("--dry-run", action="store_true", help="移さずに計画だけを表示する")
+    rebalance.set_defaults(func=cmd_rebalance_shards)
+
+    move_parser = subparsers.add_parser("move-user", help="ユーザーを指定したシャードへ移す")
+    move_parser.add_argument("--user-id", type=int, required=True, help="移すユーザーID")
+    move_parser.add_argument("--shard", type=int, required=True, help="移動先のシャード番号")
+    move_parser.set_defaults(func=cmd_move_user)
+
+    args = parser.parse_args(argv)
+
+    # 未適用のマイグレーションがあれば先に適用する
+    startup()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
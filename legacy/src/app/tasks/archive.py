@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import threading
+import time
+from utils.db import each_database
+
+# 完了済みタスクのアーカイブ
+#
+# 完了から ARCHIVE_AFTER_DAYS 日を過ぎたタスクを tasks から tasks_archive へ移す。
+# 一覧・統計などの通常の読み取りは tasks だけを対象にするため、完了済みタスクが
+# 溜まっても遅くならない（アーカイブは明示的に求められたときだけ読む）。
+# 移動は ARCHIVE_BATCH_SIZE 件ずつの短いトランザクションで行い、
+# 間に休みを入れてアプリの書き込みを長く待たせないようにする。
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_BATCH_PAUSE = float(os.environ.get("ARCHIVE_BATCH_PAUSE", "0.05"))  # バッチ間の休み（秒）
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", "3600"))  # バックグラウンド実行の間隔（秒、0で無効）
+
+# tasks から tasks_archive へ移す列
+ARCHIVE_COLUMNS = (
+    "id, user_id, title, description, status, priority, category, category_id, due_date, "
+    "created_at, completed_at"
+)
+
+logger = logging.getLogger(__name__)
+
+def _check_days(older_than_days):
+    """日数が正の整数か確かめる（0 以下では完了したばかりのタスクまで移してしまう）"""
+    # bool は int の派生クラスのため type() で比べる
+    if type(older_than_days) is not int or older_than_days <= 0:
+        raise ValueError(f"アーカイブまでの日数は正の整数で指定してください: {older_than_days!r}")
+
+def archive_batch(conn, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE,
+                  user_id=None):
+    """アーカイブ対象のタスクを1バッチ分だけ移す
+
+    Args:
+        conn: データベース接続
+        older_than_days: 完了からこの日数を過ぎたタスクを対象にする
+        batch_size: 1回のトランザクションで移す最大件数
+        user_id: 対象ユーザーID（省略時は全ユーザー）
+
+    Returns:
+        移した件数
+
+    Raises:
+        ValueError: older_than_days が正の整数でない
+    """
+    _check_days(older_than_days)
+    user_filter = "" if user_id is None else " AND user_id = :user_id"
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ids = [
+            row[0] for row in conn.execute(
+                f"""
+                SELECT id FROM tasks
+                WHERE status = 'completed' AND completed_at < datetime('now', :age){user_filter}
+                ORDER BY completed_at
+                LIMIT :limit
+                """,
+                {"age": f"-{older_than_days} days", "user_id": user_id, "limit": batch_size}
+            )
+        ]
+        if ids:
+            # 削除時のトリガーで件数カウンター・世代番号・全文検索インデックスも更新される
+            id_list = json.dumps(ids)
+            conn.execute(
+                f"""
+                INSERT INTO tasks_archive ({ARCHIVE_COLUMNS})
+                SELECT {ARCHIVE_COLUMNS} FROM tasks WHERE id IN (SELECT value FROM json_each(?))
+                """,
+                (id_list,)
+            )
+            conn.execute("DELETE FROM tasks WHERE id IN (SELECT value FROM json_each(?))", (id_list,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(ids)
+
+def archive_completed_tasks(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE,
+                            user_id=None, pause=ARCHIVE_BATCH_PAUSE, progress=None,
+                            stop_event=None):
+    """完了から日数の経ったタスクをすべてアーカイブへ移す
+
+    Args:
+        older_than_days: 完了からこの日数を過ぎたタスクを対象にする
+        batch_size: 1回のトランザクションで移す最大件数
+        user_id: 対象ユーザーID（省略時は全ユーザー）
+        pause: バッチ間の休み（秒）
+        progress: 各バッチの後に移した件数の累計で呼ばれる関数（省略可）
+        stop_event: セットされたら次のバッチの前で止める threading.Event（省略可）
+
+    Returns:
+        移した件数
+
+    Raises:
+        ValueError: older_than_days が正の整数でない
+    """
+    _check_days(older_than_days)
+    total = 0
+    # シャード構成ではデータベースごとに移す
+    for conn in each_database(user_id):
+        while stop_event is None or not stop_event.is_set():
+            moved = archive_batch(conn, older_than_days, batch_size, user_id)
+            total += moved
+            if progress:
+                progress(total)
+            if moved < batch_size:
+                break
+            time.sleep(pause)
+    return total
+
+class Archiver(threading.Thread):
+    """一定間隔でアーカイブを行うバックグラウンドスレッド"""
+
+    def __init__(self, interval=ARCHIVE_INTERVAL):
+        super().__init__(name="task-archiver", daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                moved = archive_completed_tasks(stop_event=self._stopped)
+                if moved:
+                    logger.info("%d件のタスクをアーカイブしました", moved)
+            except Exception:
+                logger.exception("タスクのアーカイブに失敗しました")
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+_archiver = None
+_archiver_lock = threading.Lock()
+
+def start_archiver(interval=ARCHIVE_INTERVAL):
+    """バックグラウンドのアーカイブを開始する（プロセスごとに1つ、リランごとに呼んでもよい）
+
+    interval が0以下の場合は開始しない。
+
+    Returns:
+        Archiver（開始しなかった場合は None）
+    """
+    global _archiver
+    if _archiver is None and interval > 0:
+        with _archiver_lock:
+            if _archiver is None:
+                _archiver = Archiver(interval)
+                _archiver.start()
+    return _archiver
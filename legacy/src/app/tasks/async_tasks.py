@@ -0,0 +1,24 @@
+from utils.async_db import async_version
+from tasks import task_manager
+
+# task_manager の async 版（asyncio を使うフロントエンドやバックグラウンド処理用）
+#
+# いずれも同期版と同じ引数・戻り値で、DB 専用スレッドで同期版を実行する。
+# 追加のキーワード引数 timeout（秒）を超えると TimeoutError になり、
+# 呼び出し側のタスクがキャンセルされた場合と同様に実行中のSQLは中断される。
+#   ok, message = await add_task(user_id, "タイトル", timeout=5)
+
+add_task = async_version(task_manager.add_task)
+get_tasks = async_version(task_manager.get_tasks)
+get_tasks_page = async_version(task_manager.get_tasks_page)
+search_tasks = async_version(task_manager.search_tasks)
+get_task = async_version(task_manager.get_task)
+update_task = async_version(task_manager.update_task)
+delete_task = async_version(task_manager.delete_task)
+update_tasks = async_version(task_manager.update_tasks)
+delete_tasks = async_version(task_manager.delete_tasks)
+get_task_categories = async_version(task_manager.get_task_categories)
+get_category_suggestions = async_version(task_manager.get_category_suggestions)
+get_task_stats = async_version(task_manager.get_task_stats)
+get_task_versions = async_version(task_manager.get_task_versions)
+load_task_page = async_version(task_manager.load_task_page)
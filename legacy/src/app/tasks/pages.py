@@ -1,9 +1,33 @@
 import streamlit as st
+import dataclasses
 import datetime
+from streamlit.errors import StreamlitAPIException
 from tasks.task_manager import (
-    add_task, get_tasks, get_task, update_task, 
-    delete_task, get_task_categories, get_task_stats
+    DUE_FILTERS, add_task, get_task, update_task, delete_task, update_tasks, delete_tasks,
+    get_task_stats, get_task_versions, get_category_suggestions, load_task_page, day_key
 )
+from tasks.transfer import TRANSFER_FORMATS, import_tasks, export_file
+from tasks.archive import ARCHIVE_AFTER_DAYS
+from utils.profiling import profile_section
+
+# タスク一覧の1ページあたりの表示件数
+TASKS_PER_PAGE = 20
+
+# 他のタブ・API・バックグラウンド処理による変更を調べる間隔
+CHANGE_POLL_INTERVAL = "2s"
+
+# ページはフラグメントに分けてあり、操作したときは影響のある部分だけを再実行する。
+#   追加フォーム : 登録するとカテゴリ・一覧・統計がすべて変わるためアプリ全体を再実行
+#   一覧         : フィルター・ページ切り替え・一括操作はこのフラグメントだけを再実行
+#   タスクカード : 完了・削除・編集はそのカードだけを再実行
+# 他のタブ・API・バックグラウンド処理による変更は、一覧と統計のフラグメントが
+# CHANGE_POLL_INTERVAL ごとに自分の世代番号を調べて反映する。
+#   一覧         : tasks・categories の世代番号が進んだときだけ一覧を読み直す
+#   統計         : stats の世代番号でキャッシュしているため、進んだときだけ読み直す
+#   追加フォーム : 自分では調べず、一覧が読んだ categories の世代番号がフォームの表示時と
+#                  違っていればアプリ全体を再実行してカテゴリの候補を読み直す
+# このセッション自身のカードでの操作は acknowledge_own_changes() で表示中の世代番号に
+# 取り込み、一覧を読み直さない（カードは自分で読み直し、統計は統計の世代番号で更新される）。
 
 def tasks_page():
     """タスク管理のメインページ"""
@@ -12,17 +36,31 @@ def tasks_page():
     # サイドバーにタスク追加と統計情報
     with st.sidebar:
         st.header("タスク追加")
-        add_task_form()
+        with profile_section("追加フォーム"):
+            add_task_form()
         
         st.markdown("---")
-        show_task_stats()
+        with profile_section("統計"):
+            task_stats_section()
     
     # メインエリアにタスク一覧とフィルター
-    task_filters()
-    show_tasks()
+    with profile_section("一覧"):
+        task_list_section()
+    
+    st.markdown("---")
+    with profile_section("インポート/エクスポート"):
+        task_transfer_panel()
 
+@st.fragment
 def add_task_form():
-    """タスク追加フォーム"""
+    """タスク追加フォーム（入力エラーの表示はフォームだけを再実行する）
+
+    カテゴリの候補を読んだ時点の categories の世代番号を記録しておき、
+    refresh_category_suggestions() で変更を検出する。
+    """
+    st.session_state.add_form_categories_version = get_task_versions(
+        st.session_state.user_id
+    ).categories
     with st.form("add_task_form"):
         title = st.text_input("タイトル*")
         description = st.text_area("説明")
@@ -36,7 +74,7 @@ def add_task_form():
                 index=0
             )
             
-            category = st.text_input("カテゴリ")
+            category = category_input(key="add_task_category")
         
         with col2:
             priority = st.selectbox(
@@ -81,14 +119,109 @@ def add_task_form():
                 else:
                     st.error(message)
 
-def task_filters():
-    """タスクのフィルターUI"""
+@st.fragment(run_every=CHANGE_POLL_INTERVAL)
+def task_list_section():
+    """フィルターとタスク一覧（フィルター・ページの変更ではこの部分だけを再実行する）
+
+    CHANGE_POLL_INTERVAL ごとにも再実行し、他からの変更があれば一覧を読み直す。
+    """
+    with profile_section("データ取得"):
+        filters = current_task_filters()
+        cursors = task_page_cursors(filters)
+        data = current_task_page(filters, cursors[-1])
+    
+    with profile_section("フィルター"):
+        task_filters(data.categories)
+    show_tasks(data, cursors)
+    refresh_category_suggestions()
+
+def refresh_category_suggestions():
+    """カテゴリが変わっていれば追加フォームの候補を読み直すためアプリ全体を再実行
+
+    追加フォームはポーリングしないため、一覧が読んだ categories の世代番号と
+    フォームの表示時の世代番号を比べる（カテゴリの変更はまれなので再実行もまれ）。
+    """
+    shown = st.session_state.get("task_page_versions")
+    form_version = st.session_state.get("add_form_categories_version")
+    if shown is not None and form_version is not None and shown.categories != form_version:
+        st.rerun(scope="app")
+
+def current_task_page(filters, cursor):
+    """表示するタスク一覧のページを取得
+
+    前回と同じフィルター・ページで、その後タスクもカテゴリも変更されていなければ
+    前回読んだ一覧を返す（user_versions を主キーで1回検索するだけで済む）。
+    それ以外はカテゴリ一覧とタスク一覧を1回のトランザクションでまとめて読み直す。
+    """
+    user_id = st.session_state.user_id
+    page_key = (dict(filters), cursor)
+    shown = st.session_state.get("task_page_versions")
+    snapshot = st.session_state.get("task_page_snapshot")
+    if snapshot is not None and shown is not None and snapshot[0] == page_key:
+        changed = get_task_versions(user_id).changed_since(shown)
+        if "tasks" not in changed and "categories" not in changed:
+            return snapshot[1]
+    
+    data = load_task_page(
+        user_id,
+        status=filters["status"],
+        priority=filters["priority"],
+        category=filters["category"],
+        due=filters["due"],
+        query=filters["query"],
+        cursor=cursor,
+        limit=TASKS_PER_PAGE,
+        include_archived=filters["include_archived"]
+    )
+    st.session_state.task_page_snapshot = (page_key, data)
+    # 変更の有無を比べる世代番号（一覧と同じスナップショットから読んだもの）
+    st.session_state.task_page_versions = data.versions
+    # 一覧を読み直したのでカード単位で変更したタスクの記録は不要
+    st.session_state.changed_task_cards = set()
+    return data
+
+def current_task_filters():
+    """フィルターウィジェットの現在の値を取得（未操作の場合はすべて）"""
+    def selected(key):
+        value = st.session_state.get(key, "all")
+        return None if value == "all" else value
+    
+    status = selected("status_filter")
+    return {
+        "status": status,
+        "priority": selected("priority_filter"),
+        "category": selected("category_filter"),
+        "due": selected("due_filter"),
+        "query": st.session_state.get("search_query", "").strip() or None,
+        # アーカイブは完了済みのタスクを見るときだけ読む
+        "include_archived": st.session_state.get("show_archived", False) or status == "completed"
+    }
+
+def task_page_cursors(filters):
+    """表示中のページまでのカーソル一覧（フィルターが変わったら先頭ページに戻す）"""
+    if st.session_state.get("task_page_filters") != filters:
+        st.session_state.task_page_filters = dict(filters)
+        st.session_state.task_page_cursors = [None]
+    return st.session_state.task_page_cursors
+
+def task_filters(categories):
+    """タスクのフィルターUI
+    
+    Args:
+        categories: ユーザーのカテゴリ一覧
+    """
     st.subheader("タスクフィルター")
     
-    col1, col2, col3 = st.columns(3)
+    st.text_input(
+        "キーワード検索",
+        placeholder="タイトル・説明に含まれる語（空白区切りで複数指定）",
+        key="search_query"
+    )
+    
+    col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        status_filter = st.selectbox(
+        st.selectbox(
             "ステータスでフィルター",
             options=["all", "not_started", "in_progress", "completed"],
             format_func=lambda x: "すべて" if x == "all" else format_status(x),
@@ -96,7 +229,7 @@ def task_filters():
         )
     
     with col2:
-        priority_filter = st.selectbox(
+        st.selectbox(
             "優先度でフィルター",
             options=["all", "low", "medium", "high"],
             format_func=lambda x: "すべて" if x == "all" else format_priority(x),
@@ -104,45 +237,176 @@ def task_filters():
         )
     
     with col3:
-        # ユーザーのカテゴリ一覧を取得
-        categories = get_task_categories(st.session_state.user_id)
         # "すべて"オプションを追加
-        category_options = ["all"] + categories
+        category_options = ["all"] + list(categories)
         
-        category_filter = st.selectbox(
+        st.selectbox(
             "カテゴリでフィルター",
             options=category_options,
             format_func=lambda x: "すべて" if x == "all" else x,
             key="category_filter"
         )
     
-    # フィルター値をセッションに保存
-    st.session_state.task_filters = {
-        "status": None if status_filter == "all" else status_filter,
-        "priority": None if priority_filter == "all" else priority_filter,
-        "category": None if category_filter == "all" else category_filter
-    }
-
-def show_tasks():
-    """タスク一覧の表示"""
-    filters = getattr(st.session_state, "task_filters", {"status": None, "priority": None, "category": None})
+    with col4:
+        st.selectbox(
+            "期限でフィルター",
+            options=["all"] + list(DUE_FILTERS),
+            format_func=lambda x: "すべて" if x == "all" else format_due_filter(x),
+            key="due_filter"
+        )
     
-    tasks = get_tasks(
-        st.session_state.user_id,
-        status=filters["status"],
-        priority=filters["priority"],
-        category=filters["category"]
+    st.checkbox(
+        "アーカイブ済みのタスクも表示",
+        help=f"完了から{ARCHIVE_AFTER_DAYS}日を過ぎたタスクはアーカイブされます。"
+             "ステータスで「完了」を選んだときも表示されます",
+        key="show_archived"
     )
+
+def show_tasks(data, cursors):
+    """タスク一覧の表示（1ページずつ）
     
-    if not tasks:
+    Args:
+        data: load_task_page() の結果
+        cursors: 表示中のページまでのカーソル一覧
+    """
+    if not data.tasks:
         st.info("表示するタスクがありません")
-        return
+    else:
+        bulk_action_form(data.tasks)
     
-    for task in tasks:
+    for task in data.tasks:
         show_task_card(task)
+    
+    if len(cursors) > 1 or data.next_cursor is not None:
+        task_page_controls(cursors, data.next_cursor)
 
+def bulk_action_form(tasks):
+    """表示中のタスクを複数選択してまとめて操作するフォーム
+    
+    Args:
+        tasks: 表示中のタスク一覧
+    """
+    # アーカイブ済みのタスクは変更できないため対象にしない
+    titles = {task["id"]: task["title"] for task in tasks if not task["archived"]}
+    
+    with st.expander("一括操作"):
+        with st.form("bulk_action_form"):
+            select_all = st.checkbox("表示中のタスクをすべて選択")
+            selected = st.multiselect(
+                "対象のタスク",
+                options=list(titles),
+                format_func=lambda task_id: titles[task_id]
+            )
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                action = st.selectbox(
+                    "操作",
+                    options=["complete", "priority", "delete"],
+                    format_func=lambda x: {
+                        "complete": "完了にする",
+                        "priority": "優先度を変更",
+                        "delete": "削除する"
+                    }[x]
+                )
+            with col2:
+                priority = st.selectbox(
+                    "変更後の優先度",
+                    options=["low", "medium", "high"],
+                    format_func=format_priority,
+                    index=1
+                )
+            
+            submit = st.form_submit_button("実行")
+        
+        if submit:
+            task_ids = list(titles) if select_all else selected
+            user_id = st.session_state.user_id
+            if action == "complete":
+                success, message = update_tasks(user_id, task_ids, status="completed")
+            elif action == "priority":
+                success, message = update_tasks(user_id, task_ids, priority=priority)
+            else:
+                success, message = delete_tasks(user_id, task_ids)
+            
+            if success:
+                st.success(message)
+                rerun_fragment()
+            else:
+                st.error(message)
+
+def task_page_controls(cursors, next_cursor):
+    """タスク一覧のページ切り替えボタン"""
+    col1, col2, col3 = st.columns([1, 1, 1])
+    
+    with col1:
+        if st.button("前へ", key="tasks_prev_page", disabled=len(cursors) == 1):
+            cursors.pop()
+            rerun_fragment()
+    
+    with col2:
+        st.write(f"ページ {len(cursors)}")
+    
+    with col3:
+        if st.button("次へ", key="tasks_next_page", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            rerun_fragment()
+
+def task_transfer_panel():
+    """タスクの一括インポート・エクスポート"""
+    with st.expander("インポート / エクスポート"):
+        fmt = st.radio(
+            "ファイル形式",
+            options=list(TRANSFER_FORMATS),
+            format_func=str.upper,
+            horizontal=True,
+            key="transfer_format"
+        )
+        
+        uploaded = st.file_uploader("インポートするファイル", type=[fmt], key="import_file")
+        if uploaded is not None and st.button("インポート", key="import_tasks"):
+            bar = st.progress(0.0, text="インポート中...")
+            total_size = max(uploaded.size, 1)
+            
+            def progress(imported, errors):
+                bar.progress(
+                    min(uploaded.tell() / total_size, 1.0),
+                    text=f"登録 {imported}件 / エラー {errors}件"
+                )
+            
+            result = import_tasks(st.session_state.user_id, uploaded, fmt, progress=progress)
+            bar.progress(1.0, text="完了")
+            st.success(f"{result.imported}件のタスクを登録しました")
+            if result.error_count:
+                st.warning(f"{result.error_count}件の行を登録できませんでした")
+                for line_no, message in result.errors:
+                    st.caption(f"{line_no}行目: {message}")
+        
+        # ファイルはボタンが押されたときに別スレッドで作る（リランのたびには作らない）
+        user_id = st.session_state.user_id
+        st.download_button(
+            "エクスポート",
+            data=lambda: export_file(user_id, fmt),
+            file_name=f"tasks.{fmt}",
+            mime="text/csv" if fmt == "csv" else "application/jsonl",
+            key="download_export"
+        )
+        st.caption("件数が多い場合は python manage.py export-tasks でも出力できます")
+
+@st.fragment
 def show_task_card(task):
-    """タスクカードの表示"""
+    """タスクカードの表示（カード内の操作ではこのカードだけを再実行する）
+    
+    Args:
+        task: 一覧の行。カードだけを再実行したときは最初に渡された値のままなので、
+            このカードで変更したタスクは読み直す
+    """
+    if task["id"] in st.session_state.get("changed_task_cards", ()):
+        task = get_task(task["id"], st.session_state.user_id)
+        if task is None:
+            # 削除済み
+            return
+    
     # ステータスに応じた色を設定
     status_colors = {
         "not_started": "🔴",
@@ -165,21 +429,29 @@ def show_task_card(task):
         card_header += f" #{task['category']}"
     
     with st.expander(card_header):
-        # タスク詳細を表示
-        if task["description"]:
-            st.markdown(f"**説明:** {task['description']}")
+        # 説明は一覧では取得せず、表示を求められたときだけ読み込む
+        if st.toggle("説明を表示", key=f"details_{task['id']}"):
+            detail = get_task(task["id"], st.session_state.user_id, include_archived=task["archived"])
+            if detail and detail["description"]:
+                st.markdown(f"**説明:** {detail['description']}")
+            else:
+                st.caption("説明はありません")
         
-        # 期限日を表示（ある場合）
-        if task["due_date"]:
-            try:
-                due_date = datetime.date.fromisoformat(task["due_date"])
-                st.markdown(f"**期限:** {due_date.strftime('%Y/%m/%d')}")
-                
-                # 期限が過ぎている場合は警告
-                if due_date < datetime.date.today() and task["status"] != "completed":
-                    st.warning("期限が過ぎています")
-            except ValueError:
-                st.markdown(f"**期限:** {task['due_date']}")
+        # 期限日を表示（ある場合）。日付はDBで計算した整数の due_day を使い、行ごとに解析しない
+        if task["due_day"]:
+            st.markdown(f"**期限:** {format_due_day(task['due_day'])}")
+            
+            # 期限が過ぎている場合は警告
+            if task["due_day"] < day_key(datetime.date.today()) and task["status"] != "completed":
+                st.warning("期限が過ぎています")
+        elif task["due_date"]:
+            # 日付として解釈できない値はそのまま表示
+            st.markdown(f"**期限:** {task['due_date']}")
+        
+        # アーカイブ済みのタスクは表示のみ
+        if task["archived"]:
+            st.caption("アーカイブ済みのタスクは変更できません")
+            return
         
         # アクションボタン
         col1, col2, col3 = st.columns([1, 1, 1])
@@ -193,27 +465,66 @@ def show_task_card(task):
                         status="completed"
                     )
                     if success:
-                        st.success(message)
-                        st.rerun()
+                        mark_task_card_changed(task["id"])
+                        acknowledge_own_changes()
+                        rerun_fragment()
+                    else:
+                        st.error(message)
         
         with col2:
             if st.button("編集", key=f"edit_{task['id']}"):
                 st.session_state.editing_task = task
-                st.rerun()
+                rerun_fragment()
         
         with col3:
             if st.button("削除", key=f"delete_{task['id']}"):
                 success, message = delete_task(task["id"], st.session_state.user_id)
                 if success:
-                    st.success(message)
-                    st.rerun()
+                    mark_task_card_changed(task["id"])
+                    acknowledge_own_changes()
+                    rerun_fragment()
+                else:
+                    st.error(message)
     
     # 編集中のタスクがこのタスクなら編集フォームを表示
     if hasattr(st.session_state, "editing_task") and st.session_state.editing_task["id"] == task["id"]:
         edit_task_form(task)
 
+def rerun_fragment():
+    """実行中のフラグメントだけを再実行する
+
+    フラグメント単体の再実行中でない場合（アプリ全体の実行中にボタンの操作を
+    処理した場合など）はアプリ全体を再実行する。
+    """
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def mark_task_card_changed(task_id):
+    """カードだけを再実行したときにタスクを読み直すよう記録する"""
+    st.session_state.setdefault("changed_task_cards", set()).add(task_id)
+
+def acknowledge_own_changes():
+    """このセッションがカードで行った変更で一覧を読み直さないよう、表示中の世代番号を進める
+
+    取り込むのは tasks の世代番号だけで、カテゴリが変わった場合はフィルターの
+    選択肢を更新するため一覧を読み直す。
+    """
+    shown = st.session_state.get("task_page_versions")
+    if shown is None:
+        return
+    current = get_task_versions(st.session_state.user_id)
+    st.session_state.task_page_versions = dataclasses.replace(shown, tasks=current.tasks)
+
 def edit_task_form(task):
     """タスク編集フォーム"""
+    # 一覧の行には説明が含まれないため、編集時に詳細を取得する
+    task = get_task(task["id"], st.session_state.user_id)
+    if task is None:
+        del st.session_state.editing_task
+        return
+    
     st.markdown("---")
     st.subheader(f"タスク編集: {task['title']}")
     
@@ -233,7 +544,7 @@ def edit_task_form(task):
                 index=status_index
             )
             
-            category = st.text_input("カテゴリ", value=task["category"] or "")
+            category = category_input(task["category"], key=f"edit_category_{task['id']}")
         
         with col2:
             priority_options = ["low", "medium", "high"]
@@ -284,16 +595,17 @@ def edit_task_form(task):
                     description,
                     status,
                     priority,
-                    category,
+                    category or "",  # 空にした場合はカテゴリなし
                     due_date_str
                 )
                 
                 if success:
-                    st.success(message)
                     # 編集モードを終了
                     if hasattr(st.session_state, "editing_task"):
                         del st.session_state.editing_task
-                    st.rerun()
+                    mark_task_card_changed(task["id"])
+                    acknowledge_own_changes()
+                    rerun_fragment()
                 else:
                     st.error(message)
         
@@ -301,12 +613,47 @@ def edit_task_form(task):
             # 編集モードを終了
             if hasattr(st.session_state, "editing_task"):
                 del st.session_state.editing_task
-            st.rerun()
+            rerun_fragment()
+
+def category_input(current=None, key=None):
+    """カテゴリの入力欄（よく使うカテゴリから選ぶか、新しいカテゴリを入力する）
 
-def show_task_stats():
-    """タスク統計情報の表示"""
-    stats = get_task_stats(st.session_state.user_id)
+    表記ゆれ（全角・半角、大文字・小文字など）は保存時に登録済みのカテゴリにまとめられる。
+
+    Args:
+        current: 初期値のカテゴリ
+        key: ウィジェットのキー
+
+    Returns:
+        入力されたカテゴリ（未入力なら None）
+    """
+    options = get_category_suggestions(st.session_state.user_id)
+    if current and current not in options:
+        options = [current] + options
+    return st.selectbox(
+        "カテゴリ",
+        options=options,
+        index=options.index(current) if current else None,
+        accept_new_options=True,
+        placeholder="選択または入力",
+        key=key
+    )
+
+@st.fragment(run_every=CHANGE_POLL_INTERVAL)
+def task_stats_section():
+    """統計情報（CHANGE_POLL_INTERVAL ごとに再実行し、統計の世代番号が進んだときだけ読み直す）
+
+    アーカイブ済みのタスクを数えるかは一覧と同じ条件にする。
+    """
+    include_archived = current_task_filters()["include_archived"]
+    show_task_stats(get_task_stats(st.session_state.user_id, include_archived=include_archived))
+
+def show_task_stats(stats):
+    """タスク統計情報の表示
     
+    Args:
+        stats: get_task_stats() 形式の統計情報
+    """
     st.subheader("タスク統計")
     
     total = stats.get('total', 0)
@@ -316,6 +663,20 @@ def show_task_stats():
     
     st.write(f"合計タスク数: {total}")
     
+    archived = stats.get('archived', 0)
+    if archived:
+        st.write(f"うちアーカイブ済み: {archived}")
+    
+    overdue = stats.get('overdue', 0)
+    if overdue:
+        st.write(f"期限切れ: {overdue}")
+    due_today = stats.get('due_today', 0)
+    if due_today:
+        st.write(f"今日が期限: {due_today}")
+    due_week = stats.get('due_week', 0)
+    if due_week:
+        st.write(f"7日以内が期限: {due_week}")
+    
     # ステータス別の統計
     status_stats = stats.get('status', {})
     st.write("ステータス別:")
@@ -337,6 +698,19 @@ def format_status(status):
     }
     return status_names.get(status, status)
 
+def format_due_filter(due):
+    """期限の絞り込みの表示名変換"""
+    due_names = {
+        "overdue": "期限切れ",
+        "today": "今日が期限",
+        "week": "7日以内が期限"
+    }
+    return due_names.get(due, due)
+
+def format_due_day(due_day):
+    """YYYYMMDD 形式の整数を表示用の日付文字列にする"""
+    return f"{due_day // 10000}/{due_day // 100 % 100:02d}/{due_day % 100:02d}"
+
 def format_priority(priority):
     """優先度の表示名変換"""
     priority_names = {
@@ -1,10 +1,197 @@
-from utils.db import get_connection
+import datetime
+import functools
+import json
+from dataclasses import dataclass
+from utils.db import db_connection, each_database, read_transaction, run_write
+from utils.cache import get_query_cache
+from utils.migrations import TASK_COUNTERS_SOURCE, category_key, intern_category
 import streamlit as st
 
-def add_task(user_id, title, description=None, status="not_started", 
-             priority="medium", category=None, due_date=None, test_mode=False):
+# タスクの状態と優先度の値
+TASK_STATUSES = ("not_started", "in_progress", "completed")
+TASK_PRIORITIES = ("low", "medium", "high")
+
+# 期限なしを末尾にするためのソートキー（インデックスの式と一致させること）
+DUE_NULLS_LAST = "CASE WHEN due_date IS NULL THEN 1 ELSE 0 END"
+
+# タスク一覧の並び順（期限なしを末尾、期限日昇順、作成日降順）
+TASK_ORDER = f"{DUE_NULLS_LAST}, due_date, created_at DESC, id DESC"
+
+# 期限での絞り込み（いずれも未完了のタスクが対象）
+#   overdue : 期限切れ（期限日が今日より前）
+#   today   : 今日が期限
+#   week    : 今日から7日以内（今日を含む）が期限
+DUE_FILTERS = ("overdue", "today", "week")
+
+# 「7日以内」に含める今日以降の日数
+DUE_WEEK_DAYS = 7
+
+# 1ページあたりのタスク数
+DEFAULT_PAGE_SIZE = 20
+
+# キーワード検索の最大件数
+SEARCH_LIMIT = 100
+
+# 入力補完に出すカテゴリの最大件数
+CATEGORY_SUGGESTION_LIMIT = 200
+
+# 更新・削除の対象がなかった（存在しないか他のユーザーのタスク）ときのメッセージ
+TASK_NOT_FOUND_MESSAGE = "タスクが見つかりません"
+
+# 一覧表示で取得する列（説明文は一覧では読まない）
+LIST_COLUMNS = "id, title, status, priority, category, due_date, due_day, created_at"
+
+# アーカイブ（tasks_archive）も含めて読むときの読み取り元。tasks と同じ名前で参照でき、
+# archived 列でアーカイブ済みかどうかが分かる。
+# 完了から日数の経ったタスクはアーカイブへ移される（tasks/archive.py）ため、
+# 通常の読み取りは tasks だけを対象にし、アーカイブは明示的に求められたときだけ読む。
+_SHARED_COLUMNS = (
+    "id, user_id, title, description, status, priority, category, category_id, due_date, due_day, "
+    "created_at, completed_at"
+)
+TASKS_WITH_ARCHIVE = (
+    f"(SELECT {_SHARED_COLUMNS}, 0 AS archived FROM tasks "
+    f"UNION ALL SELECT {_SHARED_COLUMNS}, 1 AS archived FROM tasks_archive) AS tasks"
+)
+
+class TaskSummary:
+    """タスク一覧用の軽量な行
+
+    一覧表示に必要な列だけを持つ。task["title"] のように sqlite3.Row と同じ形でも参照できる。
+    説明文などの詳細は get_task() で取得する。
+    """
+    __slots__ = (
+        "id", "title", "status", "priority", "category", "due_date", "due_day", "created_at",
+        "archived",
+    )
+
+    def __init__(self, id, title, status, priority, category, due_date, due_day, created_at,
+                 archived=0):
+        self.id = id
+        self.title = title
+        self.status = status
+        self.priority = priority
+        self.category = category
+        self.due_date = due_date
+        self.due_day = due_day
+        self.created_at = created_at
+        self.archived = archived
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def as_dict(self):
+        """列名をキーにした辞書に変換"""
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __repr__(self):
+        return f"TaskSummary(id={self.id!r}, title={self.title!r}, status={self.status!r})"
+
+def day_key(date):
+    """日付を due_day と同じ YYYYMMDD 形式の整数にする"""
+    return date.year * 10000 + date.month * 100 + date.day
+
+def _summary_factory(cursor, row):
+    """LIST_COLUMNS の行を TaskSummary に変換する row_factory"""
+    return TaskSummary(*row)
+
+def _list_source(include_archived):
+    """一覧の読み取り元（FROM 句）と取得する列"""
+    if include_archived:
+        return TASKS_WITH_ARCHIVE, f"{LIST_COLUMNS}, archived"
+    return "tasks", LIST_COLUMNS
+
+def _fetch_summaries(conn, query, params):
+    """一覧用クエリを実行して TaskSummary のリストを返す"""
+    cursor = conn.cursor()
+    cursor.row_factory = _summary_factory
+    return cursor.execute(query, params).fetchall()
+
+# 世代番号の種類と user_versions の列
+#   tasks      : タスクが変更されるたびに進む
+#   stats      : 統計が変わる変更（追加・削除、ステータス・優先度・期限の更新）で進む
+#   categories : カテゴリ一覧が変わりうる変更（カテゴリ付きの追加・削除、カテゴリの更新）で進む
+VERSION_SECTIONS = {
+    "tasks": "version",
+    "stats": "stats_version",
+    "categories": "categories_version",
+}
+
+@dataclass(frozen=True)
+class TaskVersions:
+    """ユーザーの世代番号（同じ時点で読んだもの）"""
+    tasks: int = 0
+    stats: int = 0
+    categories: int = 0
+
+    def changed_since(self, other):
+        """other から世代番号が変わった種類のタプル（other が None ならすべて）"""
+        return tuple(
+            section for section in VERSION_SECTIONS
+            if other is None or getattr(self, section) != getattr(other, section)
+        )
+
+def get_user_version(user_id, section="tasks"):
+    """ユーザーの世代番号を取得（変更されるたびに増える）
+
+    Args:
+        user_id: ユーザーID
+        section: 世代番号の種類（VERSION_SECTIONS のいずれか）
+    """
+    column = VERSION_SECTIONS[section]
+    with db_connection(user_id) as conn:
+        row = conn.execute(
+            f"SELECT {column} FROM user_versions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+    return row[0] if row else 0
+
+def get_task_versions(user_id):
+    """ユーザーのすべての種類の世代番号を主キーの1回の検索で取得
+
+    変更の有無を調べるだけなら、前回の値と比べて changed_since() を使う。
+
+    Args:
+        user_id: ユーザーID
+
+    Returns:
+        TaskVersions
+    """
+    with db_connection(user_id) as conn:
+        row = conn.execute(
+            "SELECT version, stats_version, categories_version FROM user_versions WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+    return TaskVersions(*row) if row else TaskVersions()
+
+def _user_cached(func=None, *, section="tasks"):
+    """user_id を第1引数に取る読み取り関数に、世代番号で検証するキャッシュを付ける
+
+    世代番号はタスクの追加・更新・削除時にトリガーで進むため、書き込み後の読み取りは
+    必ずDBから読み直される。世代番号と結果は同じスナップショットから読む。
+    @_user_cached(section="stats") のように種類を指定すると、その種類の世代番号が
+    進んだときだけ読み直す。
+    キャッシュを通さない関数は func.uncached で呼べる。
+    """
+    if func is None:
+        return functools.partial(_user_cached, section=section)
+
+    @functools.wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        # 期限切れの判定などが日付に依存するため日付もキーに含める
+        key = (func.__name__, user_id, args, tuple(sorted(kwargs.items())), datetime.date.today())
+        with read_transaction(user_id):
+            generation = get_user_version(user_id, section)
+            return get_query_cache().get_or_load(
+                key, generation, lambda: func(user_id, *args, **kwargs)
+            )
+
+    wrapper.uncached = func
+    return wrapper
+
+def add_task(user_id, title, description=None, status="not_started",
+             priority="medium", category=None, due_date=None):
     """新しいタスクを追加
-    
+
     Args:
         user_id: ユーザーID
         title: タスクのタイトル
@@ -13,45 +200,29 @@ def add_task(user_id, title, description=None, status="not_started",
         priority: 優先度
         category: カテゴリ
         due_date: 期限日
-        test_mode: テストモード（Trueの場合、DB接続を閉じない）
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute(
+    def insert(conn):
+        # カテゴリは登録済みの表記にそろえ、ID で参照する
+        category_id, category_name = intern_category(conn, user_id, category)
+        conn.execute(
             """
-            INSERT INTO tasks (user_id, title, description, status, priority, category, due_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO tasks (user_id, title, description, status, priority, category, category_id, due_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (user_id, title, description, status, priority, category, due_date)
+            (user_id, title, description, status, priority, category_name, category_id, due_date)
         )
-        conn.commit()
-        if not test_mode:
-            conn.close()
+
+    try:
+        run_write(insert, user_id)
         return True, "タスクが追加されました"
     except Exception as e:
-        if not test_mode:
-            conn.close()
         return False, f"タスク追加エラー: {str(e)}"
 
-def get_tasks(user_id, status=None, priority=None, category=None, test_mode=False):
-    """ユーザーのタスクを取得（フィルタリングも可能）
-    
-    Args:
-        user_id: ユーザーID
-        status: フィルター（タスクの状態）
-        priority: フィルター（優先度）
-        category: フィルター（カテゴリ）
-        test_mode: テストモード（Trueの場合、DB接続を閉じない）
-    """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT * FROM tasks WHERE user_id = ?"
+def _filter_clause(user_id, status=None, priority=None, category=None, due=None):
+    """ユーザーとフィルター条件から WHERE 句とパラメータを作成"""
+    query = "user_id = ?"
     params = [user_id]
-    
-    # フィルタリング条件を追加
+
     if status:
         query += " AND status = ?"
         params.append(status)
@@ -59,44 +230,258 @@ def get_tasks(user_id, status=None, priority=None, category=None, test_mode=Fals
         query += " AND priority = ?"
         params.append(priority)
     if category:
-        query += " AND category = ?"
-        params.append(category)
-    
+        # カテゴリ名は照合キーで categories から引き、整数の category_id で絞り込む
+        query += " AND category_id = (SELECT id FROM categories WHERE user_id = ? AND name_key = ?)"
+        params += [user_id, category_key(category)]
+    if due:
+        # 期限は整数の due_day で比較するため、インデックスで範囲検索できる
+        today = datetime.date.today()
+        if due == "overdue":
+            query += " AND due_day < ?"
+            params.append(day_key(today))
+        elif due == "today":
+            query += " AND due_day = ?"
+            params.append(day_key(today))
+        elif due == "week":
+            query += " AND due_day BETWEEN ? AND ?"
+            last_day = today + datetime.timedelta(days=DUE_WEEK_DAYS - 1)
+            params += [day_key(today), day_key(last_day)]
+        else:
+            raise ValueError(f"期限の絞り込みが不正です: {due}")
+        query += " AND status != 'completed'"
+
+    return query, params
+
+@_user_cached
+def get_tasks(user_id, status=None, priority=None, category=None, due=None,
+              include_archived=False):
+    """ユーザーのタスク一覧を取得（フィルタリングも可能）
+
+    説明文を含まない TaskSummary のリストを返す。
+
+    Args:
+        user_id: ユーザーID
+        status: フィルター（タスクの状態）
+        priority: フィルター（優先度）
+        category: フィルター（カテゴリ）
+        due: フィルター（期限、DUE_FILTERS のいずれか）
+        include_archived: アーカイブ済みのタスクも含めるか
+    """
+    where, params = _filter_clause(user_id, status, priority, category, due)
+    source, columns = _list_source(include_archived)
+
     # 期限日でソート
-    query += " ORDER BY CASE WHEN due_date IS NULL THEN 1 ELSE 0 END, due_date, created_at DESC"
-    
-    cursor.execute(query, params)
-    tasks = cursor.fetchall()
-    if not test_mode:
-        conn.close()
-    
+    query = f"SELECT {columns} FROM {source} WHERE {where} ORDER BY {TASK_ORDER}"
+
+    with db_connection(user_id) as conn:
+        return _fetch_summaries(conn, query, params)
+
+@_user_cached
+def get_tasks_page(user_id, status=None, priority=None, category=None, due=None,
+                   cursor=None, limit=DEFAULT_PAGE_SIZE, include_archived=False):
+    """ユーザーのタスクを1ページ分取得（キーセットページング）
+
+    並び順は get_tasks() と同じ。OFFSET を使わず前ページ末尾のキーから
+    インデックスを辿るため、後ろのページでも先頭ページと同じ速さで取得できる。
+
+    Args:
+        user_id: ユーザーID
+        status: フィルター（タスクの状態）
+        priority: フィルター（優先度）
+        category: フィルター（カテゴリ）
+        due: フィルター（期限、DUE_FILTERS のいずれか）
+        cursor: 前ページの戻り値の次ページカーソル（先頭ページは None）
+        limit: 1ページあたりの件数
+        include_archived: アーカイブ済みのタスクも含めるか
+
+    Returns:
+        (TaskSummary のリスト, 次ページのカーソル) のタプル。最終ページのカーソルは None
+    """
+    where, params = _filter_clause(user_id, status, priority, category, due)
+    source, columns = _list_source(include_archived)
+
+    # 並び順の区間ごとにインデックスの範囲検索を行い、件数が揃うまで順に読む
+    if cursor is None:
+        segments = [("", [], TASK_ORDER)]
+    else:
+        nulls_last, due_date, created_at, task_id = cursor
+        segments = [
+            # 同じ期限日の残り
+            (
+                f" AND {DUE_NULLS_LAST} = ? AND due_date IS ? AND (created_at, id) < (?, ?)",
+                [nulls_last, due_date, created_at, task_id],
+                "created_at DESC, id DESC",
+            ),
+        ]
+        if nulls_last == 0:
+            segments += [
+                # より後の期限日
+                (
+                    f" AND {DUE_NULLS_LAST} = ? AND due_date > ?",
+                    [0, due_date],
+                    "due_date, created_at DESC, id DESC",
+                ),
+                # 期限なし
+                (f" AND {DUE_NULLS_LAST} = ?", [1], "created_at DESC, id DESC"),
+            ]
+
+    tasks = []
+    with db_connection(user_id) as conn:
+        for condition, condition_params, order in segments:
+            # 次ページの有無を判定するため1件多く取得する
+            remaining = limit + 1 - len(tasks)
+            tasks += _fetch_summaries(
+                conn,
+                f"SELECT {columns} FROM {source} WHERE {where}{condition} ORDER BY {order} LIMIT ?",
+                params + condition_params + [remaining]
+            )
+            if len(tasks) > limit:
+                break
+
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        last = tasks[-1]
+        next_cursor = (
+            1 if last.due_date is None else 0,
+            last.due_date,
+            last.created_at,
+            last.id,
+        )
+
+    return tasks, next_cursor
+
+def _fts_phrase(term):
+    """検索語を FTS5 のフレーズとしてクォートする"""
+    return '"' + term.replace('"', '""') + '"'
+
+def _like_pattern(term):
+    """検索語を LIKE の部分一致パターンにする（ワイルドカードはエスケープ）"""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def _like_terms(terms):
+    """すべての語をタイトルか説明に含む条件（WHERE 句に AND で付け足す）とパラメータ"""
+    condition = ""
+    params = []
+    for term in terms:
+        condition += " AND (title LIKE ? ESCAPE '\\' OR description LIKE ? ESCAPE '\\')"
+        params += [_like_pattern(term)] * 2
+    return condition, params
+
+def search_tasks(user_id, query, status=None, priority=None, category=None,
+                 due=None, limit=SEARCH_LIMIT, include_archived=False):
+    """タイトルと説明をキーワード検索（関連度順）
+
+    空白区切りの語をすべて含むタスクを返す。3文字以上の語は全文検索インデックス
+    （trigram）で検索し、2文字以下の語はその結果を LIKE で絞り込む。
+    アーカイブ済みのタスクは全文検索インデックスに含まれないため、含める場合は
+    LIKE で探し、完了日時の新しい順に通常のタスクの後ろへ続ける。
+
+    Args:
+        user_id: ユーザーID
+        query: 検索キーワード
+        status: フィルター（タスクの状態）
+        priority: フィルター（優先度）
+        category: フィルター（カテゴリ）
+        due: フィルター（期限、DUE_FILTERS のいずれか）
+        limit: 最大件数
+        include_archived: アーカイブ済みのタスクも含めるか
+
+    Returns:
+        TaskSummary のリスト
+    """
+    terms = query.split()
+    if not terms:
+        return []
+
+    where, params = _filter_clause(user_id, status, priority, category, due)
+
+    # trigram で索引できない短い語は LIKE で絞り込む
+    short_condition, short_params = _like_terms([t for t in terms if len(t) < 3])
+
+    match_terms = [_fts_phrase(t) for t in terms if len(t) >= 3]
+    with db_connection(user_id) as conn:
+        if not match_terms:
+            tasks = _fetch_summaries(
+                conn,
+                f"SELECT {LIST_COLUMNS} FROM tasks WHERE {where}{short_condition} "
+                f"ORDER BY {TASK_ORDER} LIMIT ?",
+                params + short_params + [limit]
+            )
+        else:
+            tasks = _fetch_summaries(
+                conn,
+                f"""
+                SELECT {LIST_COLUMNS} FROM tasks
+                JOIN (
+                    SELECT rowid AS match_id, rank FROM tasks_fts WHERE tasks_fts MATCH ?
+                ) AS matches ON tasks.id = matches.match_id
+                WHERE {where}{short_condition}
+                ORDER BY matches.rank
+                LIMIT ?
+                """,
+                [" AND ".join(match_terms)] + params + short_params + [limit]
+            )
+
+        if include_archived and len(tasks) < limit:
+            condition, condition_params = _like_terms(terms)
+            tasks += _fetch_summaries(
+                conn,
+                f"SELECT {LIST_COLUMNS}, 1 FROM tasks_archive WHERE {where}{condition} "
+                "ORDER BY completed_at DESC LIMIT ?",
+                params + condition_params + [limit - len(tasks)]
+            )
+
     return tasks
 
-def get_task(task_id, user_id, test_mode=False):
+def rebuild_search_index():
+    """全文検索インデックスを tasks テーブルから作り直す（すべてのデータベース）"""
+    for conn in each_database():
+        conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+        conn.commit()
+
+def get_task(task_id, user_id, include_archived=False):
     """指定したタスクの詳細を取得
-    
+
+    archived 列でアーカイブ済みかどうかが分かる。
+
     Args:
         task_id: タスクID
         user_id: ユーザーID
-        test_mode: テストモード（Trueの場合、DB接続を閉じない）
+        include_archived: 見つからない場合にアーカイブからも探すか
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "SELECT * FROM tasks WHERE id = ? AND user_id = ?",
-        (task_id, user_id)
+    with db_connection(user_id) as conn:
+        task = conn.execute(
+            "SELECT *, 0 AS archived FROM tasks WHERE id = ? AND user_id = ?",
+            (task_id, user_id)
+        ).fetchone()
+        if task is None and include_archived:
+            task = conn.execute(
+                "SELECT *, 1 AS archived FROM tasks_archive WHERE id = ? AND user_id = ?",
+                (task_id, user_id)
+            ).fetchone()
+        return task
+
+class _TaskNotFound(Exception):
+    """書き込みの対象のタスクがなかった（送出するとその書き込みは取り消される）"""
+
+def _category_assignment(user_id, category):
+    """UPDATE の SET 句でカテゴリ名とIDを設定する式とパラメータ
+
+    intern_category() で登録した後に実行する。空のカテゴリはカテゴリなしになる。
+    """
+    key = category_key(category)
+    return (
+        "category = (SELECT name FROM categories WHERE user_id = ? AND name_key = ?), "
+        "category_id = (SELECT id FROM categories WHERE user_id = ? AND name_key = ?)",
+        [user_id, key, user_id, key]
     )
-    task = cursor.fetchone()
-    if not test_mode:
-        conn.close()
-    
-    return task
-
-def update_task(task_id, user_id, title=None, description=None, 
-                status=None, priority=None, category=None, due_date=None, test_mode=False):
+
+def update_task(task_id, user_id, title=None, description=None,
+                status=None, priority=None, category=None, due_date=None):
     """タスクを更新
-    
+
     Args:
         task_id: タスクID
         user_id: ユーザーID
@@ -106,15 +491,14 @@ def update_task(task_id, user_id, title=None, description=None,
         priority: 優先度
         category: カテゴリ
         due_date: 期限日
-        test_mode: テストモード（Trueの場合、DB接続を閉じない）
+
+    Returns:
+        (成功, メッセージ)。対象のタスクがなければ (False, TASK_NOT_FOUND_MESSAGE)
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
     # 更新するフィールドと値を準備
     update_fields = []
     params = []
-    
+
     if title is not None:
         update_fields.append("title = ?")
         params.append(title)
@@ -128,114 +512,346 @@ def update_task(task_id, user_id, title=None, description=None,
         update_fields.append("priority = ?")
         params.append(priority)
     if category is not None:
-        update_fields.append("category = ?")
-        params.append(category)
+        assignment, assignment_params = _category_assignment(user_id, category)
+        update_fields.append(assignment)
+        params += assignment_params
     if due_date is not None:
         update_fields.append("due_date = ?")
         params.append(due_date)
-    
+
     if not update_fields:
-        if not test_mode:
-            conn.close()
         return False, "更新するフィールドが指定されていません"
-    
+
     # クエリの作成
     query = f"UPDATE tasks SET {', '.join(update_fields)} WHERE id = ? AND user_id = ?"
     params.extend([task_id, user_id])
-    
+
+    def update(conn):
+        if category is not None:
+            intern_category(conn, user_id, category)
+        if conn.execute(query, params).rowcount == 0:
+            # 登録したカテゴリも取り消す
+            raise _TaskNotFound()
+
     try:
-        cursor.execute(query, params)
-        conn.commit()
-        if not test_mode:
-            conn.close()
+        run_write(update, user_id)
         return True, "タスクが更新されました"
+    except _TaskNotFound:
+        return False, TASK_NOT_FOUND_MESSAGE
     except Exception as e:
-        if not test_mode:
-            conn.close()
         return False, f"タスク更新エラー: {str(e)}"
 
-def delete_task(task_id, user_id, test_mode=False):
+def delete_task(task_id, user_id):
     """タスクを削除
-    
+
     Args:
         task_id: タスクID
         user_id: ユーザーID
-        test_mode: テストモード（Trueの場合、DB接続を閉じない）
+
+    Returns:
+        (成功, メッセージ)。対象のタスクがなければ (False, TASK_NOT_FOUND_MESSAGE)
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute(
-            "DELETE FROM tasks WHERE id = ? AND user_id = ?",
-            (task_id, user_id)
+        count = run_write(
+            lambda conn: conn.execute(
+                "DELETE FROM tasks WHERE id = ? AND user_id = ?",
+                (task_id, user_id)
+            ).rowcount,
+            user_id
         )
-        conn.commit()
-        if not test_mode:
-            conn.close()
+        if count == 0:
+            return False, TASK_NOT_FOUND_MESSAGE
         return True, "タスクが削除されました"
     except Exception as e:
-        if not test_mode:
-            conn.close()
         return False, f"タスク削除エラー: {str(e)}"
 
-def get_task_categories(user_id, test_mode=False):
-    """ユーザーが使用しているタスクのカテゴリ一覧を取得
-    
+# 一括更新で変更できる列
+BATCH_UPDATE_FIELDS = ("title", "description", "status", "priority", "category", "due_date")
+
+def update_tasks(user_id, task_ids, **fields):
+    """複数のタスクを1つのUPDATE文でまとめて更新
+
     Args:
         user_id: ユーザーID
-        test_mode: テストモード（Trueの場合、DB接続を閉じない）
+        task_ids: 更新するタスクIDのリスト
+        **fields: 更新する列と値（title, description, status, priority, category, due_date）
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "SELECT DISTINCT category FROM tasks WHERE user_id = ? AND category IS NOT NULL",
-        (user_id,)
+    unknown = set(fields) - set(BATCH_UPDATE_FIELDS)
+    if unknown:
+        return False, f"更新できないフィールドです: {', '.join(sorted(unknown))}"
+    if not fields:
+        return False, "更新するフィールドが指定されていません"
+    if not task_ids:
+        return False, "タスクが選択されていません"
+
+    assignments = []
+    params = []
+    for column, value in fields.items():
+        if column == "category":
+            assignment, assignment_params = _category_assignment(user_id, value)
+            assignments.append(assignment)
+            params += assignment_params
+        else:
+            assignments.append(f"{column} = ?")
+            params.append(value)
+    # IDの数に関係なくパラメータ1つで渡せるよう JSON 配列にする
+    query = (
+        f"UPDATE tasks SET {', '.join(assignments)} "
+        "WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))"
     )
-    categories = [row['category'] for row in cursor.fetchall()]
-    if not test_mode:
-        conn.close()
-    
-    return categories
+    params += [user_id, json.dumps(list(task_ids))]
+
+    def update(conn):
+        if "category" in fields:
+            intern_category(conn, user_id, fields["category"])
+        return conn.execute(query, params).rowcount
+
+    try:
+        count = run_write(update, user_id)
+        return True, f"{count}件のタスクが更新されました"
+    except Exception as e:
+        return False, f"タスク更新エラー: {str(e)}"
+
+def delete_tasks(user_id, task_ids):
+    """複数のタスクを1つのDELETE文でまとめて削除
+
+    Args:
+        user_id: ユーザーID
+        task_ids: 削除するタスクIDのリスト
+    """
+    if not task_ids:
+        return False, "タスクが選択されていません"
+
+    try:
+        count = run_write(
+            lambda conn: conn.execute(
+                "DELETE FROM tasks WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))",
+                (user_id, json.dumps(list(task_ids)))
+            ).rowcount,
+            user_id
+        )
+        return True, f"{count}件のタスクが削除されました"
+    except Exception as e:
+        return False, f"タスク削除エラー: {str(e)}"
+
+@_user_cached(section="categories")
+def get_task_categories(user_id, include_archived=False):
+    """ユーザーが使用しているタスクのカテゴリ一覧を名前順で取得
+
+    categories の使用数を見るだけなので、タスク数ではなくカテゴリ数に比例した時間で返る。
 
-def get_task_stats(user_id, test_mode=False):
+    Args:
+        user_id: ユーザーID
+        include_archived: アーカイブ済みのタスクのカテゴリも含めるか
+    """
+    used = "usage_count > 0 OR archived_count > 0" if include_archived else "usage_count > 0"
+    with db_connection(user_id) as conn:
+        rows = conn.execute(
+            f"SELECT name FROM categories WHERE user_id = ? AND ({used}) ORDER BY name",
+            (user_id,)
+        ).fetchall()
+
+    return [row['name'] for row in rows]
+
+@_user_cached(section="categories")
+def get_category_suggestions(user_id, limit=CATEGORY_SUGGESTION_LIMIT):
+    """入力補完に使うカテゴリ名を、よく使われている順に取得
+
+    Args:
+        user_id: ユーザーID
+        limit: 最大件数
+    """
+    with db_connection(user_id) as conn:
+        rows = conn.execute(
+            """
+            SELECT name FROM categories
+            WHERE user_id = ? AND usage_count + archived_count > 0
+            ORDER BY usage_count DESC, archived_count DESC, name
+            LIMIT ?
+            """,
+            (user_id, limit)
+        ).fetchall()
+
+    return [row['name'] for row in rows]
+
+@_user_cached(section="stats")
+def get_task_stats(user_id, include_archived=False):
     """ユーザーのタスク統計情報を取得
-    
+
+    トリガーで更新される task_counters を読むだけなので、タスク数に関係なく一定の速さで返る。
+    アーカイブ済みのタスクは含めたときだけ tasks_archive を集計して加える。
+
     Args:
         user_id: ユーザーID
-        test_mode: テストモード（Trueの場合、DB接続を閉じない）
+        include_archived: アーカイブ済みのタスクも数えるか
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # ステータス別のタスク数
-    cursor.execute(
-        """
-        SELECT status, COUNT(*) as count FROM tasks 
-        WHERE user_id = ? 
-        GROUP BY status
-        """,
-        (user_id,)
-    )
-    status_counts = {row['status']: row['count'] for row in cursor.fetchall()}
-    
-    # 優先度別のタスク数
-    cursor.execute(
-        """
-        SELECT priority, COUNT(*) as count FROM tasks 
-        WHERE user_id = ? 
-        GROUP BY priority
-        """,
-        (user_id,)
-    )
-    priority_counts = {row['priority']: row['count'] for row in cursor.fetchall()}
-    
-    if not test_mode:
-        conn.close()
-    
-    return {
-        'status': status_counts,
-        'priority': priority_counts,
-        'total': sum(status_counts.values())
+    with db_connection(user_id) as conn:
+        rows = conn.execute(
+            """
+            SELECT kind, key, count FROM task_counters
+            WHERE user_id = ? AND kind IN ('total', 'status', 'priority') AND count > 0
+            """,
+            (user_id,)
+        ).fetchall()
+
+        # 未完了タスクの期限別の件数（期限切れ・今日・7日以内）
+        # open_due のキーは期限での絞り込みと同じ due_day（YYYYMMDD、8桁の文字列なので文字列で比べる）
+        today = datetime.date.today()
+        last_day = today + datetime.timedelta(days=DUE_WEEK_DAYS - 1)
+        overdue, due_today, due_week = conn.execute(
+            """
+            SELECT
+                IFNULL(SUM(CASE WHEN key < :today THEN count END), 0),
+                IFNULL(SUM(CASE WHEN key = :today THEN count END), 0),
+                IFNULL(SUM(CASE WHEN key >= :today THEN count END), 0)
+            FROM task_counters
+            WHERE user_id = :user_id AND kind = 'open_due' AND key <= :last_day
+            """,
+            {"user_id": user_id, "today": str(day_key(today)), "last_day": str(day_key(last_day))}
+        ).fetchone()
+
+        archived_rows = []
+        if include_archived:
+            archived_rows = conn.execute(
+                """
+                SELECT priority, COUNT(*) AS count FROM tasks_archive
+                WHERE user_id = ? GROUP BY priority
+                """,
+                (user_id,)
+            ).fetchall()
+
+    counts = {'total': {}, 'status': {}, 'priority': {}}
+    for row in rows:
+        # NULL は空文字のキーで数えている
+        counts[row['kind']][row['key'] or None] = row['count']
+
+    if include_archived:
+        # アーカイブされるのは完了済みのタスクだけ
+        archived = sum(row['count'] for row in archived_rows)
+        for row in archived_rows:
+            counts['priority'][row['priority']] = counts['priority'].get(row['priority'], 0) + row['count']
+        if archived:
+            counts['status']['completed'] = counts['status'].get('completed', 0) + archived
+        counts['total'][None] = counts['total'].get(None, 0) + archived
+
+    stats = {
+        'status': counts['status'],
+        'priority': counts['priority'],
+        'total': counts['total'].get(None, 0),
+        'overdue': overdue,
+        'due_today': due_today,
+        'due_week': due_week
     }
+    if include_archived:
+        stats['archived'] = archived
+    return stats
+
+@dataclass(frozen=True)
+class TaskPageData:
+    """タスク一覧1回分の描画データ（同じスナップショットから読んだもの）
+
+    統計は含めない。サイドバーの統計は統計の世代番号で別に更新するため、
+    get_task_stats() で取得する（同じ時点の値が必要なら read_transaction() の中で呼ぶ）。
+    """
+    categories: tuple
+    tasks: tuple
+    next_cursor: tuple
+    versions: TaskVersions
+
+def load_task_page(user_id, status=None, priority=None, category=None, due=None, query=None,
+                   cursor=None, limit=DEFAULT_PAGE_SIZE, include_archived=False):
+    """カテゴリ一覧・タスク一覧の1ページ・世代番号をまとめて取得
+
+    1つの接続の1つの読み取りトランザクションで読むため、結果は互いに一致する。
+
+    Args:
+        user_id: ユーザーID
+        status: フィルター（タスクの状態）
+        priority: フィルター（優先度）
+        category: フィルター（カテゴリ）
+        due: フィルター（期限、DUE_FILTERS のいずれか）
+        query: キーワード検索（指定時は関連度順の検索結果、ページングなし）
+        cursor: 次ページカーソル（先頭ページは None）
+        limit: 1ページあたりの件数
+        include_archived: アーカイブ済みのタスクも含めるか
+
+    Returns:
+        TaskPageData
+    """
+    with read_transaction(user_id):
+        categories = get_task_categories(user_id, include_archived=include_archived)
+        if query:
+            tasks = search_tasks(
+                user_id, query, status, priority, category, due,
+                include_archived=include_archived
+            )
+            next_cursor = None
+        else:
+            tasks, next_cursor = get_tasks_page(
+                user_id, status, priority, category, due, cursor=cursor, limit=limit,
+                include_archived=include_archived
+            )
+        versions = get_task_versions(user_id)
+
+    return TaskPageData(
+        categories=tuple(categories),
+        tasks=tuple(tasks),
+        next_cursor=next_cursor,
+        versions=versions
+    )
+
+def check_task_counters(user_id=None, repair=False):
+    """task_counters を tasks テーブルから集計し直して食い違いを調べる
+
+    Args:
+        user_id: 対象ユーザーID（省略時は全ユーザー）
+        repair: True の場合、食い違いのあったユーザーのカウンターを作り直す
+
+    Returns:
+        食い違いのリスト [(user_id, kind, key, 正しい件数, 記録されている件数), ...]
+    """
+    user_filter = "" if user_id is None else "WHERE user_id = ?"
+    params = [] if user_id is None else [user_id]
+
+    # シャード構成ではデータベースごとに調べる
+    drift = []
+    for conn in each_database(user_id):
+        # 集計とカウンターの読み取りを同じスナップショットで行う
+        conn.execute("BEGIN")
+        expected = {
+            (row['user_id'], row['kind'], row['key']): row['count']
+            for row in conn.execute(
+                f"SELECT * FROM ({TASK_COUNTERS_SOURCE}) {user_filter}", params
+            )
+        }
+        actual = {
+            (row['user_id'], row['kind'], row['key']): row['count']
+            for row in conn.execute(
+                f"SELECT * FROM task_counters {user_filter}", params
+            )
+            if row['count'] != 0
+        }
+        conn.rollback()
+
+        database_drift = [
+            key + (expected.get(key, 0), actual.get(key, 0))
+            for key in sorted(expected.keys() | actual.keys())
+            if expected.get(key, 0) != actual.get(key, 0)
+        ]
+        drift += database_drift
+
+        if repair and database_drift:
+            users = sorted({d[0] for d in database_drift})
+            placeholders = ", ".join("?" * len(users))
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"DELETE FROM task_counters WHERE user_id IN ({placeholders})", users)
+            conn.execute(
+                f"""
+                INSERT INTO task_counters (user_id, kind, key, count)
+                SELECT * FROM ({TASK_COUNTERS_SOURCE}) WHERE user_id IN ({placeholders})
+                """,
+                users
+            )
+            conn.commit()
+
+    return drift
@@ -0,0 +1,282 @@
+import csv
+import datetime
+import io
+import json
+import tempfile
+from dataclasses import dataclass
+from utils.db import detached_connection, run_write
+from tasks.task_manager import TASK_STATUSES, TASK_PRIORITIES, intern_category
+
+# インポート・エクスポートで扱う列
+TRANSFER_FIELDS = ("title", "description", "status", "priority", "category", "due_date", "created_at")
+
+# 対応するファイル形式
+TRANSFER_FORMATS = ("csv", "jsonl")
+
+# 1トランザクションで登録する行数
+IMPORT_CHUNK_SIZE = 1000
+
+# エクスポート時に一度に読み込む行数
+EXPORT_FETCH_SIZE = 1000
+
+# インポート結果に保持するエラーの最大件数
+MAX_REPORTED_ERRORS = 100
+
+# エクスポートのファイルをメモリに置く最大バイト数（超えたら一時ファイルに書く）
+EXPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+@dataclass(frozen=True)
+class RecordError:
+    """読み込めなかった行（iter_records() がレコードの代わりに返す）"""
+    message: str
+
+class ImportResult:
+    """インポート結果"""
+
+    def __init__(self):
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []  # [(行番号, メッセージ), ...]（最大 MAX_REPORTED_ERRORS 件）
+
+    def add_error(self, line_no, message):
+        """エラーを記録"""
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_no, message))
+
+def _text_stream(stream):
+    """バイナリストリームならUTF-8（BOM付き可）のテキストストリームに変換"""
+    if isinstance(stream.read(0), bytes):
+        return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    return stream
+
+def iter_records(stream, fmt):
+    """ファイルを1行ずつ読み、(行番号, 辞書または RecordError) を返す
+
+    Args:
+        stream: 読み込むファイル（テキスト・バイナリどちらでも可）
+        fmt: "csv" または "jsonl"
+    """
+    stream = _text_stream(stream)
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, RecordError(f"JSONの形式が正しくありません: {e}")
+                continue
+            if not isinstance(record, dict):
+                yield line_no, RecordError("JSONオブジェクトではありません")
+                continue
+            yield line_no, record
+    else:
+        raise ValueError(f"未対応の形式です: {fmt}")
+
+def parse_due_date(text):
+    """期限日の文字列を YYYY-MM-DD の形に揃える（日付として読めなければ ValueError）"""
+    return datetime.date.fromisoformat(text).isoformat()
+
+def validate_record(record):
+    """1件分のレコードを検証して INSERT 用の値に変換
+
+    Returns:
+        (値のタプル, None) または (None, エラーメッセージ)
+    """
+    def text(key):
+        value = record.get(key)
+        if value is None:
+            return None
+        value = str(value).strip()
+        return value or None
+
+    title = text("title")
+    if not title:
+        return None, "タイトルは必須です"
+
+    status = text("status") or "not_started"
+    if status not in TASK_STATUSES:
+        return None, f"ステータスが不正です: {status}"
+
+    priority = text("priority") or "medium"
+    if priority not in TASK_PRIORITIES:
+        return None, f"優先度が不正です: {priority}"
+
+    due_date = text("due_date")
+    if due_date:
+        try:
+            due_date = parse_due_date(due_date)
+        except ValueError:
+            return None, f"期限日の形式が正しくありません: {due_date}"
+
+    created_at = text("created_at")
+    if created_at:
+        try:
+            created_at = datetime.datetime.fromisoformat(created_at).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None, f"作成日時の形式が正しくありません: {created_at}"
+
+    return (title, text("description"), status, priority, text("category"), due_date, created_at), None
+
+def _insert_chunk(user_id, rows):
+    """検証済みの行を1つの書き込みとしてまとめて登録"""
+    def insert(conn):
+        # カテゴリはチャンク内の種類ごとに1回だけ登録する
+        categories = {}
+        values = []
+        for title, description, status, priority, category, due_date, created_at in rows:
+            if category not in categories:
+                categories[category] = intern_category(conn, user_id, category)
+            category_id, category_name = categories[category]
+            values.append((
+                user_id, title, description, status, priority, category_name, category_id,
+                due_date, created_at
+            ))
+        conn.executemany(
+            """
+            INSERT INTO tasks (user_id, title, description, status, priority, category, category_id,
+                               due_date, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, IFNULL(?, CURRENT_TIMESTAMP))
+            """,
+            values
+        )
+
+    run_write(insert, user_id)
+
+def import_tasks(user_id, stream, fmt="csv", chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """ファイルからタスクを一括登録
+
+    ファイルは1行ずつ読み、chunk_size 件ごとに1トランザクションで登録するため、
+    ファイルの大きさに関係なく使用メモリは一定。不正な行は飛ばしてエラーとして記録する。
+
+    Args:
+        user_id: 登録先のユーザーID
+        stream: 読み込むファイル（テキスト・バイナリどちらでも可）
+        fmt: "csv" または "jsonl"
+        chunk_size: 1トランザクションで登録する件数
+        progress: 進捗の通知先 progress(登録件数, エラー件数)（省略可）
+
+    Returns:
+        ImportResult
+    """
+    return import_records(user_id, iter_records(stream, fmt), chunk_size, progress)
+
+def import_records(user_id, records, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """(番号, 辞書) の組を検証してタスクを一括登録
+
+    Args:
+        user_id: 登録先のユーザーID
+        records: (行番号, 辞書または RecordError) のイテラブル。辞書以外の値は
+            「JSONオブジェクトではありません」のエラーになる
+        chunk_size: 1トランザクションで登録する件数
+        progress: 進捗の通知先 progress(登録件数, エラー件数)（省略可）
+
+    Returns:
+        ImportResult
+    """
+    result = ImportResult()
+    chunk = []
+
+    for line_no, record in records:
+        if isinstance(record, RecordError):
+            result.add_error(line_no, record.message)
+            continue
+        if not isinstance(record, dict):
+            result.add_error(line_no, "JSONオブジェクトではありません")
+            continue
+        values, error = validate_record(record)
+        if error:
+            result.add_error(line_no, error)
+            continue
+
+        chunk.append(values)
+        if len(chunk) >= chunk_size:
+            _insert_chunk(user_id, chunk)
+            result.imported += len(chunk)
+            chunk = []
+            if progress:
+                progress(result.imported, result.error_count)
+
+    if chunk:
+        _insert_chunk(user_id, chunk)
+        result.imported += len(chunk)
+    if progress:
+        progress(result.imported, result.error_count)
+
+    return result
+
+def iter_task_records(user_id):
+    """ユーザーの全タスク（アーカイブ済みを含む）を1件ずつ辞書で返す（fetchall せず少しずつ読む）
+
+    Args:
+        user_id: ユーザーID
+    """
+    columns = ", ".join(TRANSFER_FIELDS)
+    # 読み出し中は呼び出し元に制御が戻るため、スレッドに結び付けない接続を使う
+    with detached_connection(user_id) as conn:
+        conn.execute("BEGIN")
+        cursor = conn.execute(
+            f"""
+            SELECT {columns} FROM (
+                SELECT id, {columns} FROM tasks WHERE user_id = :user_id
+                UNION ALL
+                SELECT id, {columns} FROM tasks_archive WHERE user_id = :user_id
+            )
+            ORDER BY id
+            """,
+            {"user_id": user_id}
+        )
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(TRANSFER_FIELDS, row))
+
+def export_tasks(user_id, fmt="csv"):
+    """ユーザーの全タスクをファイルの内容として1行ずつ返すジェネレーター
+
+    Args:
+        user_id: ユーザーID
+        fmt: "csv" または "jsonl"
+    """
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=TRANSFER_FIELDS)
+        writer.writeheader()
+        for record in iter_task_records(user_id):
+            writer.writerow(record)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    elif fmt == "jsonl":
+        for record in iter_task_records(user_id):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+    else:
+        raise ValueError(f"未対応の形式です: {fmt}")
+
+def export_file(user_id, fmt="csv"):
+    """ユーザーの全タスクを書き出したファイル（UTF-8、先頭に戻してある）を返す
+
+    EXPORT_SPOOL_SIZE を超えるとメモリではなく一時ファイルに書く。
+    閉じると一時ファイルも削除される。
+
+    Args:
+        user_id: ユーザーID
+        fmt: "csv" または "jsonl"
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    try:
+        for chunk in export_tasks(user_id, fmt):
+            file.write(chunk.encode("utf-8"))
+        file.seek(0)
+    except BaseException:
+        file.close()
+        raise
+    return file
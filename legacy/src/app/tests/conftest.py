@@ -0,0 +1,35 @@
+import logging
+import sys
+from pathlib import Path
+import pytest
+
+# テストの共通設定
+#
+# アプリのモジュールは legacy/src/app をルートとして import する（アプリの実行時と同じ）。
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# スクリプト外で Streamlit の API を呼んだときの警告を抑止
+for _logger in ("streamlit.runtime.scriptrunner_utils.script_run_context",
+                "streamlit.runtime.state.session_state_proxy",
+                "streamlit.runtime.caching.cache_data_api"):
+    logging.getLogger(_logger).setLevel(logging.ERROR)
+
+# アプリのモジュールは sys.path を設定した後に読み込む
+from utils import db
+from utils.cache import get_query_cache
+
+@pytest.fixture
+def memory_db(tmp_path, monkeypatch):
+    """アプリと同じ経路（db_connection() / run_write() など）で使うメモリ上のDB
+
+    STORAGE_BACKEND=memory（MemoryBackend）にして、マイグレーションまで済ませる。
+    名前はテストごとに別にするため tmp_path を使う（ファイルは作られない）。
+    """
+    monkeypatch.setattr(db, "STORAGE_BACKEND", "memory")
+    monkeypatch.setenv("TASKMANAGER_DB", str(tmp_path / "app.db"))
+    # 別のDBで読んだ結果を使わないよう、プロセス内のキャッシュも空にする
+    get_query_cache().clear()
+    db.startup()
+    yield db.get_storage()
+    db.close_pools()
@@ -0,0 +1,201 @@
+import http.client
+import json
+import threading
+import pytest
+from api.server import MAX_TASK_ID, encode_cursor, make_server
+from tasks.task_manager import TASK_NOT_FOUND_MESSAGE
+
+# JSON API（api/server.py）の確認
+#
+# メモリ上のDBに対して空いているポートでサーバーを起動し、http.client で呼び出す。
+
+PASSWORD = "secret-password"
+
+@pytest.fixture
+def server(memory_db):
+    server = make_server("127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join(5)
+
+class Client:
+    def __init__(self, server, token=None):
+        self.port = server.server_address[1]
+        self.token = token
+
+    def request(self, method, path, body=None, headers=None, raw=None):
+        """(ステータス, JSON) を返す（raw を指定するとボディをそのまま送る）"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        try:
+            headers = dict(headers or {})
+            if self.token:
+                headers["Authorization"] = f"Bearer {self.token}"
+            payload = raw if raw is not None else (None if body is None else json.dumps(body))
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            conn.close()
+
+    def get(self, path):
+        return self.request("GET", path)
+
+    def post(self, path, body=None):
+        return self.request("POST", path, body if body is not None else {})
+
+    def patch(self, path, body):
+        return self.request("PATCH", path, body)
+
+    def delete(self, path):
+        return self.request("DELETE", path)
+
+def _login(server, username):
+    client = Client(server)
+    assert client.post("/api/register", {"username": username, "password": PASSWORD})[0] == 200
+    status, body = client.post("/api/login", {"username": username, "password": PASSWORD})
+    assert status == 200 and body["user"]["username"] == username
+    return Client(server, body["token"])
+
+@pytest.fixture
+def client(server):
+    return _login(server, "alice")
+
+def _add(client, **fields):
+    status, body = client.post("/api/tasks", {"title": "タスク", **fields})
+    assert status == 200, body
+    tasks = client.get("/api/tasks?limit=100")[1]["tasks"]
+    return max(task["id"] for task in tasks)
+
+def test_requires_token(server):
+    anonymous = Client(server)
+    assert anonymous.get("/api/tasks")[0] == 401
+    assert Client(server, "not-a-token").get("/api/tasks")[0] == 401
+
+def test_login_rejects_wrong_password(server):
+    _login(server, "alice")
+    status, body = Client(server).post("/api/login", {"username": "alice", "password": "wrong"})
+    assert status == 401 and body["error"]
+
+def test_logout_revokes_only_that_token(server, client):
+    other = Client(server, Client(server).post(
+        "/api/login", {"username": "alice", "password": PASSWORD}
+    )[1]["token"])
+    assert client.post("/api/logout")[0] == 200
+    assert client.get("/api/tasks")[0] == 401
+    assert other.get("/api/tasks")[0] == 200
+
+def test_crud(client):
+    task_id = _add(client, description="説明", priority="high", category="仕事", due_date="2024-01-10")
+    status, task = client.get(f"/api/tasks/{task_id}")
+    assert status == 200
+    assert (task["title"], task["priority"], task["category"], task["due_date"]) == (
+        "タスク", "high", "仕事", "2024-01-10"
+    )
+
+    assert client.patch(f"/api/tasks/{task_id}", {"status": "completed", "title": "完了"})[0] == 200
+    task = client.get(f"/api/tasks/{task_id}")[1]
+    assert (task["title"], task["status"]) == ("完了", "completed")
+    assert client.get("/api/stats")[1]["total"] == 1
+    assert client.get("/api/categories")[1] == {"categories": ["仕事"]}
+
+    assert client.delete(f"/api/tasks/{task_id}")[0] == 200
+    assert client.get(f"/api/tasks/{task_id}")[0] == 404
+    assert client.get("/api/tasks")[1] == {"tasks": [], "next_cursor": None}
+
+def test_batch_operations(client):
+    status, body = client.post("/api/tasks/batch", {"tasks": [
+        {"title": "a"}, {"title": "b", "due_date": "2024-02-01"}, "oops", {"status": "completed"},
+    ]})
+    assert status == 200
+    assert body["imported"] == 2
+    # 送られた文字列をそのままエラーメッセージとして返さない
+    assert body["errors"] == [
+        {"index": 2, "message": "JSONオブジェクトではありません"},
+        {"index": 3, "message": "タイトルは必須です"},
+    ]
+    ids = [task["id"] for task in client.get("/api/tasks")[1]["tasks"]]
+    assert client.post("/api/tasks/batch-update", {"ids": ids, "fields": {"priority": "low"}})[0] == 200
+    assert {task["priority"] for task in client.get("/api/tasks")[1]["tasks"]} == {"low"}
+    assert client.post("/api/tasks/batch-delete", {"ids": ids})[0] == 200
+    assert client.get("/api/tasks")[1]["tasks"] == []
+
+@pytest.mark.parametrize("task_id", ["999", str(MAX_TASK_ID + 1), "99999999999999999999999", "0"])
+def test_missing_task_is_404(client, task_id):
+    for status, body in (
+        client.get(f"/api/tasks/{task_id}"),
+        client.patch(f"/api/tasks/{task_id}", {"title": "x"}),
+        client.delete(f"/api/tasks/{task_id}"),
+    ):
+        assert (status, body) == (404, {"error": TASK_NOT_FOUND_MESSAGE})
+
+def test_other_users_task_is_404(server, client):
+    task_id = _add(client)
+    bob = _login(server, "bob")
+    assert bob.get(f"/api/tasks/{task_id}")[0] == 404
+    assert bob.patch(f"/api/tasks/{task_id}", {"title": "奪う"})[0] == 404
+    assert bob.delete(f"/api/tasks/{task_id}")[0] == 404
+    assert client.get(f"/api/tasks/{task_id}")[1]["title"] == "タスク"
+
+def test_cursor_round_trip(client):
+    client.post("/api/tasks/batch", {"tasks": [
+        {"title": f"t{n}", "due_date": f"2024-01-{n % 3 + 1:02d}" if n % 2 else None} for n in range(7)
+    ]})
+    seen, cursor = [], None
+    while True:
+        path = "/api/tasks?limit=3" + (f"&cursor={cursor}" if cursor else "")
+        status, body = client.get(path)
+        assert status == 200
+        seen += [task["id"] for task in body["tasks"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 7
+    assert seen == [task["id"] for task in client.get("/api/tasks?limit=100")[1]["tasks"]]
+
+@pytest.mark.parametrize("cursor", [
+    "not-base64!",
+    encode_cursor([0, "2024-01-01", "2024-01-01 00:00:00"]),
+    encode_cursor([True, None, "2024-01-01 00:00:00", 1]),
+    encode_cursor([0, "2024-01-01", "2024-01-01 00:00:00", MAX_TASK_ID + 1]),
+])
+def test_invalid_cursor_is_400(client, cursor):
+    assert client.get(f"/api/tasks?cursor={cursor}")[0] == 400
+
+@pytest.mark.parametrize("body", [
+    {"title": "x", "due_date": "not a date"},
+    {"title": "x", "due_date": "2024-02-30"},
+    {"title": "x", "status": "done"},
+    {"title": "x", "priority": 1},
+    {"title": "x", "owner": "bob"},
+    {"title": ""},
+    ["title"],
+])
+def test_invalid_task_fields_are_400(client, body):
+    assert client.post("/api/tasks", body)[0] == 400
+    assert client.get("/api/tasks")[1]["tasks"] == []
+
+def test_invalid_update_fields_are_400(client):
+    task_id = _add(client, due_date="2024-01-10")
+    assert client.patch(f"/api/tasks/{task_id}", {"due_date": "tomorrow"})[0] == 400
+    assert client.get(f"/api/tasks/{task_id}")[1]["due_date"] == "2024-01-10"
+    # 日付は YYYY-MM-DD に揃えて保存する
+    assert client.patch(f"/api/tasks/{task_id}", {"due_date": "20240215"})[0] == 200
+    assert client.get(f"/api/tasks/{task_id}")[1]["due_date"] == "2024-02-15"
+
+@pytest.mark.parametrize("ids", [[1, True], [1, "2"], [1.0], [MAX_TASK_ID + 1], "1"])
+def test_invalid_ids_are_400(client, ids):
+    task_id = _add(client)
+    assert client.post("/api/tasks/batch-delete", {"ids": ids})[0] == 400
+    assert client.get(f"/api/tasks/{task_id}")[0] == 200
+
+def test_invalid_bodies(client):
+    assert client.request("POST", "/api/tasks", raw="{broken")[0] == 400
+    assert client.request(
+        "POST", "/api/tasks", raw="{}", headers={"Content-Length": "abc"}
+    )[0] == 400
+    assert client.request("POST", "/api/logout", raw=b"", headers={"Transfer-Encoding": "chunked"})[0] == 411
+    assert client.get("/api/nowhere")[0] == 404
+    assert client.delete("/api/tasks")[0] == 405
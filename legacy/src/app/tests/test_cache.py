@@ -0,0 +1,90 @@
+from utils.cache import QueryCache, get_query_cache
+from utils.db import db_connection
+from tasks import task_manager
+
+# 読み取りキャッシュ（utils/cache.py）と世代番号による無効化の確認
+#
+# TTL は QueryCache に渡す clock で進める（実時間は待たない）。
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class Loader:
+    """呼ばれた回数を数えて、回数を値として返す読み込み関数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+def test_same_generation_is_served_from_cache():
+    cache, load = QueryCache(), Loader()
+    assert cache.get_or_load("key", 1, load) == 1
+    assert cache.get_or_load("key", 1, load) == 1
+    assert load.calls == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_new_generation_reloads():
+    cache, load = QueryCache(), Loader()
+    cache.get_or_load("key", 1, load)
+    assert cache.get_or_load("key", 2, load) == 2
+    # 古い世代番号で読んでも新しい値を返したりはしない（読み直して置き換える）
+    assert cache.get_or_load("key", 1, load) == 3
+    assert cache.stats()["entries"] == 1
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache, load = QueryCache(ttl=10, clock=clock), Loader()
+    cache.get_or_load("key", 1, load)
+    clock.now = 9.9
+    assert cache.get_or_load("key", 1, load) == 1
+    clock.now = 10.0
+    assert cache.get_or_load("key", 1, load) == 2
+    assert cache.stats()["expirations"] == 1
+
+def test_least_recently_used_entry_is_evicted():
+    cache, load = QueryCache(max_entries=2), Loader()
+    cache.get_or_load("a", 1, load)
+    cache.get_or_load("b", 1, load)
+    cache.get_or_load("a", 1, load)  # a を使ったので b が最も古くなる
+    cache.get_or_load("c", 1, load)
+    assert cache.stats()["evictions"] == 1
+    calls = load.calls
+    cache.get_or_load("a", 1, load)
+    assert load.calls == calls
+    cache.get_or_load("b", 1, load)
+    assert load.calls == calls + 1
+
+def test_writes_invalidate_only_their_sections(memory_db):
+    with db_connection() as conn:
+        user_id = conn.execute("INSERT INTO users (username, password) VALUES ('u', 'x')").lastrowid
+        conn.commit()
+    task_manager.add_task(user_id, "最初のタスク", category="仕事")
+    assert len(task_manager.get_tasks(user_id)) == 1
+    stats = task_manager.get_task_stats(user_id)
+    categories = task_manager.get_task_categories(user_id)
+    misses = get_query_cache().stats()["misses"]
+
+    # 読み直さずに同じ結果を返す
+    assert len(task_manager.get_tasks(user_id)) == 1
+    assert task_manager.get_task_stats(user_id) is stats
+    assert get_query_cache().stats()["misses"] == misses
+
+    # タイトルの変更は一覧だけを無効にする
+    task_id = task_manager.get_tasks(user_id)[0]["id"]
+    task_manager.update_task(task_id, user_id, title="変更後")
+    assert task_manager.get_tasks(user_id)[0]["title"] == "変更後"
+    assert task_manager.get_task_stats(user_id) is stats
+    assert task_manager.get_task_categories(user_id) is categories
+
+    # 追加は一覧・統計・（新しいカテゴリなら）カテゴリを無効にする
+    task_manager.add_task(user_id, "次のタスク", category="家事")
+    assert len(task_manager.get_tasks(user_id)) == 2
+    assert task_manager.get_task_stats(user_id)["total"] == 2
+    assert sorted(task_manager.get_task_categories(user_id)) == ["仕事", "家事"]
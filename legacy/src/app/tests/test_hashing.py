@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+from auth import auth
+from auth.hashing import HashingOverloaded, HashingService
+from utils.db import db_connection
+
+# パスワードハッシュのサービス（auth/hashing.py）と混雑時の応答の確認
+#
+# ワーカーは1つにして、ファイルができるまで待つ処理でワーカーを塞ぐ（時間に頼らない）。
+# ワーカーで実行する関数はワーカーから import できるようモジュールの直下に置く。
+
+ROUNDS = 1000
+WAIT_LIMIT = 10  # 塞いだワーカーを必ず解放する秒数
+
+def _block(started, release, submitted_at):
+    """started を作り、release ができるまでワーカーを塞ぐ"""
+    open(started, "w").close()
+    deadline = time.time() + WAIT_LIMIT
+    while not os.path.exists(release) and time.time() < deadline:
+        time.sleep(0.01)
+    return True, 0.0, 0.0
+
+def _crash(submitted_at):
+    os._exit(1)
+
+def _wait_for(path):
+    deadline = time.time() + WAIT_LIMIT
+    while not path.exists():
+        assert time.time() < deadline, f"{path} が作られません"
+        time.sleep(0.01)
+
+class BlockedWorker:
+    """サービスの唯一のワーカーを別スレッドから塞ぐ"""
+
+    def __init__(self, service, tmp_path):
+        self.started = tmp_path / "started"
+        self.release_file = tmp_path / "release"
+        self.errors = []
+
+        def run():
+            try:
+                service._run(_block, str(self.started), str(self.release_file))
+            except Exception as e:
+                self.errors.append(e)
+
+        self.thread = threading.Thread(target=run)
+        self.thread.start()
+        _wait_for(self.started)
+
+    def release(self):
+        self.release_file.touch()
+        self.thread.join(WAIT_LIMIT)
+
+def _service(**kwargs):
+    return HashingService(**{"workers": 1, "max_pending": 1, "rounds": ROUNDS, "timeout": 10, **kwargs})
+
+@pytest.fixture
+def service():
+    service = _service()
+    yield service
+    service.shutdown()
+
+def _eventually(call):
+    """枠が返るのを待ってから call() の結果を返す（完了時のコールバックは非同期で呼ばれる）"""
+    deadline = time.time() + WAIT_LIMIT
+    while True:
+        try:
+            return call()
+        except HashingOverloaded:
+            assert time.time() < deadline
+            time.sleep(0.01)
+
+def test_hash_and_verify_in_worker(service):
+    hashed = service.hash("secret")
+    assert service.verify("secret", hashed)
+    assert not service.verify("wrong", hashed)
+    assert not service.needs_update(hashed)
+    assert service.stats()["completed"] == 3
+
+def test_rejects_when_all_slots_are_taken(service, tmp_path):
+    blocked = BlockedWorker(service, tmp_path)
+    try:
+        started = time.monotonic()
+        with pytest.raises(HashingOverloaded):
+            service.hash("secret")
+        # 待たずに拒否する
+        assert time.monotonic() - started < 1
+        assert service.stats()["rejected"] == 1
+    finally:
+        blocked.release()
+    assert not blocked.errors
+    assert service.verify("secret", _eventually(lambda: service.hash("secret")))
+
+def test_timed_out_call_holds_its_slot_until_the_worker_finishes(tmp_path):
+    service = _service(timeout=0.2)
+    try:
+        started, release = tmp_path / "started", tmp_path / "release"
+        with pytest.raises(TimeoutError):
+            service._run(_block, str(started), str(release))
+        # 計算中のワーカーの分の枠は返していない
+        with pytest.raises(HashingOverloaded):
+            service.hash("secret")
+        release.touch()
+        assert _eventually(lambda: service.hash("secret"))
+    finally:
+        service.shutdown()
+
+def test_broken_pool_is_replaced(service):
+    with pytest.raises(BrokenProcessPool):
+        service._run(_crash)
+    # 枠は返され、新しいプールで計算できる
+    assert service.verify("secret", _eventually(lambda: service.hash("secret")))
+
+@pytest.fixture
+def user(memory_db, monkeypatch, service):
+    monkeypatch.setattr(auth, "get_hashing_service", lambda: service)
+    with db_connection() as conn:
+        conn.execute(
+            "INSERT INTO users (username, password) VALUES ('alice', ?)", (service.hash("secret"),)
+        )
+        conn.commit()
+    return "alice"
+
+def test_login_and_registration_answer_busy_when_overloaded(user, service, tmp_path):
+    blocked = BlockedWorker(service, tmp_path)
+    try:
+        assert auth.authenticate_user(user, "secret") == (None, auth.BUSY_MESSAGE)
+        assert auth.register_user("bob", "secret") == (False, auth.BUSY_MESSAGE)
+    finally:
+        blocked.release()
+    _eventually(lambda: service.hash("secret"))
+    assert auth.authenticate_user(user, "secret")[0]["username"] == user
+    with db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users WHERE username = 'bob'").fetchone()[0] == 0
+
+def test_login_answers_busy_when_the_worker_dies(user, service, monkeypatch):
+    monkeypatch.setattr(auth, "verify_password", lambda password, hash: service._run(_crash))
+    assert auth.authenticate_user(user, "secret") == (None, auth.BUSY_MESSAGE)
+
+def test_login_answers_busy_on_timeout(user, monkeypatch, tmp_path):
+    # 枠は空いているが、唯一のワーカーが塞がっていて時間内に終わらない
+    service = _service(max_pending=2, timeout=0.2)
+    monkeypatch.setattr(auth, "get_hashing_service", lambda: service)
+    blocked = BlockedWorker(service, tmp_path)
+    try:
+        assert auth.authenticate_user(user, "secret") == (None, auth.BUSY_MESSAGE)
+    finally:
+        blocked.release()
+        service.shutdown()
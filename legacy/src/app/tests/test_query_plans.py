@@ -0,0 +1,114 @@
+import re
+import pytest
+from utils.db import db_connection, use_connection
+from utils.migrations import intern_categories
+from tasks import task_manager
+
+# task_manager の一覧・フィルター・統計のクエリがインデックスを使うことの確認
+#
+# マイグレーションを適用した一時DBで各関数を呼び、実行された SELECT 文を
+# EXPLAIN QUERY PLAN にかける。tasks テーブルの全件走査（SCAN tasks）が
+# 含まれていれば失敗する。読み取りキャッシュを通さないよう .uncached を呼ぶ。
+
+TASK_ROWS = 60
+
+@pytest.fixture
+def conn(memory_db):
+    """マイグレーション済みでタスクの入ったメモリ上のDBの接続"""
+    with db_connection() as conn:
+        conn.execute("INSERT INTO users (username, password) VALUES ('plan', 'x')")
+        conn.executemany(
+            """
+            INSERT INTO tasks (user_id, title, description, status, priority, category, due_date)
+            VALUES (1, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    f"資料 {i}", "見積書の作成",
+                    task_manager.TASK_STATUSES[i % 3], ("low", "medium", "high")[i % 3],
+                    ("仕事", "家事", None)[i % 3], f"2024-01-{i % 28 + 1:02d}" if i % 4 else None
+                )
+                for i in range(TASK_ROWS)
+            ]
+        )
+        intern_categories(conn)
+        conn.commit()
+        yield conn
+
+def _first_page_cursor(user_id):
+    _, cursor = task_manager.get_tasks_page.uncached(user_id, limit=5)
+    return cursor
+
+# (名前, 呼び出し)
+QUERIES = [
+    ("get_tasks", lambda: task_manager.get_tasks.uncached(1)),
+    ("get_tasks[status]", lambda: task_manager.get_tasks.uncached(1, "completed")),
+    ("get_tasks[priority]", lambda: task_manager.get_tasks.uncached(1, None, "high")),
+    ("get_tasks[category]", lambda: task_manager.get_tasks.uncached(1, None, None, "仕事")),
+    *[
+        (f"get_tasks[{due}]", lambda due=due: task_manager.get_tasks.uncached(1, due=due))
+        for due in task_manager.DUE_FILTERS
+    ],
+    ("get_tasks[archived]", lambda: task_manager.get_tasks.uncached(1, include_archived=True)),
+    ("get_tasks_page", lambda: task_manager.get_tasks_page.uncached(1, limit=5)),
+    ("get_tasks_page[cursor]",
+     lambda: task_manager.get_tasks_page.uncached(1, cursor=_first_page_cursor(1), limit=5)),
+    ("get_tasks_page[status]", lambda: task_manager.get_tasks_page.uncached(1, "not_started")),
+    ("get_tasks_page[archived]",
+     lambda: task_manager.get_tasks_page.uncached(1, "completed", include_archived=True)),
+    ("search_tasks[fts]", lambda: task_manager.search_tasks(1, "見積書")),
+    ("search_tasks[short]", lambda: task_manager.search_tasks(1, "資料", status="in_progress")),
+    ("get_task_categories", lambda: task_manager.get_task_categories.uncached(1)),
+    ("get_task_categories[archived]",
+     lambda: task_manager.get_task_categories.uncached(1, include_archived=True)),
+    ("get_category_suggestions", lambda: task_manager.get_category_suggestions.uncached(1)),
+    ("get_task_stats", lambda: task_manager.get_task_stats.uncached(1)),
+    ("get_task_stats[archived]", lambda: task_manager.get_task_stats.uncached(1, include_archived=True)),
+    ("load_task_page", lambda: task_manager.load_task_page(1, status="in_progress")),
+]
+
+def _executed_selects(conn, call):
+    """call の実行中に conn で実行された SELECT 文（パラメーターは展開済み）"""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        with use_connection(conn):
+            call()
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith(("SELECT", "WITH"))]
+
+def _full_table_scans(conn, sql, table):
+    """クエリプランのうち table を全件走査している行
+
+    アーカイブを含む一覧は UNION ALL の副問い合わせに tasks という別名を付けているため、
+    副問い合わせ（CO-ROUTINE / MATERIALIZE）の外側にある同名の走査は副問い合わせの
+    結果の走査として除く。副問い合わせの内側の走査はテーブルの走査として数える。
+    """
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    parents = {node_id: parent for node_id, parent, _, _ in plan}
+    subqueries = {
+        node_id for node_id, _, _, detail in plan
+        if re.fullmatch(rf"(?:CO-ROUTINE|MATERIALIZE) {table}", detail)
+    }
+
+    def inside_subquery(node_id):
+        while node_id in parents:
+            node_id = parents[node_id]
+            if node_id in subqueries:
+                return True
+        return False
+
+    return [
+        detail for node_id, _, _, detail in plan
+        if re.match(rf"SCAN {table}\b(?!_)", detail)
+        and (not subqueries or inside_subquery(node_id))
+    ]
+
+@pytest.mark.parametrize("name, call", QUERIES, ids=[name for name, _ in QUERIES])
+def test_task_queries_use_indexes(conn, name, call):
+    selects = _executed_selects(conn, call)
+    assert selects, f"{name}: SELECT 文が実行されていません"
+    for sql in selects:
+        scans = _full_table_scans(conn, sql, "tasks")
+        assert not scans, f"{name}: tasks を全件走査しています {scans}\n{sql}"
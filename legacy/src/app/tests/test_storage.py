@@ -0,0 +1,203 @@
+import pytest
+from utils import db
+from utils.db import db_connection
+from utils.cache import get_query_cache
+from utils.storage import (
+    MOVE_TASK_COLUMNS, MemoryBackend, ShardedBackend, move_user, purge_orphans, rebalance_shards,
+)
+from tasks import task_manager
+from tasks.archive import archive_batch
+
+# ストレージバックエンド（utils/storage.py）の確認
+#
+# シャード構成はファイルのDBを tmp_path に作って使う。ユーザーは register_user() と
+# 同じく users への登録と同じトランザクションで assign_user() を呼んで配置する
+# （パスワードのハッシュ計算は行わない）。
+
+SHARDS = 3
+
+def _open_sharded(monkeypatch, path, shards):
+    """STORAGE_BACKEND=sharded・DB_SHARDS=shards で path のDBを開く"""
+    db.close_pools()
+    monkeypatch.setattr(db, "STORAGE_BACKEND", "sharded")
+    monkeypatch.setattr(db, "DB_SHARDS", shards)
+    monkeypatch.setenv("TASKMANAGER_DB", str(path))
+    get_query_cache().clear()
+    db.startup()
+    return db.get_storage()
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch):
+    backend = _open_sharded(monkeypatch, tmp_path / "app.db", SHARDS)
+    yield backend
+    db.close_pools()
+
+def _register(backend, username):
+    with db_connection() as conn:
+        user_id = conn.execute(
+            "INSERT INTO users (username, password) VALUES (?, 'x')", (username,)
+        ).lastrowid
+        backend.assign_user(conn, user_id)
+        conn.commit()
+    return user_id
+
+def _add_tasks(user_id):
+    """カテゴリ・期限・完了済み（アーカイブ済みを含む）の混ざったタスクを登録"""
+    task_manager.add_task(user_id, "見積書を作成する", "先方に送る", category="仕事", due_date="2024-01-10")
+    task_manager.add_task(user_id, "議事録をまとめる", priority="high", category="会議")
+    task_manager.add_task(user_id, "資料を確認する", status="completed", category="仕事")
+    task_manager.add_task(user_id, "古い報告書を送る", status="completed", category="経理")
+    # 最後のタスクをアーカイブへ移す
+    with db_connection(user_id) as conn:
+        conn.execute(
+            "UPDATE tasks SET completed_at = datetime('now', '-60 days') "
+            "WHERE user_id = ? AND title = '古い報告書を送る'",
+            (user_id,)
+        )
+        conn.commit()
+        assert archive_batch(conn, 30, user_id=user_id) == 1
+
+def _user_rows(pool, user_id):
+    """そのシャードにあるユーザーのデータの件数"""
+    with pool.connection() as conn:
+        return {
+            table: conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE user_id = ?{condition}", (user_id,)
+            ).fetchone()[0]
+            for table, condition in (
+                ("tasks", ""), ("tasks_archive", ""), ("categories", ""),
+                ("task_counters", " AND count != 0"),
+            )
+        }
+
+def _search_hits(pool, user_id, term):
+    """そのシャードの全文検索インデックスで見つかるユーザーのタスク数"""
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('integrity-check')")
+        return conn.execute(
+            """
+            SELECT COUNT(*) FROM tasks_fts JOIN tasks ON tasks.id = tasks_fts.rowid
+            WHERE tasks_fts MATCH ? AND tasks.user_id = ?
+            """,
+            (term, user_id)
+        ).fetchone()[0]
+
+def _snapshot(user_id):
+    """タスクマネージャーから見えるユーザーのデータ（IDは移動で変わるため除く）"""
+    tasks = task_manager.get_tasks.uncached(user_id, include_archived=True)
+    return {
+        "tasks": sorted((t.title, t.status, t.priority, t.category, t.due_date) for t in tasks),
+        "stats": task_manager.get_task_stats.uncached(user_id, include_archived=True),
+        "categories": task_manager.get_task_categories.uncached(user_id, include_archived=True),
+        "search": [t.title for t in task_manager.search_tasks(user_id, "見積書")],
+    }
+
+def test_memory_backend_is_shared_between_connections(memory_db):
+    assert isinstance(memory_db, MemoryBackend)
+    user_id = _register(memory_db, "memory")
+    task_manager.add_task(user_id, "メモリ上のタスク")
+    # 書き込みスレッドとは別の接続から読める
+    with memory_db.pool.connection() as conn:
+        assert conn.execute("SELECT title FROM tasks").fetchone()[0] == "メモリ上のタスク"
+
+def test_new_users_are_placed_by_id(sharded):
+    assert isinstance(sharded, ShardedBackend)
+    user_ids = [_register(sharded, f"user{n}") for n in range(SHARDS * 2)]
+    for user_id in user_ids:
+        _add_tasks(user_id)
+
+    for user_id in user_ids:
+        home = user_id % SHARDS
+        assert sharded.lookup_shard(user_id) == home
+        for index, pool in enumerate(sharded.shard_pools):
+            rows = _user_rows(pool, user_id)
+            if index == home:
+                assert rows["tasks"] == 3 and rows["tasks_archive"] == 1 and rows["categories"] == 3
+            else:
+                assert not any(rows.values()), (index, rows)
+        assert task_manager.check_task_counters(user_id) == []
+        assert len(_snapshot(user_id)["tasks"]) == 4
+
+def test_move_user_takes_tasks_counters_and_index_along(sharded):
+    user_id = _register(sharded, "mover")
+    other = _register(sharded, "neighbour")
+    _add_tasks(user_id)
+    _add_tasks(other)
+    before = _snapshot(user_id)
+    source = sharded.lookup_shard(user_id)
+    target = (source + 1) % SHARDS
+
+    assert move_user(sharded, user_id, target) == 4
+    assert sharded.lookup_shard(user_id) == target
+    assert _snapshot(user_id) == before
+    assert task_manager.check_task_counters(user_id) == []
+    assert _search_hits(sharded.shard_pools[target], user_id, "見積書") == 1
+    assert not any(_user_rows(sharded.shard_pools[source], user_id).values())
+    assert _search_hits(sharded.shard_pools[source], user_id, "見積書") == 0
+    # 同じシャードの他のユーザーには影響しない
+    assert len(_snapshot(other)["tasks"]) == 4
+    assert purge_orphans(sharded) == []
+    # 移動先で新しいタスクを登録できる（アーカイブのIDと重ならない）
+    assert task_manager.add_task(user_id, "移動後のタスク")[0]
+    assert len(_snapshot(user_id)["tasks"]) == 5
+
+def test_move_user_rejects_unknown_shard(sharded):
+    user_id = _register(sharded, "mover")
+    with pytest.raises(ValueError):
+        move_user(sharded, user_id, SHARDS)
+
+def test_purge_orphans_removes_leftovers_of_interrupted_move(sharded):
+    user_id = _register(sharded, "mover")
+    _add_tasks(user_id)
+    source = sharded.lookup_shard(user_id)
+    target = (source + 1) % SHARDS
+    # 移動先の書き込み後、移動元の削除前に止まった状態を作る
+    columns = ", ".join(("id",) + MOVE_TASK_COLUMNS)
+    with sharded.shard_pools[source].connection() as conn:
+        kept = conn.execute(f"SELECT {columns} FROM tasks WHERE user_id = ?", (user_id,)).fetchall()
+    move_user(sharded, user_id, target)
+    with sharded.shard_pools[source].connection() as conn:
+        conn.executemany(
+            f"INSERT INTO tasks ({columns}) VALUES ({', '.join('?' * len(kept[0]))})", kept
+        )
+        conn.commit()
+    assert _user_rows(sharded.shard_pools[source], user_id)["tasks"] == 3
+
+    assert purge_orphans(sharded) == [(source, user_id)]
+    assert not any(_user_rows(sharded.shard_pools[source], user_id).values())
+    assert _search_hits(sharded.shard_pools[source], user_id, "見積書") == 0
+    assert len(_snapshot(user_id)["tasks"]) == 4
+    assert purge_orphans(sharded) == []
+
+def test_rebalance_shards_after_changing_shard_count(tmp_path, monkeypatch):
+    path = tmp_path / "app.db"
+    backend = _open_sharded(monkeypatch, path, 1)
+    user_ids = [_register(backend, f"user{n}") for n in range(5)]
+    for user_id in user_ids:
+        _add_tasks(user_id)
+    before = {user_id: _snapshot(user_id) for user_id in user_ids}
+
+    backend = _open_sharded(monkeypatch, path, SHARDS)
+    try:
+        planned = rebalance_shards(backend, dry_run=True)
+        assert [(u, src, dst) for u, src, dst, _ in planned] == [
+            (u, 0, u % SHARDS) for u in user_ids if u % SHARDS
+        ]
+        assert all(moved is None for *_, moved in planned)
+
+        moves = rebalance_shards(backend)
+        assert [(u, src, dst, moved) for u, src, dst, moved in moves] == [
+            (u, src, dst, 4) for u, src, dst, _ in planned
+        ]
+        for user_id in user_ids:
+            home = user_id % SHARDS
+            assert backend.lookup_shard(user_id) == home
+            assert _snapshot(user_id) == before[user_id]
+            for index, pool in enumerate(backend.shard_pools):
+                if index != home:
+                    assert not any(_user_rows(pool, user_id).values()), (user_id, index)
+        assert task_manager.check_task_counters() == []
+        assert purge_orphans(backend) == []
+        assert rebalance_shards(backend) == []
+    finally:
+        db.close_pools()
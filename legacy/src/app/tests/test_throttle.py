@@ -0,0 +1,97 @@
+import pytest
+from auth import throttle
+from auth.throttle import LoginThrottle
+from utils.db import db_connection
+
+# ログイン試行のトークンバケット（auth/throttle.py）の確認
+#
+# 時刻は LoginThrottle に渡す clock で進める（実時間は待たない）。
+
+USER_BURST, USER_INTERVAL = 3, 60.0
+CLIENT_BURST, CLIENT_INTERVAL = 5, 10.0
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def limiter(memory_db, monkeypatch, clock):
+    monkeypatch.setattr(throttle, "LOGIN_USER_BURST", USER_BURST)
+    monkeypatch.setattr(throttle, "LOGIN_USER_INTERVAL", USER_INTERVAL)
+    monkeypatch.setattr(throttle, "LOGIN_CLIENT_BURST", CLIENT_BURST)
+    monkeypatch.setattr(throttle, "LOGIN_CLIENT_INTERVAL", CLIENT_INTERVAL)
+    return LoginThrottle(clock=clock)
+
+def _buckets():
+    with db_connection() as conn:
+        return sorted(row[0] for row in conn.execute("SELECT bucket FROM login_throttle"))
+
+def test_burst_then_lockout(limiter):
+    assert [limiter.acquire("alice") for _ in range(USER_BURST + 2)] == [True] * USER_BURST + [False] * 2
+    assert limiter.stats() == {"allowed": USER_BURST, "throttled": 2}
+
+def test_tokens_refill_one_per_interval(limiter, clock):
+    for _ in range(USER_BURST):
+        assert limiter.acquire("alice")
+    assert not limiter.acquire("alice")
+
+    clock.advance(USER_INTERVAL - 1)
+    assert not limiter.acquire("alice")
+    # 拒否された試行はトークンを消費しないため、間隔が過ぎれば1回だけ通る
+    clock.advance(1)
+    assert limiter.acquire("alice")
+    assert not limiter.acquire("alice")
+
+    # 満タンより多くは貯まらない
+    clock.advance(USER_INTERVAL * 100)
+    assert [limiter.acquire("alice") for _ in range(USER_BURST + 1)] == [True] * USER_BURST + [False]
+
+def test_buckets_are_per_user(limiter):
+    for _ in range(USER_BURST):
+        assert limiter.acquire("alice")
+    assert not limiter.acquire("alice")
+    assert limiter.acquire("bob")
+
+def test_client_bucket_limits_across_usernames(limiter, clock):
+    results = [limiter.acquire(f"user{n}", "10.0.0.1") for n in range(CLIENT_BURST + 1)]
+    assert results == [True] * CLIENT_BURST + [False]
+    # 別の接続元からは試行できる
+    assert limiter.acquire("user0", "10.0.0.2")
+    # 接続元のバケットで拒否されたときはユーザー名のトークンも消費しない
+    clock.advance(CLIENT_INTERVAL)
+    assert limiter.acquire(f"user{CLIENT_BURST}", "10.0.0.1")
+
+def test_reset_user_refills_only_that_user(limiter):
+    for name in ("alice", "bob"):
+        for _ in range(USER_BURST):
+            limiter.acquire(name)
+    limiter.reset_user("alice")
+    assert limiter.acquire("alice")
+    assert not limiter.acquire("bob")
+
+def test_prune_removes_recovered_buckets(limiter, clock):
+    limiter.acquire("alice", "10.0.0.1")
+    clock.advance(CLIENT_BURST * CLIENT_INTERVAL + 1)
+    limiter.acquire("bob")
+    limiter.prune()
+    # 接続元のバケットは回復済み、alice のバケットはまだ回復していない
+    assert _buckets() == ["user:alice", "user:bob"]
+    clock.advance(USER_BURST * USER_INTERVAL + 1)
+    limiter.prune()
+    assert _buckets() == []
+
+def test_acquire_prunes_periodically(limiter, clock):
+    limiter.acquire("alice")
+    clock.advance(throttle.PRUNE_INTERVAL + 1)
+    limiter.acquire("bob")
+    assert _buckets() == ["user:bob"]
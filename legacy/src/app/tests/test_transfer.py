@@ -0,0 +1,39 @@
+import io
+from utils.db import db_connection
+from tasks.transfer import RecordError, export_file, import_records, import_tasks, iter_records
+
+# インポート・エクスポート（tasks/transfer.py）の確認
+
+def _user():
+    with db_connection() as conn:
+        user_id = conn.execute("INSERT INTO users (username, password) VALUES ('u', 'x')").lastrowid
+        conn.commit()
+    return user_id
+
+def test_iter_records_reports_broken_lines():
+    stream = io.StringIO('{"title": "a"}\n\nnot json\n["x"]\n')
+    records = list(iter_records(stream, "jsonl"))
+    assert records[0] == (1, {"title": "a"})
+    assert records[1][0] == 3 and isinstance(records[1][1], RecordError)
+    assert records[2] == (4, RecordError("JSONオブジェクトではありません"))
+
+def test_stray_strings_are_not_taken_as_error_messages(memory_db):
+    result = import_records(_user(), enumerate(["oops", {"title": "ok"}, 3]))
+    assert result.imported == 1
+    assert result.errors == [(0, "JSONオブジェクトではありません"), (2, "JSONオブジェクトではありません")]
+
+def test_export_file_round_trips(memory_db):
+    user_id = _user()
+    source = io.BytesIO(
+        "title,status,due_date,category\n見積書,completed,2024-01-10,仕事\n資料,,,\n,,,\n".encode("utf-8-sig")
+    )
+    result = import_tasks(user_id, source, "csv")
+    assert (result.imported, result.errors) == (2, [(4, "タイトルは必須です")])
+
+    for fmt in ("csv", "jsonl"):
+        with export_file(user_id, fmt) as file:
+            records = [record for _, record in iter_records(file, fmt)]
+        assert [(r["title"], r["status"], r["due_date"] or None, r["category"] or None) for r in records] == [
+            ("見積書", "completed", "2024-01-10", "仕事"),
+            ("資料", "not_started", None, None),
+        ]
@@ -0,0 +1,156 @@
+import sqlite3
+import threading
+import pytest
+from utils import db
+from utils.db import db_connection, get_connection, run_write
+from utils.writer import Writer
+
+# 書き込みスレッド（utils/writer.py）と run_write() の確認
+#
+# 書き込みをまとめて1つのトランザクションにするため、先頭の書き込みを Event で止めて
+# 後続をキューに溜めてから流す。いずれのテストも最後に行の重複・欠落がないかを確かめる。
+
+@pytest.fixture
+def writer(tmp_path):
+    path = tmp_path / "writer.db"
+    conn = get_connection(path)
+    conn.execute("CREATE TABLE items (name TEXT NOT NULL UNIQUE)")
+    conn.commit()
+    conn.close()
+    writer = Writer(lambda: get_connection(path), name="test-writer")
+    writer.start()
+    writer.path = path
+    yield writer
+    writer.stop()
+
+def _insert(name):
+    return lambda conn: conn.execute("INSERT INTO items (name) VALUES (?)", (name,)).lastrowid
+
+def _names(path):
+    conn = get_connection(path)
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT name FROM items"))
+    finally:
+        conn.close()
+
+def _blocking(gate, started=None, name="first"):
+    """gate が開くまで書き込みスレッドを止める書き込み"""
+    def write(conn):
+        if started is not None:
+            started.set()
+        assert gate.wait(5)
+        return _insert(name)(conn)
+    return write
+
+def test_failed_write_is_rolled_back_alone(writer):
+    gate, started = threading.Event(), threading.Event()
+    first = writer.submit(_blocking(gate, started))
+    assert started.wait(5)
+
+    def half_done(conn):
+        # 1行書いてから失敗する
+        _insert("partial")(conn)
+        raise ValueError("失敗させる")
+
+    futures = [
+        writer.submit(_insert("a")),
+        writer.submit(half_done),
+        writer.submit(_insert("a")),  # UNIQUE 制約違反
+        writer.submit(_insert("b")),
+    ]
+    gate.set()
+
+    assert first.result(5)
+    assert futures[0].result(5)
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[2].result(5)
+    assert futures[3].result(5)
+    # 後続の4件は1回のコミットにまとめられている
+    assert writer.batches == 2
+    assert writer.writes == 3
+    assert _names(writer.path) == ["a", "b", "first"]
+
+def test_cancelled_write_is_skipped(writer):
+    gate, started = threading.Event(), threading.Event()
+    first = writer.submit(_blocking(gate, started))
+    assert started.wait(5)
+    cancelled = writer.submit(_insert("cancelled"))
+    kept = writer.submit(_insert("kept"))
+    assert cancelled.cancel()
+    gate.set()
+
+    assert first.result(5) and kept.result(5)
+    assert cancelled.cancelled()
+    assert _names(writer.path) == ["first", "kept"]
+
+def test_stop_finishes_queued_writes(writer):
+    gate, started = threading.Event(), threading.Event()
+    writer.submit(_blocking(gate, started))
+    assert started.wait(5)
+    futures = [writer.submit(_insert(f"item{n}")) for n in range(10)]
+    gate.set()
+    writer.stop()
+
+    assert not writer.is_alive()
+    assert all(future.result(0) for future in futures)
+    with pytest.raises(RuntimeError):
+        writer.submit(_insert("late"))
+    assert _names(writer.path) == sorted(["first"] + [f"item{n}" for n in range(10)])
+
+def _users():
+    with db_connection() as conn:
+        return sorted(row[0] for row in conn.execute("SELECT username FROM users"))
+
+def _add_user(name):
+    return lambda conn: conn.execute(
+        "INSERT INTO users (username, password) VALUES (?, 'x')", (name,)
+    ).lastrowid
+
+def test_run_write_cancels_queued_write_on_timeout(memory_db, monkeypatch):
+    monkeypatch.setattr(db, "WRITE_TIMEOUT", 0.2)
+    gate, started = threading.Event(), threading.Event()
+
+    def blocked(conn):
+        started.set()
+        assert gate.wait(5)
+        return _add_user("first")(conn)
+
+    blocker = threading.Thread(target=run_write, args=(blocked,))
+    blocker.start()
+    assert started.wait(5)
+    try:
+        # 書き込みスレッドが塞がっているため始まらずに取り消される
+        with pytest.raises(TimeoutError):
+            run_write(_add_user("queued"))
+    finally:
+        gate.set()
+        blocker.join(5)
+
+    assert run_write(_add_user("after"))
+    assert _users() == ["after", "first"]
+
+def test_run_write_waits_for_started_write_after_timeout(memory_db, monkeypatch):
+    monkeypatch.setattr(db, "WRITE_TIMEOUT", 0.1)
+    gate = threading.Event()
+
+    def slow(conn):
+        # タイムアウトを過ぎてから書き込む
+        gate.wait(0.5)
+        return _add_user("slow")(conn)
+
+    assert run_write(slow)
+    assert _users() == ["slow"]
+
+def test_run_write_rolls_back_failed_write_without_writer(memory_db, monkeypatch):
+    monkeypatch.setattr(db, "DB_WRITER", False)
+
+    def failing(conn):
+        _add_user("partial")(conn)
+        raise ValueError("失敗させる")
+
+    with pytest.raises(ValueError):
+        run_write(failing)
+    assert run_write(_add_user("ok"))
+    assert _users() == ["ok"]
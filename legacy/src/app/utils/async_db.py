@@ -0,0 +1,101 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.db import watch_connections
+
+# asyncio から同期のデータアクセス関数を呼ぶための専用スレッド
+#
+# 関数は DB 専用スレッドで実行する。関数が借りる接続はすべて監視し、
+# 呼び出し側のタスクがキャンセルされたりタイムアウトしたりした場合は、
+# 実行中のSQLを中断して接続をプールへ返す。
+# 書き込みスレッド（utils/writer.py）に渡した書き込みは中断せず、そのままコミットされる。
+
+DB_THREADS = int(os.environ.get("DB_THREADS", "4"))
+DB_CALL_TIMEOUT = float(os.environ.get("DB_CALL_TIMEOUT", "30"))  # 秒（None で無制限）
+PROGRESS_STEPS = 1000  # 中断の要求を確認する間隔（SQLite の仮想マシンの命令数）
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_db_executor():
+    """DB 専用スレッドのエグゼキューターを取得（初回呼び出し時に作成）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+    return _executor
+
+class DbCall:
+    """DB 専用スレッドで実行する1回の呼び出し
+
+    cancel() は別スレッドから呼んでよい。開始前なら実行せず、実行中なら
+    プログレスハンドラーと interrupt() で実行中のSQLを中断させる。
+    """
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self._conns = set()
+        self._lock = threading.Lock()
+
+    def run(self):
+        if self.cancelled:
+            raise asyncio.CancelledError()
+        with watch_connections(self):
+            return self.func(*self.args, **self.kwargs)
+
+    def acquired(self, conn):
+        # 関数がプールから接続を借りたとき（シャード構成では複数になることがある）
+        conn.set_progress_handler(self._should_abort, PROGRESS_STEPS)
+        with self._lock:
+            self._conns.add(conn)
+
+    def released(self, conn):
+        conn.set_progress_handler(None, 0)
+        with self._lock:
+            self._conns.discard(conn)
+
+    def _should_abort(self):
+        # 0以外を返すと実行中の文が中断される
+        return 1 if self.cancelled else 0
+
+    def cancel(self):
+        self.cancelled = True
+        with self._lock:
+            for conn in self._conns:
+                conn.interrupt()
+
+async def run_in_db(func, *args, timeout=DB_CALL_TIMEOUT, **kwargs):
+    """同期の関数を DB 専用スレッドで実行して結果を待つ
+
+    Args:
+        func: 実行する関数
+        *args, **kwargs: 関数の引数
+        timeout: 待つ最大秒数（None で無制限）。超えた場合は TimeoutError
+
+    キャンセルやタイムアウトの際は実行中のSQLを中断する。書き込みは
+    コミット前であればロールバックされる。
+    """
+    call = DbCall(func, args, kwargs)
+    future = asyncio.wrap_future(get_db_executor().submit(call.run))
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except (asyncio.CancelledError, TimeoutError):
+        call.cancel()
+        raise
+
+def async_version(func):
+    """同期のデータアクセス関数から、同じ引数を取る async 関数を作る
+
+    処理の本体は同期版と共通のため、両者の動作が食い違うことはない。
+    キーワード引数 timeout で待つ最大秒数を指定できる。
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, timeout=DB_CALL_TIMEOUT, **kwargs):
+        return await run_in_db(func, *args, timeout=timeout, **kwargs)
+    return wrapper
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import streamlit as st
+
+# 読み取りキャッシュの設定
+CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", "2048"))
+CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", "300"))  # 秒
+
+class QueryCache:
+    """世代番号で検証する読み取り結果のキャッシュ（LRU + TTL）
+
+    値は (キー, 世代番号) で管理し、呼び出し側が渡した現在の世代番号と
+    一致しない値は古いものとして読み直す。世代番号はDBに保存されているため、
+    同じDBファイルを使う複数のサーバープロセス間でも無効化が正しく伝わる。
+    キャッシュした値は呼び出し側の間で共有されるため、変更してはならない。
+
+    Args:
+        max_entries: 保持する最大件数（超えたら最も長く使われていないものから捨てる）
+        ttl: 値の有効期間（秒）
+        clock: 経過時間を測る関数（テストで時刻を進めるためのもの）
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # キー -> (世代番号, 有効期限, 値)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_or_load(self, key, generation, loader):
+        """キャッシュから値を取得し、なければ loader() で読み込んで保存する
+
+        Args:
+            key: キャッシュのキー（ハッシュ可能な値）
+            generation: 現在の世代番号
+            loader: 値を読み込む関数（引数なし）
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                cached_generation, expires_at, value = entry
+                if cached_generation == generation and expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if expires_at <= now:
+                    self.expirations += 1
+                del self._entries[key]
+            self.misses += 1
+
+        # 読み込み中はロックを持たない
+        value = loader()
+
+        with self._lock:
+            self._entries[key] = (generation, now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return value
+
+    def clear(self):
+        """キャッシュをすべて破棄"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """ヒット数などの統計情報を取得"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+@st.cache_resource
+def _create_query_cache():
+    """プロセス内で共有する読み取りキャッシュを作成"""
+    return QueryCache()
+
+# 作成済みのキャッシュ（読み取りのたびに st.cache_resource を通らないようにする）
+_query_cache = None
+
+def get_query_cache():
+    """プロセス内で共有する読み取りキャッシュを取得"""
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = _create_query_cache()
+    return _query_cache
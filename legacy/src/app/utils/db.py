@@ -1,7 +1,17 @@
 import sqlite3
 import os
+import queue
+import threading
+import time
 import streamlit as st
+from contextlib import contextmanager
 from pathlib import Path
+from utils.migrations import migrate
+from utils.storage import SingleFileBackend, MemoryBackend, ShardedBackend
+from utils.writer import Writer, WRITE_TIMEOUT
+from utils.querystats import (
+    QUERY_STATS, QUERY_STATS_ENABLED, SLOW_QUERY_MS, find_caller, log_slow_query,
+)
 
 # データベースファイルのパス
 DB_PATH = Path("data/taskmanager.db")
@@ -9,52 +19,493 @@ DB_PATH = Path("data/taskmanager.db")
 # テストモード用のパス
 TEST_DB_PATH = Path("app/data/test_taskmanager.db")
 
-def get_connection():
-    """データベース接続を取得"""
+# ストレージバックエンド（file / memory / sharded、utils/storage.py を参照）
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "file")
+DB_SHARDS = int(os.environ.get("DB_SHARDS", "4"))  # sharded のときのシャード数
+
+# コネクションプールの設定
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = 10.0  # 空き接続を待つ最大秒数
+
+# 書き込みを専用スレッドでまとめてコミットするか（utils/writer.py を参照、0で各接続から直接書き込む）
+DB_WRITER = os.environ.get("DB_WRITER", "1") == "1"
+
+# 接続ごとに設定するPRAGMA
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",     # 約16MB（負の値はKiB単位）
+    "PRAGMA mmap_size = 268435456",   # 256MB
+)
+
+# スレッドごとに借りている接続（プール, 接続）
+_local = threading.local()
+
+def get_db_path():
+    """使用するデータベースファイルのパスを取得
+
+    環境変数 TASKMANAGER_DB が設定されていればそのパスを使う。
+    """
+    if os.environ.get("TASKMANAGER_DB"):
+        return Path(os.environ["TASKMANAGER_DB"])
     # テストモードかどうかを確認
     if os.environ.get("TEST_MODE") == "1":
-        db_path = TEST_DB_PATH
-    else:
-        db_path = DB_PATH
-        
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path)
+        return TEST_DB_PATH
+    return DB_PATH
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """実行時間・行数・呼び出し元を QUERY_STATS に記録するカーソル
+
+    実行時間が SLOW_QUERY_MS を超えたクエリはスロークエリログに書き出す。
+    """
+
+    _stats = None
+
+    def _begin(self, sql):
+        self._sql = sql
+        self._caller = find_caller()
+        self._stats = QUERY_STATS.entry(sql, self._caller)
+        self._elapsed = 0.0
+        self._rows = 0
+        self._logged = False
+
+    def _record(self, elapsed, rows=0):
+        if self._stats is None:
+            return
+        self._elapsed += elapsed
+        self._rows += rows
+        QUERY_STATS.add(self._stats, elapsed, rows, self._elapsed)
+        if not self._logged and self._elapsed * 1000 >= SLOW_QUERY_MS:
+            self._logged = True
+            log_slow_query(self._sql, self._caller, self._elapsed, self._rows)
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        self._begin(sql_script)
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._record(time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._record(time.perf_counter() - started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._record(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._record(time.perf_counter() - started, len(rows))
+        return rows
+
+    def __next__(self):
+        # 反復は1行ごとに呼ばれるため、時間は計らず行数だけ数える（ロックを取らない概算）
+        row = super().__next__()
+        if self._stats is not None:
+            self._rows += 1
+            self._stats.rows += 1
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    """InstrumentedCursor を使う接続"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection の execute 系は cursor() を経由しないため置き換える
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+def get_connection(db_path=None):
+    """PRAGMA設定済みの新しいデータベース接続を作成
+
+    通常は db_connection() でプールから接続を借りること。
+
+    Args:
+        db_path: データベースファイルのパスまたは file: で始まるURI（省略時は get_db_path()）
+    """
+    db_path = str(db_path or get_db_path())
+    uri = db_path.startswith("file:")
+    if not uri:
+        os.makedirs(Path(db_path).parent, exist_ok=True)
+    # プール内の接続はスレッドをまたいで再利用するため check_same_thread を無効化
+    factory = InstrumentedConnection if QUERY_STATS_ENABLED else sqlite3.Connection
+    conn = sqlite3.connect(db_path, uri=uri, check_same_thread=False, factory=factory)
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+class ConnectionPool:
+    """SQLite接続のプール
+
+    同時に貸し出す接続数を size までに制限し、返却された接続は閉じずに再利用する。
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def acquire(self):
+        """接続を借りる（空きがなければ timeout 秒まで待つ）"""
+        if self._closed:
+            raise RuntimeError("コネクションプールは既に閉じられています")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("データベース接続の取得がタイムアウトしました")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return get_connection(self.db_path)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """接続を返却（未完了のトランザクションはロールバックする）"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # 壊れた接続はプールに戻さない
+            conn.close()
+            conn = None
+        if conn is not None:
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """with文で接続を借りて、抜けるときに返却する"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """待機中の接続をすべて閉じる"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+@st.cache_resource
+def _create_pool(db_path):
+    """データベースファイルごとのコネクションプールを作成（プロセス内で1つ）"""
+    return ConnectionPool(db_path)
+
+# 作成済みのプール（st.cache_resource は呼び出しごとに引数のハッシュを計算するため、
+# 接続を借りるたびに通らないようにする）
+_pools = {}
+
+def get_pool(db_path):
+    """データベースファイルごとのコネクションプールを取得"""
+    pool = _pools.get(db_path)
+    if pool is None:
+        pool = _pools[db_path] = _create_pool(db_path)
+    return pool
+
+def create_storage(db_path, kind=None):
+    """ストレージバックエンドを作成
+
+    Args:
+        db_path: データベースファイルのパス（memory の場合はデータベースの名前）
+        kind: "file" / "memory" / "sharded"（省略時は STORAGE_BACKEND）
+    """
+    kind = kind or STORAGE_BACKEND
+    if kind == "file":
+        return SingleFileBackend(db_path, get_pool)
+    if kind == "memory":
+        return MemoryBackend(db_path, get_pool)
+    if kind == "sharded":
+        return ShardedBackend(db_path, DB_SHARDS, get_pool)
+    raise ValueError(f"未対応のストレージバックエンドです: {kind}")
+
+# 作成済みのバックエンド（データベースのパスごと）
+_storages = {}
+
+def get_storage():
+    """現在のデータベースのパスに対応するストレージバックエンドを取得"""
+    db_path = str(get_db_path())
+    storage = _storages.get(db_path)
+    if storage is None:
+        storage = _storages[db_path] = create_storage(db_path)
+    return storage
+
+def close_pools():
+    """すべてのプールとバックエンドを閉じて破棄する（次に接続を借りるときに作り直される）
+
+    メモリ上のデータベースは内容も消えるため、次の startup() でスキーマを作り直す。
+    """
+    # キューにある書き込みを済ませてから閉じる
+    for writer in list(_writers.values()):
+        writer.stop()
+    _writers.clear()
+    for storage in list(_storages.values()):
+        storage.close()
+    _storages.clear()
+    for pool in list(_pools.values()):
+        pool.close()
+    _pools.clear()
+    _create_pool.clear()
+    _prepared_paths.clear()
+    prepare_database.clear()
+
+@contextmanager
+def _bind(pool):
+    """プールから接続を借りてこのスレッドに結び付ける
+
+    既に同じプールの接続（または use_connection() で指定した接続）を借りている場合はそれを使う。
+    """
+    bound = getattr(_local, "bound", None)
+    if bound is not None and (bound[0] is None or bound[0] is pool):
+        yield bound[1]
+        return
+
+    watcher = getattr(_local, "watcher", None)
+    with pool.connection() as conn:
+        _local.bound = (pool, conn)
+        if watcher is not None:
+            watcher.acquired(conn)
+        try:
+            yield conn
+        finally:
+            if watcher is not None:
+                watcher.released(conn)
+            _local.bound = bound
+
+@contextmanager
+def db_connection(user_id=None):
+    """プールからデータベース接続を借りる
+
+    with db_connection() as conn: の形で使用し、ブロックを抜けると接続はプールへ返却される。
+    コミットされていない変更は返却時にロールバックされる。
+    同じスレッド内でネストした場合は外側の接続をそのまま使う。
+
+    Args:
+        user_id: 指定するとそのユーザーのタスクを置くデータベース、省略時はユーザー情報の
+            データベースの接続になる（シャード構成以外では同じデータベース）
+    """
+    with _bind(get_storage().pool_for_user(user_id)) as conn:
+        yield conn
+
+# データベースごとの書き込みスレッド
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_writer(pool):
+    """プールと同じデータベースに書き込むスレッドを取得（初回呼び出し時に開始）"""
+    writer = _writers.get(pool.db_path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(pool.db_path)
+            if writer is None:
+                writer = Writer(lambda: get_connection(pool.db_path), name=f"db-writer-{len(_writers)}")
+                writer.start()
+                _writers[pool.db_path] = writer
+    return writer
+
+def run_write(func, user_id=None):
+    """書き込みを行い、コミットされた後に結果を返す
+
+    func は接続を受け取って書き込みを行う関数で、コミットはしないこと。
+    通常は書き込みスレッドに渡し、他のセッションの書き込みとまとめてコミットされる。
+    func が例外を送出した場合はその書き込みだけが取り消され、同じ例外が送出される。
+    このスレッドが既に接続を借りている場合（use_connection() を含む）はその接続で実行し、
+    外側のトランザクションの中であればコミットも外側に任せる。
+
+    書き込みスレッドが WRITE_TIMEOUT 秒以内に func を始めなかった場合は、キューから
+    取り消したうえで TimeoutError を送出する（この場合 func は実行されない）。
+    既に始まっていた書き込みは取り消せないため、タイムアウト後もコミットまで待って結果を返す。
+
+    Args:
+        func: 書き込みを行う関数
+        user_id: 書き込むデータベースを決めるユーザーID（db_connection() と同じ）
+
+    Returns:
+        func の戻り値
+
+    Raises:
+        TimeoutError: 書き込みが始まる前に WRITE_TIMEOUT 秒を過ぎた
+    """
+    pool = get_storage().pool_for_user(user_id)
+    bound = getattr(_local, "bound", None)
+    if DB_WRITER and (bound is None or bound[0] not in (None, pool)):
+        future = get_writer(pool).submit(func)
+        try:
+            return future.result(WRITE_TIMEOUT)
+        except TimeoutError:
+            # 書き込まれたかどうか分からないまま失敗を返さないよう、取り消せた場合だけ送出する
+            if future.cancel():
+                raise
+        return future.result()
+
+    with _bind(pool) as conn:
+        outer = conn.in_transaction
+        try:
+            result = func(conn)
+            if not outer:
+                conn.commit()
+        except Exception:
+            if not outer:
+                conn.rollback()
+            raise
+    return result
+
+def each_database(user_id=None):
+    """タスクを置くデータベースの接続を順に借りるジェネレーター
+
+    user_id を指定した場合はそのユーザーのデータベースだけ、省略時はすべてのデータベース
+    （シャード構成ではすべてのシャード）を対象にする。
+    """
+    storage = get_storage()
+    pools = storage.pools() if user_id is None else [storage.pool_for_user(user_id)]
+    for pool in pools:
+        with _bind(pool) as conn:
+            yield conn
+
+@contextmanager
+def detached_connection(user_id=None):
+    """スレッドに結び付けずにプールから接続を借りる
+
+    ジェネレーターのように、借りている間に呼び出し元へ制御が戻る場合に使う。
+    ブロック内で呼ばれた db_connection() はこの接続を使わない。
+
+    Args:
+        user_id: 接続するデータベースを決めるユーザーID（db_connection() と同じ）
+    """
+    with get_storage().pool_for_user(user_id).connection() as conn:
+        yield conn
+
+@contextmanager
+def read_transaction(user_id=None):
+    """1つの読み取りトランザクションで接続を借りる
+
+    ブロック内のクエリはすべて同じスナップショットを読む。
+    ブロックを抜けるとトランザクションは終了する（書き込みはコミットされない）。
+    既にトランザクション中の場合はそのまま使う。
+
+    Args:
+        user_id: 接続するデータベースを決めるユーザーID（db_connection() と同じ）
+    """
+    with db_connection(user_id) as conn:
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+@contextmanager
+def use_connection(conn):
+    """このスレッドの db_connection() に指定した接続を使わせる
+
+    テストで独自の接続（インメモリDBやトランザクション中の接続など）を
+    ビジネスロジック関数に渡すためのもの。接続は閉じられない。
+    ブロック内では user_id に関係なくこの接続が使われる。
+    """
+    previous = getattr(_local, "bound", None)
+    _local.bound = (None, conn)
+    try:
+        yield conn
+    finally:
+        _local.bound = previous
+
+@contextmanager
+def watch_connections(watcher):
+    """このスレッドがプールから借りる接続を watcher に知らせる
+
+    接続を借りたときに watcher.acquired(conn)、返す前に watcher.released(conn) が呼ばれる。
+    """
+    previous = getattr(_local, "watcher", None)
+    _local.watcher = watcher
+    try:
+        yield watcher
+    finally:
+        _local.watcher = previous
+
 def init_db():
-    """データベースとテーブルの初期化"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # ユーザーテーブルの作成
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # タスクテーブルの作成
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS tasks (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        title TEXT NOT NULL,
-        description TEXT,
-        status TEXT DEFAULT 'not_started',
-        priority TEXT DEFAULT 'medium',
-        category TEXT,
-        due_date TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """データベースの初期化（すべてのデータベースに未適用のスキーママイグレーションを適用）
+
+    Returns:
+        いずれかのデータベースに今回適用したバージョンのリスト
+    """
+    applied = set()
+    for conn in each_database():
+        applied.update(migrate(conn))
+    return sorted(applied)
+
+@st.cache_resource
+def prepare_database(db_path):
+    """プロセスごとに一度だけ行うデータベースの準備
+
+    スキーマのマイグレーションとプール接続のウォームアップを行う。
+    結果はキャッシュされるため、リラン時にはDDLやスキーマの確認は行われない。
+
+    Args:
+        db_path: データベースファイルのパス（キャッシュのキー）
+    """
+    applied = init_db()
+    for conn in each_database():
+        # スキーマ情報とページキャッシュを読み込んでおく
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        conn.execute("SELECT id FROM tasks LIMIT 1").fetchone()
+    return applied
+
+# このプロセスで準備済みのデータベース
+_prepared_paths = set()
+
+def startup():
+    """アプリ起動時の初期化（リランごとに呼んでもよい）"""
+    db_path = str(get_db_path())
+    # 2回目以降はキャッシュの引数ハッシュも省いて即座に戻る
+    if db_path in _prepared_paths:
+        return
+    prepare_database(db_path)
+    _prepared_paths.add(db_path)
 
 # Streamlitセッション状態の初期化
 def init_session_state():
@@ -0,0 +1,580 @@
+import unicodedata
+
+# データベーススキーマのマイグレーション
+#
+# MIGRATIONS にバージョン順で変更を追加していく。適用済みのバージョンは
+# schema_version テーブルに記録され、migrate() は未適用のものだけを順番に実行する。
+# 各ステップは SQL 文字列か、接続を受け取る関数のどちらか。
+
+def _task_counters_source(due_column):
+    """tasks テーブルからユーザーごとの件数カウンターを集計するクエリ
+
+    Args:
+        due_column: open_due のキーにする列（マイグレーション15より前は due_date）
+    """
+    due_key = f"CAST({due_column} AS TEXT)"
+    return f'''
+    SELECT user_id, 'total' AS kind, '' AS key, COUNT(*) AS count
+    FROM tasks GROUP BY user_id
+    UNION ALL
+    SELECT user_id, 'status', IFNULL(status, ''), COUNT(*)
+    FROM tasks GROUP BY user_id, IFNULL(status, '')
+    UNION ALL
+    SELECT user_id, 'priority', IFNULL(priority, ''), COUNT(*)
+    FROM tasks GROUP BY user_id, IFNULL(priority, '')
+    UNION ALL
+    SELECT user_id, 'open_due', {due_key}, COUNT(*)
+    FROM tasks
+    WHERE {due_key} IS NOT NULL AND IFNULL(status, '') != 'completed'
+    GROUP BY user_id, {due_key}
+'''
+
+# open_due のキーにする列。期限での絞り込み（task_manager._filter_clause）と同じ
+# due_day（YYYYMMDD の整数、キーには文字列で入る）で数えるため、日付として解釈できない
+# due_date は絞り込みと同様にどの期限にも数えない。
+OPEN_DUE_COLUMN = "due_day"
+
+# tasks テーブルからユーザーごとの件数カウンターを集計するクエリ
+# （task_counters の初期投入と整合性チェックで使う）
+#   total    : 全タスク数
+#   status   : ステータス別の件数
+#   priority : 優先度別の件数
+#   open_due : 未完了タスクの期限日（YYYYMMDD）別の件数（期限切れ件数の算出用）
+# NULL は空文字のキーとして数える。
+TASK_COUNTERS_SOURCE = _task_counters_source(OPEN_DUE_COLUMN)
+
+def category_key(name):
+    """カテゴリ名の照合キー（表記ゆれを同じカテゴリにまとめる。空なら None）
+
+    Unicode の互換正規化（全角・半角）、大文字・小文字の区別なし、前後と連続する空白を無視する。
+    """
+    if name is None:
+        return None
+    key = " ".join(unicodedata.normalize("NFKC", name).split()).casefold()
+    return key or None
+
+def intern_category(conn, user_id, name):
+    """カテゴリを categories に登録して (ID, 表示名) を返す（登録済みならそれを返す）
+
+    照合キーが同じカテゴリは最初に登録された表記にまとめる。空のカテゴリは (None, None)。
+    書き込みのトランザクション内で呼ぶこと。
+    """
+    key = category_key(name)
+    if key is None:
+        return None, None
+    category_id, canonical = conn.execute(
+        """
+        INSERT INTO categories (user_id, name, name_key) VALUES (?, ?, ?)
+        ON CONFLICT (user_id, name_key) DO UPDATE SET name = name
+        RETURNING id, name
+        """,
+        (user_id, name.strip(), key)
+    ).fetchone()
+    return category_id, canonical
+
+def intern_categories(conn, user_id=None):
+    """category_id が未設定のタスク（アーカイブを含む）のカテゴリを categories に登録して埋める
+
+    表記ゆれのあるカテゴリは（新規に登録する場合）使用数の最も多い表記にまとめ、タスクのカテゴリ名もその表記に
+    そろえる。空白だけのカテゴリはカテゴリなしにする。最後に使用数を数え直す。
+    トランザクションは呼び出し側で管理する。
+
+    Args:
+        conn: データベース接続
+        user_id: 対象ユーザーID（省略時は全ユーザー）
+    """
+    user_filter = "" if user_id is None else " AND user_id = :user_id"
+    rows = conn.execute(
+        f"""
+        SELECT user_id, category, COUNT(*) AS uses FROM (
+            SELECT user_id, category FROM tasks
+            WHERE category IS NOT NULL AND category_id IS NULL{user_filter}
+            UNION ALL
+            SELECT user_id, category FROM tasks_archive
+            WHERE category IS NOT NULL AND category_id IS NULL{user_filter}
+        )
+        GROUP BY user_id, category
+        ORDER BY uses DESC, category
+        """,
+        {"user_id": user_id}
+    ).fetchall()
+
+    for row_user_id, name, _ in rows:
+        category_id, canonical = intern_category(conn, row_user_id, name)
+        for table in ("tasks", "tasks_archive"):
+            conn.execute(
+                f"""
+                UPDATE {table} SET category = ?, category_id = ?
+                WHERE user_id = ? AND category = ? AND category_id IS NULL
+                """,
+                (canonical, category_id, row_user_id, name)
+            )
+
+    conn.execute(
+        f"""
+        UPDATE categories SET
+            usage_count = (SELECT COUNT(*) FROM tasks WHERE category_id = categories.id),
+            archived_count = (SELECT COUNT(*) FROM tasks_archive WHERE category_id = categories.id)
+        WHERE 1{user_filter}
+        """,
+        {"user_id": user_id}
+    )
+
+def _counter_changes(row, delta, due_column=OPEN_DUE_COLUMN):
+    """トリガー内で task_counters を増減させるSQL文
+
+    Args:
+        row: new / old
+        delta: 増減する件数
+        due_column: open_due のキーにする列（_task_counters_source() と同じもの）
+    """
+    due_value = f"CAST({row}.{due_column} AS TEXT)"
+    upsert = (
+        "INSERT INTO task_counters (user_id, kind, key, count) {source} "
+        f"ON CONFLICT (user_id, kind, key) DO UPDATE SET count = count + ({delta});"
+    )
+    return "\n".join([
+        upsert.format(source=f"VALUES ({row}.user_id, 'total', '', {delta})"),
+        upsert.format(source=f"VALUES ({row}.user_id, 'status', IFNULL({row}.status, ''), {delta})"),
+        upsert.format(source=f"VALUES ({row}.user_id, 'priority', IFNULL({row}.priority, ''), {delta})"),
+        upsert.format(source=(
+            f"SELECT {row}.user_id, 'open_due', {due_value}, {delta} "
+            f"WHERE {due_value} IS NOT NULL AND IFNULL({row}.status, '') != 'completed'"
+        )),
+    ])
+
+def _version_bump(row):
+    """トリガー内でユーザーの世代番号を進めるSQL文（row は new / old）"""
+    return (
+        f"INSERT INTO user_versions (user_id, version) VALUES ({row}.user_id, 1) "
+        "ON CONFLICT (user_id) DO UPDATE SET version = version + 1;"
+    )
+
+def _section_bump(row, stats, categories, where=None):
+    """トリガー内でユーザーの世代番号と、変更のあった部分の世代番号を進めるSQL文
+
+    Args:
+        row: new / old
+        stats: 統計が変わる条件のSQL式
+        categories: カテゴリ一覧が変わる条件のSQL式
+        where: 指定した場合はこの条件を満たすときだけ進める
+    """
+    return (
+        "INSERT INTO user_versions (user_id, version, stats_version, categories_version) "
+        f"SELECT {row}.user_id, 1, ({stats}) != 0, ({categories}) != 0 WHERE {where or 1} "
+        "ON CONFLICT (user_id) DO UPDATE SET version = version + 1, "
+        f"stats_version = stats_version + (({stats}) != 0), "
+        f"categories_version = categories_version + (({categories}) != 0);"
+    )
+
+# 更新で統計・カテゴリ一覧が変わる条件（ユーザーが変わる場合は両方）
+_STATS_CHANGED = (
+    "old.user_id IS NOT new.user_id OR old.status IS NOT new.status "
+    "OR old.priority IS NOT new.priority OR old.due_date IS NOT new.due_date"
+)
+_CATEGORIES_CHANGED = "old.user_id IS NOT new.user_id OR old.category IS NOT new.category"
+
+# tasks_completed_at_* トリガーが completed_at だけを設定する UPDATE（ステータスは変わらない）。
+# 元の書き込みで世代番号は進んでいるため、この UPDATE では進めない
+_COMPLETED_AT_ONLY = "old.completed_at IS NOT new.completed_at AND old.status IS new.status"
+
+# (バージョン, 説明, ステップ一覧)
+MIGRATIONS = [
+    (1, "初期スキーマ（users / tasks）", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            status TEXT DEFAULT 'not_started',
+            priority TEXT DEFAULT 'medium',
+            category TEXT,
+            due_date TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+    ]),
+    (2, "フィルター・集計用の複合インデックス", [
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_status ON tasks (user_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_priority ON tasks (user_id, priority)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_category ON tasks (user_id, category)",
+    ]),
+    (3, "get_tasks の並び順（期限なしを末尾、期限日、作成日降順）用インデックス", [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_tasks_user_due ON tasks (
+            user_id,
+            (CASE WHEN due_date IS NULL THEN 1 ELSE 0 END),
+            due_date,
+            created_at DESC
+        )
+        ''',
+    ]),
+    (4, "キーセットページング用に並び順インデックスへ id を追加", [
+        "DROP INDEX IF EXISTS idx_tasks_user_due",
+        '''
+        CREATE INDEX IF NOT EXISTS idx_tasks_user_order ON tasks (
+            user_id,
+            (CASE WHEN due_date IS NULL THEN 1 ELSE 0 END),
+            due_date,
+            created_at DESC,
+            id DESC
+        )
+        ''',
+    ]),
+    (5, "タイトル・説明の全文検索インデックス（FTS5）", [
+        # 日本語は空白で区切られないため trigram トークナイザーを使う
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            title,
+            description,
+            content='tasks',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO tasks_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+        ''',
+        # 既存のタスクを索引に登録
+        "INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')",
+    ]),
+    (6, "ユーザーごとのタスク件数カウンター", [
+        '''
+        CREATE TABLE IF NOT EXISTS task_counters (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, kind, key)
+        ) WITHOUT ROWID
+        ''',
+        f"""
+        CREATE TRIGGER IF NOT EXISTS task_counters_insert AFTER INSERT ON tasks BEGIN
+            {_counter_changes("new", 1, "due_date")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS task_counters_delete AFTER DELETE ON tasks BEGIN
+            {_counter_changes("old", -1, "due_date")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS task_counters_update
+        AFTER UPDATE OF user_id, status, priority, due_date ON tasks BEGIN
+            {_counter_changes("old", -1, "due_date")}
+            {_counter_changes("new", 1, "due_date")}
+        END
+        """,
+        # 既存のタスクから集計
+        "DELETE FROM task_counters",
+        f"INSERT INTO task_counters (user_id, kind, key, count) {_task_counters_source('due_date')}",
+    ]),
+    (7, "ユーザーごとのタスク世代番号（読み取りキャッシュの無効化用）", [
+        '''
+        CREATE TABLE IF NOT EXISTS user_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        f"""
+        CREATE TRIGGER IF NOT EXISTS user_versions_insert AFTER INSERT ON tasks BEGIN
+            {_version_bump("new")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS user_versions_delete AFTER DELETE ON tasks BEGIN
+            {_version_bump("old")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS user_versions_update AFTER UPDATE ON tasks BEGIN
+            {_version_bump("old")}
+            {_version_bump("new")}
+        END
+        """,
+    ]),
+    (8, "ログイン試行のスロットリング（トークンバケット）", [
+        '''
+        CREATE TABLE IF NOT EXISTS login_throttle (
+            bucket TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        ''',
+    ]),
+    (9, "APIトークン", [
+        '''
+        CREATE TABLE IF NOT EXISTS api_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token_hash TEXT NOT NULL UNIQUE,
+            name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_api_tokens_user ON api_tokens (user_id)",
+    ]),
+    (10, "期限日の整数表現 due_day（YYYYMMDD）と期限での絞り込み用インデックス", [
+        # due_date から計算する仮想列のため、既存の行の移行や同期用のトリガーは不要。
+        # 日付として解釈できない値は NULL になる
+        '''
+        ALTER TABLE tasks ADD COLUMN due_day INTEGER
+            GENERATED ALWAYS AS (CAST(strftime('%Y%m%d', due_date) AS INTEGER)) VIRTUAL
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_due_day ON tasks (user_id, due_day)",
+    ]),
+    (11, "完了日時 completed_at と完了済みタスクのアーカイブテーブル", [
+        "ALTER TABLE tasks ADD COLUMN completed_at TIMESTAMP",
+        # 既存の完了済みタスクは完了日時が分からないため、移行した時点で完了したものとみなす
+        "UPDATE tasks SET completed_at = CURRENT_TIMESTAMP WHERE status = 'completed'",
+        '''
+        CREATE TRIGGER IF NOT EXISTS tasks_completed_at_insert AFTER INSERT ON tasks
+        WHEN new.status = 'completed' AND new.completed_at IS NULL BEGIN
+            UPDATE tasks SET completed_at = CURRENT_TIMESTAMP WHERE id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS tasks_completed_at_update AFTER UPDATE OF status ON tasks
+        WHEN new.status IS NOT old.status BEGIN
+            UPDATE tasks
+            SET completed_at = CASE WHEN new.status = 'completed' THEN CURRENT_TIMESTAMP END
+            WHERE id = new.id;
+        END
+        ''',
+        # アーカイブ対象の検索用（完了済みのタスクだけを索引する）
+        '''
+        CREATE INDEX IF NOT EXISTS idx_tasks_completed_at ON tasks (completed_at)
+        WHERE status = 'completed'
+        ''',
+        # id は tasks の id をそのまま使う（tasks は AUTOINCREMENT のため重複しない）
+        '''
+        CREATE TABLE IF NOT EXISTS tasks_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            status TEXT,
+            priority TEXT,
+            category TEXT,
+            due_date TEXT,
+            due_day INTEGER
+                GENERATED ALWAYS AS (CAST(strftime('%Y%m%d', due_date) AS INTEGER)) VIRTUAL,
+            created_at TIMESTAMP,
+            completed_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_tasks_archive_user_completed ON tasks_archive (user_id, completed_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_archive_user_priority ON tasks_archive (user_id, priority)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_archive_user_category ON tasks_archive (user_id, category)",
+    ]),
+    (12, "シャード構成でのユーザーの配置先", [
+        # ユーザー情報のデータベースでだけ使う（utils/storage.py の ShardedBackend）
+        '''
+        CREATE TABLE IF NOT EXISTS user_shards (
+            user_id INTEGER PRIMARY KEY,
+            shard INTEGER NOT NULL
+        )
+        ''',
+    ]),
+    (13, "統計・カテゴリ一覧ごとの世代番号（変更のあった部分だけを読み直す）", [
+        "ALTER TABLE user_versions ADD COLUMN stats_version INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE user_versions ADD COLUMN categories_version INTEGER NOT NULL DEFAULT 0",
+        "UPDATE user_versions SET stats_version = version, categories_version = version",
+        "DROP TRIGGER IF EXISTS user_versions_insert",
+        "DROP TRIGGER IF EXISTS user_versions_delete",
+        "DROP TRIGGER IF EXISTS user_versions_update",
+        f"""
+        CREATE TRIGGER user_versions_insert AFTER INSERT ON tasks BEGIN
+            {_section_bump("new", "1", "new.category IS NOT NULL")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER user_versions_delete AFTER DELETE ON tasks BEGIN
+            {_section_bump("old", "1", "old.category IS NOT NULL")}
+        END
+        """,
+        # ユーザーが変わらない更新では1回だけ進める
+        f"""
+        CREATE TRIGGER user_versions_update AFTER UPDATE ON tasks BEGIN
+            {_section_bump("old", _STATS_CHANGED, _CATEGORIES_CHANGED)}
+            {_section_bump("new", _STATS_CHANGED, _CATEGORIES_CHANGED, "old.user_id IS NOT new.user_id")}
+        END
+        """,
+    ]),
+    (14, "ユーザーごとのカテゴリ表（タスクは category_id で参照する）", [
+        # name は表示用の表記、name_key は category_key() による照合キー。
+        # usage_count / archived_count は tasks / tasks_archive で使われている件数（トリガーで更新）
+        '''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL,
+            usage_count INTEGER NOT NULL DEFAULT 0,
+            archived_count INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (user_id, name_key)
+        )
+        ''',
+        "ALTER TABLE tasks ADD COLUMN category_id INTEGER REFERENCES categories (id)",
+        "ALTER TABLE tasks_archive ADD COLUMN category_id INTEGER",
+        # 既存のカテゴリ文字列を登録する（UPDATE でトリガーが動く前に件数を数え直す）
+        intern_categories,
+        "DROP INDEX IF EXISTS idx_tasks_user_category",
+        "DROP INDEX IF EXISTS idx_tasks_archive_user_category",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_category_id ON tasks (user_id, category_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_archive_user_category_id ON tasks_archive (user_id, category_id)",
+        '''
+        CREATE TRIGGER IF NOT EXISTS categories_usage_insert AFTER INSERT ON tasks
+        WHEN new.category_id IS NOT NULL BEGIN
+            UPDATE categories SET usage_count = usage_count + 1 WHERE id = new.category_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS categories_usage_delete AFTER DELETE ON tasks
+        WHEN old.category_id IS NOT NULL BEGIN
+            UPDATE categories SET usage_count = usage_count - 1 WHERE id = old.category_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS categories_usage_update AFTER UPDATE OF category_id ON tasks
+        WHEN old.category_id IS NOT new.category_id BEGIN
+            UPDATE categories SET usage_count = usage_count - 1 WHERE id = old.category_id;
+            UPDATE categories SET usage_count = usage_count + 1 WHERE id = new.category_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS categories_archived_insert AFTER INSERT ON tasks_archive
+        WHEN new.category_id IS NOT NULL BEGIN
+            UPDATE categories SET archived_count = archived_count + 1 WHERE id = new.category_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS categories_archived_delete AFTER DELETE ON tasks_archive
+        WHEN old.category_id IS NOT NULL BEGIN
+            UPDATE categories SET archived_count = archived_count - 1 WHERE id = old.category_id;
+        END
+        ''',
+    ]),
+    (15, "期限別の件数カウンター open_due を due_day（期限での絞り込みと同じ日付）で数える", [
+        "DROP TRIGGER IF EXISTS task_counters_insert",
+        "DROP TRIGGER IF EXISTS task_counters_delete",
+        "DROP TRIGGER IF EXISTS task_counters_update",
+        f"""
+        CREATE TRIGGER task_counters_insert AFTER INSERT ON tasks BEGIN
+            {_counter_changes("new", 1)}
+        END
+        """,
+        f"""
+        CREATE TRIGGER task_counters_delete AFTER DELETE ON tasks BEGIN
+            {_counter_changes("old", -1)}
+        END
+        """,
+        f"""
+        CREATE TRIGGER task_counters_update
+        AFTER UPDATE OF user_id, status, priority, due_date ON tasks BEGIN
+            {_counter_changes("old", -1)}
+            {_counter_changes("new", 1)}
+        END
+        """,
+        "DELETE FROM task_counters WHERE kind = 'open_due'",
+        f"""
+        INSERT INTO task_counters (user_id, kind, key, count)
+        SELECT * FROM ({TASK_COUNTERS_SOURCE}) WHERE kind = 'open_due'
+        """,
+    ]),
+    (16, "完了日時を設定するトリガーの UPDATE で世代番号を二重に進めない", [
+        "DROP TRIGGER IF EXISTS user_versions_update",
+        f"""
+        CREATE TRIGGER user_versions_update AFTER UPDATE ON tasks
+        WHEN NOT ({_COMPLETED_AT_ONLY}) BEGIN
+            {_section_bump("old", _STATS_CHANGED, _CATEGORIES_CHANGED)}
+            {_section_bump("new", _STATS_CHANGED, _CATEGORIES_CHANGED, "old.user_id IS NOT new.user_id")}
+        END
+        """,
+    ]),
+]
+
+def get_schema_version(conn):
+    """適用済みの最新スキーマバージョンを取得（未適用なら0）"""
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def migrate(conn):
+    """未適用のマイグレーションを順番に適用
+
+    複数プロセスが同時に起動しても二重適用されないよう、
+    各バージョンは BEGIN IMMEDIATE で書き込みロックを取ってから適用する。
+
+    Returns:
+        今回適用したバージョンのリスト
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # ロック取得までの間に他プロセスが適用済みの場合
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+
+    if applied:
+        # 新しいインデックスをクエリプランナーに反映させる
+        conn.execute("PRAGMA optimize")
+
+    return applied
@@ -0,0 +1,171 @@
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+import streamlit as st
+
+# リランのプロファイリング設定
+# 環境変数 PROFILE_RERUNS=1 ですべてのリランを、URLに ?profile=1 を付けるとそのセッションのリランを計測する。
+# 結果は PROFILE_DIR に以下の2つのファイルとして保存される。
+#   <名前>.folded : サンプリングしたスタック（collapsed stack 形式。flamegraph.pl や speedscope で開ける）
+#   <名前>.json   : リラン全体と各セクションの経過時間
+PROFILE_RERUNS = os.environ.get("PROFILE_RERUNS") == "1"
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", "data/profiles"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.001"))  # サンプリング間隔（秒）
+
+# 計測中のプロファイル（スクリプトスレッドごと）
+_local = threading.local()
+
+# 計測中はサンプラースレッドが間隔どおりに動けるよう、GILの切り替え間隔を短くする
+_switch_lock = threading.Lock()
+_active_profiles = 0
+_saved_switch_interval = None
+
+def _enter_sampling(interval):
+    global _active_profiles, _saved_switch_interval
+    with _switch_lock:
+        if _active_profiles == 0:
+            _saved_switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(_saved_switch_interval, interval / 2))
+        _active_profiles += 1
+
+def _exit_sampling():
+    global _active_profiles
+    with _switch_lock:
+        _active_profiles -= 1
+        if _active_profiles == 0:
+            sys.setswitchinterval(_saved_switch_interval)
+
+class StackSampler(threading.Thread):
+    """指定したスレッドのスタックを一定間隔で記録するスレッド
+
+    各サンプルの先頭には、その時点で実行中のセクション名を付ける。
+    """
+
+    def __init__(self, profile, thread_id, interval=PROFILE_INTERVAL):
+        super().__init__(name="rerun-profiler", daemon=True)
+        self.profile = profile
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            frames.reverse()
+            # Streamlit のスクリプト実行部分より外側のフレームは省く
+            for i, name in enumerate(frames):
+                if name.startswith("<module> "):
+                    frames = frames[i:]
+                    break
+            sections = [f"[{name}]" for name in self.profile.active_sections]
+            self.stacks[";".join(sections + frames).replace("\n", " ")] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+class RerunProfile:
+    """1回のリランの計測結果"""
+
+    def __init__(self):
+        self.started_at = datetime.datetime.now()
+        self.sections = []          # (名前, 深さ, 開始からの秒数, 経過秒数)
+        self.active_sections = ()   # サンプラーが読むため、変更せず置き換える
+        self._started = time.perf_counter()
+        self.wall_time = None
+        self.sampler = StackSampler(self, threading.get_ident())
+
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+    def write(self, directory=PROFILE_DIR):
+        """計測結果をファイルに保存してファイル名（拡張子なし）を返す"""
+        os.makedirs(directory, exist_ok=True)
+        base = directory / f"rerun-{self.started_at:%Y%m%d-%H%M%S-%f}"
+        with open(base.with_suffix(".folded"), "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.sampler.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        with open(base.with_suffix(".json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "started_at": self.started_at.isoformat(),
+                "wall_ms": self.wall_time * 1000,
+                "samples": sum(self.sampler.stacks.values()),
+                "interval_ms": self.sampler.interval * 1000,
+                "sections": [
+                    {"name": name, "depth": depth, "start_ms": start * 1000, "wall_ms": wall * 1000}
+                    for name, depth, start, wall in self.sections
+                ],
+            }, f, ensure_ascii=False, indent=2)
+        return base
+
+def profiling_requested():
+    """このリランを計測するか（環境変数または ?profile=1）"""
+    if PROFILE_RERUNS:
+        return True
+    try:
+        return st.query_params.get("profile") == "1"
+    except Exception:
+        return False
+
+@contextmanager
+def profile_rerun():
+    """リラン全体を計測する（計測しない場合は何もしない）
+
+    st.rerun() などでスクリプトが中断された場合も結果は保存する。
+    """
+    if not profiling_requested() or getattr(_local, "profile", None) is not None:
+        yield None
+        return
+
+    profile = RerunProfile()
+    _local.profile = profile
+    _enter_sampling(profile.sampler.interval)
+    profile.sampler.start()
+    try:
+        yield profile
+    finally:
+        profile.wall_time = profile.elapsed()
+        profile.sampler.stop()
+        _exit_sampling()
+        _local.profile = None
+        profile.write()
+
+@contextmanager
+def profile_section(name):
+    """ページのセクションの経過時間を記録する（計測中でなければ何もしない）"""
+    profile = getattr(_local, "profile", None)
+    if profile is None:
+        yield
+        return
+
+    parent = profile.active_sections
+    profile.active_sections = parent + (name,)
+    start = profile.elapsed()
+    try:
+        yield
+    finally:
+        profile.sections.append((name, len(parent), start, profile.elapsed() - start))
+        profile.active_sections = parent
+
+def show_profile_summary(profile):
+    """計測中のリランのここまでのセクション時間をサイドバーに表示"""
+    if profile is None:
+        return
+    with st.sidebar.expander("プロファイル"):
+        for name, depth, start, wall in sorted(profile.sections, key=lambda s: s[2]):
+            st.caption(f"{'　' * depth}{name}: {wall * 1000:.1f}ms")
+        st.caption(f"保存先: {PROFILE_DIR}")
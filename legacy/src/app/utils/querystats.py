@@ -0,0 +1,155 @@
+import functools
+import logging
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+
+# SQLクエリの計測設定
+QUERY_STATS_ENABLED = os.environ.get("QUERY_STATS", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))  # スロークエリとして記録する実行時間
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "data/slow_queries.log")
+MAX_QUERY_SHAPES = 500  # 集計するクエリの種類の上限（超えた分は OTHER_SHAPE にまとめる）
+OTHER_SHAPE = "(その他のクエリ)"
+
+# 呼び出し元として記録するモジュール
+CALLER_MODULES = ("tasks.", "auth.")
+
+_WHITESPACE = re.compile(r"\s+")
+
+@functools.lru_cache(maxsize=1024)
+def query_shape(sql):
+    """クエリの種類（空白を詰めたSQL）
+
+    パラメーターはプレースホルダーのまま渡されるため、空白の違いだけを吸収すればよい。
+    """
+    return _WHITESPACE.sub(" ", sql).strip()
+
+def find_caller():
+    """クエリを実行した tasks / auth の公開関数名（見つからなければ None）
+
+    内部関数（_で始まるもの）やデコレーター・ラムダのフレームは飛ばし、
+    最も内側の公開関数を呼び出し元とする。
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        name = frame.f_code.co_name
+        if (frame.f_globals.get("__name__", "").startswith(CALLER_MODULES)
+                and name[0] not in "_<" and name != "wrapper"):
+            return f"{frame.f_globals['__name__']}.{name}"
+        frame = frame.f_back
+    return None
+
+class ShapeStats:
+    """クエリの種類ごとの集計値"""
+    __slots__ = ("shape", "count", "total_time", "max_time", "rows", "callers")
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.callers = {}  # 呼び出し元 -> 回数
+
+class QueryStats:
+    """クエリの種類ごとの実行回数・時間・行数の集計
+
+    時間は execute と fetch* の呼び出しにかかった時間の合計。
+    カーソルを反復して読んだ行は行数には数えるが時間には含めない。
+    """
+
+    def __init__(self, max_shapes=MAX_QUERY_SHAPES):
+        self.max_shapes = max_shapes
+        self._shapes = {}
+        self._lock = threading.Lock()
+
+    def entry(self, sql, caller):
+        """クエリの実行を1回記録して集計値を返す（時間と行数は後から足す）"""
+        shape = query_shape(sql)
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                if len(self._shapes) >= self.max_shapes:
+                    shape = OTHER_SHAPE
+                stats = self._shapes.setdefault(shape, ShapeStats(shape))
+            stats.count += 1
+            stats.callers[caller] = stats.callers.get(caller, 0) + 1
+        return stats
+
+    def add(self, stats, elapsed=0.0, rows=0, statement_time=None):
+        """実行時間と行数を加算
+
+        Args:
+            stats: entry() が返した集計値
+            elapsed: 加算する時間（秒）
+            rows: 加算する行数
+            statement_time: この実行でかかった時間の合計（最大値の更新に使う）
+        """
+        with self._lock:
+            stats.total_time += elapsed
+            stats.rows += rows
+            if statement_time is not None and statement_time > stats.max_time:
+                stats.max_time = statement_time
+
+    def top(self, limit=20, key="total_ms"):
+        """集計値の上位を辞書のリストで取得
+
+        Args:
+            limit: 件数
+            key: 並べ替えの基準（total_ms, avg_ms, max_ms, count, rows）
+        """
+        with self._lock:
+            rows = [
+                {
+                    "shape": s.shape,
+                    "count": s.count,
+                    "total_ms": s.total_time * 1000,
+                    "avg_ms": s.total_time / s.count * 1000 if s.count else 0.0,
+                    "max_ms": s.max_time * 1000,
+                    "rows": s.rows,
+                    "callers": dict(s.callers),
+                }
+                for s in self._shapes.values()
+            ]
+        rows.sort(key=lambda row: row[key], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        """集計をすべて破棄"""
+        with self._lock:
+            self._shapes.clear()
+
+# プロセス内で共有する集計（クエリごとに参照するため cache_resource を通さない）
+QUERY_STATS = QueryStats()
+
+_slow_logger = None
+_slow_logger_lock = threading.Lock()
+
+def get_slow_query_logger():
+    """スロークエリログのロガー（初回呼び出し時にログファイルを開く）"""
+    global _slow_logger
+    if _slow_logger is None:
+        with _slow_logger_lock:
+            if _slow_logger is None:
+                logger = logging.getLogger("taskmanager.slow_query")
+                logger.setLevel(logging.WARNING)
+                if SLOW_QUERY_LOG and not logger.handlers:
+                    path = Path(SLOW_QUERY_LOG)
+                    os.makedirs(path.parent, exist_ok=True)
+                    handler = logging.FileHandler(path, encoding="utf-8")
+                    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                    logger.addHandler(handler)
+                _slow_logger = logger
+    return _slow_logger
+
+def log_slow_query(sql, caller, elapsed, rows):
+    """スロークエリを1件記録
+
+    閾値を超えた時点で記録するため、行数はその時点までに読んだ数になる。
+    パスワードハッシュなどを残さないようパラメーターは記録しない。
+    """
+    get_slow_query_logger().warning(
+        "%.1fms rows=%d caller=%s sql=%s", elapsed * 1000, rows, caller, query_shape(sql)
+    )
@@ -0,0 +1,377 @@
+from pathlib import Path
+
+# データベースの配置（ストレージバックエンド）
+#
+# SQL はどの構成でも同じ SQLite 用のものを使い、バックエンドはどのデータベースに
+# 接続するかだけを決める。環境変数 STORAGE_BACKEND で選ぶ（utils/db.py の get_storage()）。
+#   file    : 1つのファイル（既定）
+#   memory  : プロセス内のメモリ上のデータベース（テストや一時的な利用向け。終了すると消える）
+#   sharded : ユーザー情報のファイルと、ユーザーごとに振り分けた DB_SHARDS 個のファイル
+#
+# シャード構成では、0番目のシャードは通常の構成と同じファイルで、ユーザー情報・
+# APIトークン・ログイン試行の記録と、ユーザーの配置先（user_shards）もここに置く。
+# user_shards に登録のないユーザー（シャード構成にする前からのユーザー）は0番目にいる。
+# シャード数を変えたときは rebalance_shards() でユーザーを移す。
+
+# ユーザーのタスクを移すときに一度に読む行数
+MOVE_FETCH_SIZE = 1000
+
+# シャード間で移す列（id は移動先で振り直す。due_day は due_date から計算される。
+# category_id は移動先のカテゴリのIDに置き換えるため最後に置く）
+MOVE_TASK_COLUMNS = (
+    "user_id", "title", "description", "status", "priority", "category", "due_date",
+    "created_at", "completed_at", "category_id",
+)
+MOVE_ARCHIVE_COLUMNS = MOVE_TASK_COLUMNS[:-1] + ("archived_at", "category_id")
+
+class StorageBackend:
+    """データベースの配置を決めるバックエンドの基底クラス
+
+    サブクラスは directory_pool() / pool_for_user() / pools() を実装する。
+    コネクションプールの作成は pool_factory（パスを受け取ってプールを返す関数）に任せる。
+    """
+
+    def directory_pool(self):
+        """ユーザー情報（users など）を置くデータベースのプール"""
+        raise NotImplementedError
+
+    def pool_for_user(self, user_id):
+        """ユーザーのタスクを置くデータベースのプール（user_id が None ならユーザー情報のもの）"""
+        raise NotImplementedError
+
+    def pools(self):
+        """すべてのデータベースのプール（マイグレーションや全ユーザー対象の処理用）"""
+        raise NotImplementedError
+
+    def assign_user(self, conn, user_id):
+        """新規登録したユーザーの配置先を決める（登録と同じトランザクションで呼ぶ）"""
+
+    def close(self):
+        """バックエンドが保持している資源を解放する"""
+
+class SingleFileBackend(StorageBackend):
+    """すべてを1つのデータベースに置く"""
+
+    def __init__(self, path, pool_factory):
+        self.path = str(path)
+        self.pool = pool_factory(self.path)
+
+    def directory_pool(self):
+        return self.pool
+
+    def pool_for_user(self, user_id):
+        return self.pool
+
+    def pools(self):
+        return [self.pool]
+
+class MemoryBackend(SingleFileBackend):
+    """プロセス内のメモリ上のデータベース
+
+    SQLite の memdb VFS を使うため、同じプロセスの複数の接続から同じデータベースを
+    通常のロック（busy_timeout も有効）で使える。接続がすべて閉じられると消えるため、
+    1つの接続を借りたままにしておく。
+    """
+
+    def __init__(self, name, pool_factory):
+        super().__init__(f"file:/{name.lstrip('/')}?vfs=memdb", pool_factory)
+        self._anchor = self.pool.acquire()
+
+    def close(self):
+        if self._anchor is not None:
+            self.pool.release(self._anchor)
+            self._anchor = None
+
+def shard_path(path, index):
+    """シャードのファイルパス（0番目は path そのもの）"""
+    path = Path(path)
+    if index == 0:
+        return path
+    return path.with_name(f"{path.stem}.shard{index}{path.suffix}")
+
+class ShardedBackend(StorageBackend):
+    """ユーザーごとにタスクを複数のデータベース（シャード）へ振り分ける
+
+    新規ユーザーは user_id をシャード数で割った余りのシャードに置く。
+    シャード数を減らした場合も、残っている番号の大きいシャードのファイルは
+    rebalance_shards() で移し終えるまで使い続ける。
+    ユーザーの配置先はプロセス内で覚えておくため、シャード間の移動
+    （move_user() / rebalance_shards()）はアプリと API サーバーを止めてから行う。
+    """
+
+    def __init__(self, path, shards, pool_factory):
+        if shards < 1:
+            raise ValueError("シャード数は1以上を指定してください")
+        self.shards = shards
+        self.paths = [str(shard_path(path, index)) for index in range(shards)]
+        while shard_path(path, len(self.paths)).exists():
+            self.paths.append(str(shard_path(path, len(self.paths))))
+        self.shard_pools = [pool_factory(p) for p in self.paths]
+        self._routes = {}
+
+    def directory_pool(self):
+        return self.shard_pools[0]
+
+    def pool_for_user(self, user_id):
+        if user_id is None:
+            return self.shard_pools[0]
+        shard = self._routes.get(user_id)
+        if shard is None:
+            shard = self._routes[user_id] = self.lookup_shard(user_id)
+        return self.shard_pools[shard]
+
+    def pools(self):
+        return list(self.shard_pools)
+
+    def lookup_shard(self, user_id):
+        """ユーザー情報のデータベースからユーザーの配置先を読む"""
+        with self.directory_pool().connection() as conn:
+            row = conn.execute(
+                "SELECT shard FROM user_shards WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        shard = row[0] if row else 0
+        if shard >= len(self.shard_pools):
+            raise RuntimeError(
+                f"ユーザー {user_id} の配置先のシャード {shard} がありません（DB_SHARDS を確認してください）"
+            )
+        return shard
+
+    def target_shard(self, user_id):
+        """ユーザーを置くべきシャード"""
+        return user_id % self.shards
+
+    def assign_user(self, conn, user_id):
+        shard = self.target_shard(user_id)
+        conn.execute("INSERT INTO user_shards (user_id, shard) VALUES (?, ?)", (user_id, shard))
+        self._routes[user_id] = shard
+
+    def forget_route(self, user_id):
+        """覚えているユーザーの配置先を捨てる（次に使うときに読み直す）"""
+        self._routes.pop(user_id, None)
+
+def _copy_categories(source, target, user_id):
+    """ユーザーの使用中のカテゴリを移動先に登録する
+
+    Returns:
+        移動元のカテゴリIDから移動先のカテゴリIDへの辞書
+    """
+    category_ids = {}
+    rows = source.execute(
+        """
+        SELECT id, name, name_key FROM categories
+        WHERE user_id = ? AND usage_count + archived_count > 0
+        """,
+        (user_id,)
+    ).fetchall()
+    for category_id, name, name_key in rows:
+        category_ids[category_id] = target.execute(
+            "INSERT INTO categories (user_id, name, name_key) VALUES (?, ?, ?) RETURNING id",
+            (user_id, name, name_key)
+        ).fetchone()[0]
+    return category_ids
+
+def _moved_row(row, category_ids):
+    """移す行の最後の列（category_id）を移動先のIDに置き換える"""
+    return tuple(row[:-1]) + (category_ids.get(row[-1]),)
+
+def _copy_rows(source, target, table, columns, user_id, category_ids):
+    """ユーザーの行を別のデータベースの同じテーブルへ書き込む（件数を返す）"""
+    column_list = ", ".join(columns)
+    placeholders = ", ".join("?" * len(columns))
+    cursor = source.execute(
+        f"SELECT {column_list} FROM {table} WHERE user_id = ? ORDER BY id", (user_id,)
+    )
+    count = 0
+    while True:
+        rows = cursor.fetchmany(MOVE_FETCH_SIZE)
+        if not rows:
+            break
+        target.executemany(
+            f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})",
+            [_moved_row(row, category_ids) for row in rows]
+        )
+        count += len(rows)
+    return count
+
+def _copy_archive(source, target, user_id, category_ids):
+    """アーカイブの行を移動先のタスクIDの続きの番号で書き込む（件数を返す）
+
+    アーカイブの id は tasks の id と重ならないよう、tasks の AUTOINCREMENT の
+    続きから割り当て、sqlite_sequence も進めておく。
+    """
+    next_id = target.execute(
+        """
+        SELECT MAX(
+            IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'tasks'), 0),
+            IFNULL((SELECT MAX(id) FROM tasks), 0),
+            IFNULL((SELECT MAX(id) FROM tasks_archive), 0)
+        )
+        """
+    ).fetchone()[0]
+    column_list = ", ".join(MOVE_ARCHIVE_COLUMNS)
+    placeholders = ", ".join("?" * len(MOVE_ARCHIVE_COLUMNS))
+    cursor = source.execute(
+        f"SELECT {column_list} FROM tasks_archive WHERE user_id = ? ORDER BY id", (user_id,)
+    )
+    count = 0
+    while True:
+        rows = cursor.fetchmany(MOVE_FETCH_SIZE)
+        if not rows:
+            break
+        target.executemany(
+            f"INSERT INTO tasks_archive (id, {column_list}) VALUES (?, {placeholders})",
+            [(next_id + count + i + 1,) + _moved_row(row, category_ids) for i, row in enumerate(rows)]
+        )
+        count += len(rows)
+    if count:
+        last_id = next_id + count
+        updated = target.execute(
+            "UPDATE sqlite_sequence SET seq = ? WHERE name = 'tasks'", (last_id,)
+        ).rowcount
+        if not updated:
+            target.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('tasks', ?)", (last_id,))
+    return count
+
+def move_user(backend, user_id, shard):
+    """ユーザーのタスク（アーカイブ・カテゴリを含む）を別のシャードへ移す
+
+    移動中は移動元のシャードへの書き込みを止める。移動先で中断した移動の残りがあれば
+    先に削除するため、途中で失敗しても再実行すればよい。
+    タスクIDは移動先で振り直される。
+
+    Args:
+        backend: ShardedBackend
+        user_id: ユーザーID
+        shard: 移動先のシャード番号
+
+    Returns:
+        移したタスクの件数（移動の必要がなければ0）
+    """
+    if not 0 <= shard < backend.shards:
+        raise ValueError(f"シャード番号が不正です: {shard}")
+    current = backend.lookup_shard(user_id)
+    if current == shard:
+        return 0
+
+    source_pool = backend.shard_pools[current]
+    target_pool = backend.shard_pools[shard]
+    with source_pool.connection() as source, target_pool.connection() as target:
+        source.execute("BEGIN IMMEDIATE")
+        try:
+            target.execute("BEGIN IMMEDIATE")
+            try:
+                target.execute("DELETE FROM tasks WHERE user_id = ?", (user_id,))
+                target.execute("DELETE FROM tasks_archive WHERE user_id = ?", (user_id,))
+                target.execute("DELETE FROM categories WHERE user_id = ?", (user_id,))
+                # カテゴリのIDは移動先で振り直し、タスクの category_id も置き換える
+                category_ids = _copy_categories(source, target, user_id)
+                moved = _copy_rows(source, target, "tasks", MOVE_TASK_COLUMNS, user_id, category_ids)
+                moved += _copy_archive(source, target, user_id, category_ids)
+                # 移動先の世代番号を移動元より進め、移動前の読み取りキャッシュを使わせない
+                versions = source.execute(
+                    """
+                    SELECT IFNULL(MAX(version), 0), IFNULL(MAX(stats_version), 0),
+                           IFNULL(MAX(categories_version), 0)
+                    FROM user_versions WHERE user_id = ?
+                    """,
+                    (user_id,)
+                ).fetchone()
+                target.execute(
+                    """
+                    INSERT INTO user_versions (user_id, version, stats_version, categories_version)
+                    VALUES (?, ? + 1, ? + 1, ? + 1)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        version = MAX(version, excluded.version) + 1,
+                        stats_version = MAX(stats_version, excluded.stats_version) + 1,
+                        categories_version = MAX(categories_version, excluded.categories_version) + 1
+                    """,
+                    (user_id, *versions)
+                )
+                target.commit()
+            except Exception:
+                target.rollback()
+                raise
+
+            # 配置先を更新する（移動元がユーザー情報のデータベースなら同じトランザクションで）
+            upsert = (
+                "INSERT INTO user_shards (user_id, shard) VALUES (?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET shard = excluded.shard"
+            )
+            if source_pool is backend.directory_pool():
+                source.execute(upsert, (user_id, shard))
+            else:
+                with backend.directory_pool().connection() as directory:
+                    directory.execute(upsert, (user_id, shard))
+                    directory.commit()
+            backend.forget_route(user_id)
+
+            source.execute("DELETE FROM tasks WHERE user_id = ?", (user_id,))
+            source.execute("DELETE FROM tasks_archive WHERE user_id = ?", (user_id,))
+            source.execute("DELETE FROM categories WHERE user_id = ?", (user_id,))
+            source.commit()
+        except Exception:
+            source.rollback()
+            raise
+    return moved
+
+def purge_orphans(backend):
+    """配置先でないシャードに残っているユーザーのタスクを削除する
+
+    移動先の更新後、移動元の削除前に中断した移動の残りを片付ける。
+
+    Returns:
+        [(シャード番号, ユーザーID), ...] 削除した組み合わせ
+    """
+    purged = []
+    for index, pool in enumerate(backend.shard_pools):
+        with pool.connection() as conn:
+            user_ids = [
+                row[0] for row in conn.execute(
+                    """
+                    SELECT DISTINCT user_id FROM tasks UNION SELECT DISTINCT user_id FROM tasks_archive
+                    UNION SELECT DISTINCT user_id FROM categories
+                    """
+                )
+            ]
+            for user_id in user_ids:
+                if backend.lookup_shard(user_id) == index:
+                    continue
+                conn.execute("DELETE FROM tasks WHERE user_id = ?", (user_id,))
+                conn.execute("DELETE FROM tasks_archive WHERE user_id = ?", (user_id,))
+                conn.execute("DELETE FROM categories WHERE user_id = ?", (user_id,))
+                conn.commit()
+                purged.append((index, user_id))
+    return purged
+
+def rebalance_shards(backend, dry_run=False, progress=None):
+    """すべてのユーザーを置くべきシャード（target_shard()）へ移す
+
+    シャード数を変えた後や、シャード構成に切り替えた後に実行する。
+
+    Args:
+        backend: ShardedBackend
+        dry_run: True の場合は移動せず計画だけを返す
+        progress: ユーザーを1人移すごとに (user_id, 移動元, 移動先, 件数) で呼ばれる関数（省略可）
+
+    Returns:
+        [(user_id, 移動元, 移動先, 移したタスク数), ...]（dry_run のときタスク数は None）
+    """
+    with backend.directory_pool().connection() as conn:
+        placements = conn.execute(
+            """
+            SELECT users.id, IFNULL(user_shards.shard, 0) FROM users
+            LEFT JOIN user_shards ON user_shards.user_id = users.id
+            ORDER BY users.id
+            """
+        ).fetchall()
+
+    moves = []
+    for user_id, current in placements:
+        target = backend.target_shard(user_id)
+        if current == target:
+            continue
+        moved = None if dry_run else move_user(backend, user_id, target)
+        moves.append((user_id, current, target, moved))
+        if progress:
+            progress(user_id, current, target, moved)
+    return moves
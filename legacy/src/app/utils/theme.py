@@ -1,24 +1,24 @@
 import streamlit as st
 
-def switch_theme(mode: str):
-    """テーマを切り替えて反映する"""
-    config = {
-        'light': {
-            'primaryColor': '#FF4B4B',
-            'backgroundColor': '#FFFFFF',
-            'secondaryBackgroundColor': '#F0F2F6',
-            'textColor': '#31333F'
-        },
-        'dark': {
-            'primaryColor': '#FF6B6B',
-            'backgroundColor': '#1E1E1E',
-            'secondaryBackgroundColor': '#121212',
-            'textColor': '#FFFFFF'
-        }
+# テーマごとの配色
+THEME_CONFIG = {
+    'light': {
+        'primaryColor': '#FF4B4B',
+        'backgroundColor': '#FFFFFF',
+        'secondaryBackgroundColor': '#F0F2F6',
+        'textColor': '#31333F'
+    },
+    'dark': {
+        'primaryColor': '#FF6B6B',
+        'backgroundColor': '#1E1E1E',
+        'secondaryBackgroundColor': '#121212',
+        'textColor': '#FFFFFF'
     }
-    
-    selected = config[mode]
-    st.markdown(f"""
+}
+
+def build_theme_css(selected):
+    """配色からテーマ用のCSS（styleタグ）を組み立てる"""
+    return f"""
         <style>
         .stApp {{
             background-color: {selected['backgroundColor']};
@@ -61,4 +61,12 @@ def switch_theme(mode: str):
             color: {selected['textColor']};
         }}
         </style>
-    """, unsafe_allow_html=True)
+    """
+
+# テーマごとのCSSはモジュール読み込み時に一度だけ組み立てる
+THEME_CSS = {mode: build_theme_css(selected) for mode, selected in THEME_CONFIG.items()}
+
+def switch_theme(mode: str):
+    """テーマを切り替えて反映する"""
+    # CSSはリランごとに描画し直す必要があるため、組み立て済みの文字列を注入する
+    st.markdown(THEME_CSS[mode], unsafe_allow_html=True)
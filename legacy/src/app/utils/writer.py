@@ -0,0 +1,167 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# 書き込み専用スレッド（データベースごとに1つ）
+#
+# 各セッションの書き込みはキューに入れ、専用スレッドが持つ1本の接続でまとめて実行する。
+# 溜まっている書き込みは1つのトランザクションにまとめてコミットし（グループコミット）、
+# 1件ごとに SAVEPOINT を切るため、失敗した書き込みだけが取り消される。
+# 結果（または例外）はコミット後に Future で呼び出し元へ返す。
+# 書き込みのロックを取るのはこのスレッドだけになるため、セッション同士でロックを
+# 奪い合うことがなく、コミットの回数も減る。
+
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", "64"))  # 1回のコミットにまとめる最大件数
+WRITE_MAX_DELAY = float(os.environ.get("WRITE_MAX_DELAY", "0.002"))  # 後続の書き込みを待つ最大秒数
+WRITE_TIMEOUT = float(os.environ.get("WRITE_TIMEOUT", "30"))  # 書き込みが始まるのを呼び出し元が待つ最大秒数
+
+logger = logging.getLogger(__name__)
+
+class _WriteRequest:
+    __slots__ = ("func", "future", "queued_at")
+
+    def __init__(self, func):
+        self.func = func
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+# キューに入れると書き込みスレッドが終了する
+_STOP = object()
+
+class Writer(threading.Thread):
+    """1つのデータベースへの書き込みをまとめて実行するスレッド
+
+    Args:
+        connect: 書き込み用の接続を作る関数（スレッドの開始時に1回だけ呼ぶ）
+        name: スレッド名
+        batch_size: 1回のコミットにまとめる最大件数
+        max_delay: 最初の書き込みがキューに入ってから後続を待つ最大秒数
+    """
+
+    def __init__(self, connect, name="db-writer", batch_size=WRITE_BATCH_SIZE,
+                 max_delay=WRITE_MAX_DELAY):
+        super().__init__(name=name, daemon=True)
+        self.connect = connect
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.batches = 0   # コミットした回数
+        self.writes = 0    # 実行した書き込みの件数
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._conn = None
+
+    def submit(self, func):
+        """書き込みをキューに入れる
+
+        Args:
+            func: 接続を受け取って書き込みを行う関数（コミットはしないこと）
+
+        Returns:
+            func の戻り値をコミット後に受け取る Future
+        """
+        if self._closed:
+            raise RuntimeError("書き込みスレッドは既に停止しています")
+        request = _WriteRequest(func)
+        self._queue.put(request)
+        return request.future
+
+    def run(self):
+        try:
+            self._conn = self.connect()
+        except Exception as e:
+            logger.exception("書き込み用の接続を開けませんでした")
+            self._closed = True
+            self._fail_pending(e)
+            return
+        lingering = False
+        try:
+            while True:
+                request = self._queue.get()
+                if request is _STOP:
+                    break
+                batch, stopping = self._collect(request, lingering)
+                self._run_batch(batch)
+                # 複数の書き込みが同時に来ていたときだけ、次も後続を待ってまとめる
+                # （単独の書き込みには待ち時間を足さない）
+                lingering = len(batch) > 1
+                if stopping:
+                    break
+        finally:
+            self._conn.close()
+
+    def _collect(self, first, lingering):
+        """最初の書き込みに続けて、キューにある書き込みを batch_size 件まで集める"""
+        batch = [first]
+        deadline = first.queued_at + self.max_delay
+        while len(batch) < self.batch_size:
+            try:
+                remaining = deadline - time.monotonic()
+                if lingering and remaining > 0:
+                    request = self._queue.get(timeout=remaining)
+                else:
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is _STOP:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _run_batch(self, batch):
+        """集めた書き込みを1つのトランザクションで実行してコミットする"""
+        conn = self._conn
+        done = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for request in batch:
+                # 開始前に取り消された書き込みは実行しない
+                if not request.future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write_request")
+                try:
+                    result = request.func(conn)
+                except Exception as e:
+                    if not conn.in_transaction:
+                        # トランザクション全体が取り消された（ディスクフルなど）
+                        raise
+                    conn.execute("ROLLBACK TO write_request")
+                    conn.execute("RELEASE write_request")
+                    request.future.set_exception(e)
+                else:
+                    conn.execute("RELEASE write_request")
+                    done.append((request, result))
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        self.batches += 1
+        self.writes += len(done)
+        for request, result in done:
+            request.future.set_result(result)
+
+    def _fail_pending(self, error):
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if request is not _STOP and request.future.set_running_or_notify_cancel():
+                request.future.set_exception(error)
+
+    def stop(self):
+        """キューにある書き込みを済ませてからスレッドを止める"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        if self.is_alive():
+            self.join()
+        # 停止後に入ってしまった書き込みは失敗させる
+        self._fail_pending(RuntimeError("書き込みスレッドは既に停止しています"))